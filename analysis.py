@@ -0,0 +1,363 @@
+''' Batch analysis seeding for AVR binary views.
+
+Functions found here are all added before analysis runs, instead of being
+discovered one call at a time.
+'''
+from __future__ import print_function
+
+import weakref
+
+from binaryninja import BinaryDataNotification, Symbol, SymbolType, Type, log_warn
+
+from .arch import AVR
+from .avr import current_device
+from .avr.indirect import resolve
+from .avr.signatures import function_starts
+from .avr.vectors import vector_table, handler_names
+
+try:
+    from .avr.classify import data_regions, STRING
+    from .avr.progmem import progmem_objects, ProgmemHelpers
+except ImportError:
+    # The classifier needs numpy, which Binary Ninja does not always ship
+    data_regions = progmem_objects = None
+
+try:
+    from .avr.bulk import disassemble
+    from .avr.timing import CycleCounts
+    from .avr.xrefs import CodeXrefs, DataXrefs
+except ImportError:
+    CycleCounts = CodeXrefs = DataXrefs = None
+
+# First line of the comments written by annotate_cycles, replaced on rerun
+CYCLES_PREFIX = 'cycles: '
+
+# Key of the plugin's ViewState in a view's session data
+SESSION_KEY = 'binja_avr'
+
+
+
+class ViewState(object):
+    ''' What the plugin keeps for one open view, in its session data, and releases when the view closes '''
+
+    def __init__(self):
+        # Xref indexes by kind ('data' or 'code'), as [(flash start, DataXrefs or CodeXrefs)]
+        self.xrefs = {}
+        # The XrefUpdater registered on the view, once an index was built
+        self.xref_updater = None
+
+    def close(self):
+        # The view is gone, so the notification needs no unregistering
+        self.xrefs = {}
+        self.xref_updater = None
+
+
+def view_state(bv):
+    ''' The ViewState of a view, created on first use '''
+    state = bv.session_data.get(SESSION_KEY)
+    if state is None:
+        state = bv.session_data[SESSION_KEY] = ViewState()
+    return state
+
+
+# Close callbacks of the AVR views, by id of their ViewState
+_close_watchers = {}
+
+
+def watch_view(view):
+    ''' Release the view's ViewState once Binary Ninja frees the view.
+
+    view has to be the loader's own BinaryView instance, which lives exactly
+    as long as the view is open, not a wrapper handed to a plugin command.
+    '''
+    state = view_state(view)
+
+    def closed(reference):
+        _close_watchers.pop(id(state), None)
+        state.close()
+    _close_watchers[id(state)] = weakref.ref(view, closed)
+
+
+def executable_ranges(bv):
+    ''' (start, length) of the file-backed part of each executable segment '''
+    return [(segment.start, segment.data_length) for segment in bv.segments
+            if segment.executable and segment.data_length]
+
+
+def _in_regions(address, regions):
+    return any(region.start <= address < region.end for region in regions)
+
+
+def add_signature_functions(bv, excluded=()):
+    ''' Add a function at every avr-gcc prologue in flash outside the excluded regions; returns how many were new '''
+    added = 0
+    for start, length in executable_ranges(bv):
+        for address in function_starts(bv.read(start, length), start):
+            if _in_regions(address, excluded):
+                continue
+            if bv.get_function_at(address) is None:
+                bv.add_function(address)
+                added += 1
+    return added
+
+
+def mark_data_regions(bv):
+    ''' Define data variables over the parts of flash classified as data, so they are not disassembled.
+
+    The vector table and the entry point are always left as code. Returns
+    the regions marked; none without numpy.
+    '''
+    if data_regions is None:
+        return []
+    device = current_device()
+    vectors_end = len(device.vectors)*device.vector_size
+    marked = []
+    for start, length in executable_ranges(bv):
+        for region in data_regions(bv.read(start, length), start):
+            if region.start < vectors_end or region.start <= bv.entry_point < region.end:
+                continue
+            element = Type.char() if region.kind == STRING else Type.int(1, False)
+            bv.define_auto_data_var(region.start, Type.array(element, len(region)))
+            marked.append(region)
+    return marked
+
+
+def progmem_helpers(bv):
+    ''' {address: (argument register, kind)} of the avr-libc progmem helpers with a symbol in the view '''
+    helpers = {}
+    for name, argument in ProgmemHelpers.items():
+        symbol = bv.get_symbol_by_raw_name(name)
+        if symbol is not None:
+            helpers[symbol.address] = argument
+    return helpers
+
+
+def define_progmem_objects(bv, regions=None):
+    ''' Define the strings and byte arrays that lpm/elpm and progmem helper calls read from flash.
+
+    regions are the data regions marked beforehand, which bound the byte
+    arrays; flash is classified again without them. Returns the number of
+    data variables defined; none without numpy.
+    '''
+    if progmem_objects is None:
+        return 0
+    helpers = progmem_helpers(bv)
+    defined = 0
+    for start, length in executable_ranges(bv):
+        data = bv.read(start, length)
+        bounds = regions if regions is not None else data_regions(data, start)
+        for region in progmem_objects(data, start, helpers, bounds):
+            element = Type.char() if region.kind == STRING else Type.int(1, False)
+            bv.define_auto_data_var(region.start, Type.array(element, len(region)))
+            defined += 1
+    return defined
+
+
+def log_bad_opcodes():
+    ''' Log and reset the bad opcodes counted since the last summary '''
+    summary = AVR.bad_opcodes.summary()
+    if summary is not None:
+        log_warn('AVR: ' + summary)
+        AVR.bad_opcodes.clear()
+
+
+def add_vector_functions(bv):
+    ''' Name and add a function for every interrupt handler in the vector table '''
+    device = current_device()
+    vectors = vector_table(bv.read(0, len(device.vectors)*device.vector_size), 0, device)
+    for address, name in sorted(handler_names(vectors).items()):
+        if not bv.is_valid_offset(address):
+            continue
+        bv.define_auto_symbol(Symbol(SymbolType.FunctionSymbol, address, name))
+        bv.add_function(address)
+    return vectors
+
+
+def resolve_indirect_branches(bv):
+    ''' Resolve the targets of indirect jumps and calls in flash from how Z is built '''
+    resolved = []
+    for start, length in executable_ranges(bv):
+        resolved.extend(resolve(bv.read(start, length), start))
+
+    for indirect in resolved:
+        if indirect.helper is not None and bv.get_symbol_at(indirect.helper_address) is None:
+            bv.define_auto_symbol(Symbol(SymbolType.FunctionSymbol, indirect.helper_address, indirect.helper))
+        if indirect.call:
+            for target in indirect.targets:
+                if bv.get_function_at(target) is None:
+                    bv.add_function(target)
+    return resolved
+
+
+def apply_indirect_branches(bv, resolved):
+    ''' Set the resolved jump targets on the functions containing each jump.
+
+    A helper such as __tablejump2__ is reached by jmp, so its ijmp is part of
+    every function that jumps into it; each function gets the targets of
+    its own switches.
+    '''
+    branches = {}
+    for indirect in resolved:
+        if indirect.call:
+            continue
+        for function in bv.get_functions_containing(indirect.via if indirect.via is not None else indirect.address):
+            branches.setdefault((function, indirect.address), set()).update(indirect.targets)
+
+    for (function, address), targets in branches.items():
+        function.set_auto_indirect_branches(bv.arch, address, [(bv.arch, target) for target in sorted(targets)])
+    return len(branches)
+
+
+def _cycles_text(minimum, maximum, prefix=CYCLES_PREFIX):
+    if minimum is None:
+        return prefix + 'no return'
+    if maximum is None:
+        return prefix + '{} or more'.format(minimum)
+    if minimum == maximum:
+        return prefix + str(minimum)
+    return prefix + '{}-{}'.format(minimum, maximum)
+
+
+def _with_cycles(comment, text):
+    ''' The comment with its cycles line replaced by text '''
+    lines = [line for line in (comment or '').splitlines() if not line.startswith(CYCLES_PREFIX)]
+    return '\n'.join([text] + lines)
+
+
+def annotate_cycles(bv):
+    ''' Comment every basic block with its cycle count, and every interrupt handler with its cycles until reti.
+
+    Counts come from the timing tables of the selected device's core. Block
+    counts leave out called functions; handler counts follow every path and
+    include them. Returns the number of blocks annotated; none without numpy.
+    '''
+    if CycleCounts is None:
+        return 0
+    device = current_device()
+    counts = [(start, start + length, CycleCounts(disassemble(bv.read(start, length), start), device=device))
+              for start, length in executable_ranges(bv)]
+
+    annotated = 0
+    for start, end, cycles in counts:
+        for function in bv.functions:
+            blocks = [block for block in function.basic_blocks if start <= block.start < end]
+            if not blocks:
+                continue
+            minimum, maximum = cycles.ranges([block.start for block in blocks], [block.end for block in blocks])
+            for block, low, high in zip(blocks, minimum, maximum):
+                function.set_comment_at(block.start, _with_cycles(function.get_comment_at(block.start),
+                                                                  _cycles_text(int(low), int(high))))
+            annotated += len(blocks)
+
+    vectors = vector_table(bv.read(0, len(device.vectors)*device.vector_size), 0, device)
+    for address, name in handler_names(vectors).items():
+        function = bv.get_function_at(address)
+        for start, end, cycles in counts:
+            if function is not None and start <= address < end:
+                text = _cycles_text(*cycles.path(address), prefix=CYCLES_PREFIX + 'interrupt ')
+                unresolved = cycles.unresolved_calls(address)
+                if unresolved:
+                    text += ' (unresolved call{} {})'.format('s' if len(unresolved) > 1 else '', ', '.join(
+                        'to 0x{:x} at 0x{:x}'.format(target, call) for call, target in unresolved))
+                function.comment = _with_cycles(function.comment, text)
+    return annotated
+
+
+class XrefUpdater(BinaryDataNotification):
+    ''' Keeps the xref indexes of one view current as its bytes change '''
+
+    def __init__(self, state):
+        BinaryDataNotification.__init__(self)
+        self.state = state
+
+    def data_written(self, view, offset, length):
+        for indexes in list(self.state.xrefs.values()):
+            for start, xrefs in indexes:
+                end = start + xrefs.size
+                if offset < end and offset + length > start:
+                    xrefs.update(view.read(start, xrefs.size), max(offset, start), min(offset + length, end))
+
+    def data_inserted(self, view, offset, length):
+        # Everything after offset moved; the indexes are rebuilt on the next query
+        self.state.xrefs = {}
+
+    def data_removed(self, view, offset, length):
+        self.data_inserted(view, offset, length)
+
+
+def _xref_indexes(bv, kind, build):
+    ''' The view's xref indexes of a kind, built with build(data, start) on first use '''
+    state = view_state(bv)
+    indexes = state.xrefs.get(kind)
+    if indexes is None:
+        indexes = state.xrefs[kind] = [(start, build(bv.read(start, length), start))
+                                       for start, length in executable_ranges(bv)]
+        if state.xref_updater is None:
+            state.xref_updater = XrefUpdater(state)
+            bv.register_notification(state.xref_updater)
+    return indexes
+
+
+def data_xrefs(bv):
+    ''' The data xref indexes of the view's flash, built on first use; none without numpy '''
+    if DataXrefs is None:
+        return []
+    device = current_device()
+    return _xref_indexes(bv, 'data', lambda data, start: DataXrefs(data, start, device))
+
+
+def forget_data_xrefs(bv):
+    ''' Drop the view's data xref indexes, whose I/O addresses depend on the device '''
+    view_state(bv).xrefs.pop('data', None)
+
+
+def code_xrefs(bv):
+    ''' The code xref indexes of the view's flash, built on first use; none without numpy '''
+    if CodeXrefs is None:
+        return []
+    return _xref_indexes(bv, 'code', CodeXrefs)
+
+
+def register_references(bv, register, end=None):
+    ''' Sorted (instruction address, kind) of every in/out/sbi/cbi/sbic/sbis/lds/sts in flash
+    accessing a register name or data address, or the data addresses [register, end) '''
+    references = []
+    for start, xrefs in data_xrefs(bv):
+        references.extend(xrefs.references(register, end))
+    return sorted(references)
+
+
+def code_references(bv, address):
+    ''' Sorted (instruction address, kind) of every direct call, jump, branch and skip in flash reaching address '''
+    references = []
+    for start, xrefs in code_xrefs(bv):
+        references.extend(xrefs.references(address))
+    return sorted(references)
+
+
+def misaligned_targets(bv):
+    ''' Sorted (source, target, kind) of the direct references into the middle of an instruction of the linear sweep '''
+    misaligned = []
+    for start, xrefs in code_xrefs(bv):
+        misaligned.extend(xrefs.misaligned())
+    return sorted(misaligned)
+
+
+def add_call_target_functions(bv, excluded=()):
+    ''' Add a function at every target of a direct call in flash; returns how many were new.
+
+    Calls from the excluded regions, and calls into them or into the middle
+    of an instruction, are data decoded as code and are left out.
+    '''
+    added = 0
+    for start, xrefs in code_xrefs(bv):
+        misaligned = set(target for source, target, kind in xrefs.misaligned())
+        for target in xrefs.call_targets():
+            if target in misaligned or _in_regions(target, excluded) or not bv.is_valid_offset(target):
+                continue
+            if all(_in_regions(source, excluded) for source in xrefs.callers(target)):
+                continue
+            if bv.get_function_at(target) is None:
+                bv.add_function(target)
+                added += 1
+    return added
@@ -0,0 +1,201 @@
+from __future__ import print_function
+
+from binaryninja import (
+    Architecture, RegisterInfo, InstructionInfo,
+
+    InstructionTextToken, InstructionTextTokenType,
+
+    BranchType,
+
+    FlagRole)
+
+from .lifter import lift, flag_il, condition_il, FlagConditionFlags
+from .avr import (
+    BRANCH, CONDITIONAL, CALL, SKIP, RETURN, INDIRECT,
+
+    decode, invalid_opcode, BadOpcodeLog, TokenTables,
+
+    DecodeCache, NOT_CACHED,
+
+    current_device)
+
+# Core token type names to binaryninja token types
+TokenTypes = dict(
+    (name, getattr(InstructionTextTokenType, name))
+    for name in ('TextToken', 'RegisterToken', 'IntegerToken', 'PossibleAddressToken')
+)
+
+
+def make_token(token_type, text, value):
+    return InstructionTextToken(TokenTypes[token_type], text, value)
+
+
+class AVR(Architecture):
+    name = 'AVR'
+    address_size = 2
+    default_int_size = 2
+    max_instr_length = 4
+    regs = {
+        'r0': RegisterInfo('r0', 1),
+        'r1': RegisterInfo('r1', 1),
+        'r2': RegisterInfo('r2', 1),
+        'r3': RegisterInfo('r3', 1),
+        'r4': RegisterInfo('r4', 1),
+        'r5': RegisterInfo('r5', 1),
+        'r6': RegisterInfo('r6', 1),
+        'r7': RegisterInfo('r7', 1),
+        'r8': RegisterInfo('r8', 1),
+        'r9': RegisterInfo('r9', 1),
+        'r10': RegisterInfo('r10', 1),
+        'r11': RegisterInfo('r11', 1),
+        'r12': RegisterInfo('r12', 1),
+        'r13': RegisterInfo('r13', 1),
+        'r14': RegisterInfo('r14', 1),
+        'r15': RegisterInfo('r15', 1),
+        'r16': RegisterInfo('r16', 1),
+        'r17': RegisterInfo('r17', 1),
+        'r18': RegisterInfo('r18', 1),
+        'r19': RegisterInfo('r19', 1),
+        'r20': RegisterInfo('r20', 1),
+        'r21': RegisterInfo('r21', 1),
+        'r22': RegisterInfo('r22', 1),
+        'r23': RegisterInfo('r23', 1),
+        'r24': RegisterInfo('r24', 1),
+        'r25': RegisterInfo('r25', 1),
+        'r26': RegisterInfo('r26', 1),
+        'r27': RegisterInfo('r27', 1),
+        'r28': RegisterInfo('r28', 1),
+        'r29': RegisterInfo('r29', 1),
+        'r30': RegisterInfo('r30', 1),
+        'r31': RegisterInfo('r31', 1),
+        'SP': RegisterInfo('SP', 2)
+    }
+    stack_pointer = 'SP'
+    flags = ['C', 'Z', 'N', 'V', 'S', 'H', 'T', 'I']
+    flag_write_types =['', '*', 'onlyT', 'svnz', 'onlyC', 'onlyH', 'onlyI', 'onlyN', 'onlyS', 'onlyV', 'onlyZ', 'svnzc', 'hsvnzc', 'zc']
+    flags_written_by_flag_write_type = {
+        '*' : ['C', 'Z', 'N', 'V', 'S', 'H', 'T', 'I'],
+        'onlyT' : ['T'],
+        'svnz' : ['S', 'V', 'N', 'Z'],
+        'onlyC' : ['C'],
+        'onlyH' : ['H'],
+        'onlyI' : ['I'],
+        'onlyN' : ['N'],
+        'onlyS' : ['S'],
+        'onlyV' : ['V'],
+        'onlyZ' : ['Z'],
+        'svnzc' : ['S', 'V', 'N', 'Z', 'C'],
+        'hsvnzc' : ['H', 'S', 'V', 'N', 'Z', 'C'],
+        'zc' : ['Z', 'C']
+    }
+    flag_roles = {
+        'C': FlagRole.CarryFlagRole,
+        'Z': FlagRole.ZeroFlagRole,
+        'N': FlagRole.NegativeSignFlagRole,
+        'V': FlagRole.OverflowFlagRole,
+        'S': FlagRole.SpecialFlagRole, # N xor V, see lifter.flag_il
+        'H': FlagRole.SpecialFlagRole, # carry out of bit 3, see lifter.flag_il
+        'T': FlagRole.SpecialFlagRole, #TODO
+        'I': FlagRole.SpecialFlagRole #TODO
+    }
+    flags_required_for_flag_condition = FlagConditionFlags
+
+    # Shared by the info, text and IL callbacks, which Binary Ninja calls
+    # repeatedly for the same address
+    decode_cache = DecodeCache()
+
+    # Data decoded as code can hit thousands of invalid words; they are
+    # counted here and logged as a summary once analysis completes
+    bad_opcodes = BadOpcodeLog()
+
+    # InstructionTextTokens are only read by Binary Ninja, so one interned
+    # token can be returned from every call that renders the same operand
+    tokens = None
+
+    def decode_instruction(self, data, addr):
+        decoded = self.decode_cache.get(addr, data, NOT_CACHED)
+        if decoded is NOT_CACHED:
+            decoded = decode(data, addr)
+            if decoded is None:
+                instruction = invalid_opcode(data)
+                if instruction is not None:
+                    self.bad_opcodes.add(instruction, addr)
+                # Fewer bytes can decode differently (a truncated 32-bit
+                # instruction), so an invalid entry keeps all of them
+                self.decode_cache.put(addr, data[:self.max_instr_length], None)
+            elif decoded.flags & SKIP:
+                # The target of a skip depends on the length of the next
+                # instruction, so the entry keeps its first word too, and a
+                # skip decoded without it is not cached at all
+                if len(data) >= self.max_instr_length:
+                    self.decode_cache.put(addr, data[:self.max_instr_length], decoded)
+            else:
+                self.decode_cache.put(addr, data[:decoded.length], decoded)
+        return decoded
+
+
+    def text_tokens(self):
+        ''' Token tables for the selected device, rebuilt when the selection changes '''
+        tokens = AVR.tokens
+        if tokens is None or tokens.device is not current_device():
+            tokens = AVR.tokens = TokenTables(make_token)
+        return tokens
+
+
+    def perform_get_instruction_info(self, data, addr):
+        decoded = self.decode_instruction(data, addr)
+
+        if decoded is None:
+            return None
+
+        result = InstructionInfo()
+        result.length = decoded.length
+
+        flags = decoded.flags
+        if not flags & (BRANCH | CALL | SKIP | RETURN):
+            return result
+
+        if flags & RETURN:
+            result.add_branch(BranchType.FunctionReturn)
+        elif flags & CALL and flags & INDIRECT:
+            # icall/eicall return to the next instruction; the call is in the IL
+            pass
+        elif flags & INDIRECT:
+            result.add_branch(BranchType.IndirectBranch)
+        elif flags & CALL:
+            result.add_branch(BranchType.CallDestination, decoded.target)
+        elif flags & CONDITIONAL:
+            result.add_branch(BranchType.TrueBranch, decoded.target)
+            result.add_branch(BranchType.FalseBranch, addr + 1*2)
+        elif flags & BRANCH:
+            result.add_branch(BranchType.UnconditionalBranch, decoded.target)
+        elif flags & SKIP:
+            result.add_branch(BranchType.TrueBranch, decoded.target if decoded.target is not None else addr + 2*2)
+            result.add_branch(BranchType.FalseBranch, addr + 1*2)
+
+        return result
+
+
+    def perform_get_instruction_text(self, data, addr):
+        decoded = self.decode_instruction(data, addr)
+
+        if decoded is None:
+            return None
+
+        return self.text_tokens().tokens(decoded, addr), decoded.length
+
+    def perform_get_instruction_low_level_il(self, data, addr, il):
+        decoded = self.decode_instruction(data, addr)
+
+        if decoded is None:
+            return None
+
+        lift(il, decoded, addr)
+
+        return decoded.length
+
+    def perform_get_flag_write_low_level_il(self, op, size, write_type, flag, operands, il):
+        return flag_il(self, op, size, flag, operands, il)
+
+    def perform_get_flag_condition_low_level_il(self, cond, il):
+        return condition_il(cond, il)
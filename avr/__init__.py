@@ -0,0 +1,30 @@
+''' Headless AVR decoder core.
+
+Nothing in this package imports binaryninja, so it can be used from batch
+pipelines and worker processes. Add the plugin directory to sys.path and
+import avr. The vectorized avr.bulk module additionally requires numpy.
+'''
+from __future__ import print_function
+
+__version__ = '0.1d'
+
+from .opcodes import (
+    REGISTER, IOREGISTER, ADDRESS, INDIR_ADDR, IMMEDIATE, T, DES, REL_ADDR,
+    DISPLACEMENT, DATA_ADDR,
+
+    BRANCH, CONDITIONAL, CALL, SKIP, RETURN, INDIRECT, LONG,
+
+    Registers, IndirectOperands,
+
+    Opcode, Opcodes, OpcodeTable, DecodedInstruction)
+
+from .decoder import decode, invalid_opcode, BadOpcodeLog
+
+from .text import TokenTables, instruction_tokens, instruction_text
+
+from .cache import DecodeCache, NOT_CACHED
+
+from .devices import (
+    DEFAULT_DEVICE, Device, DeviceError,
+
+    available_devices, load_device, select_device, current_device)
@@ -0,0 +1,267 @@
+''' Headless batch analysis of many firmware images with a result cache.
+
+    python -m avr.batch --jobs 8 release/*.hex release/*.elf
+
+Each image is disassembled and analyzed (function starts, xrefs and
+statistics) in a process pool. Results are stored as JSON in a cache keyed
+by the SHA-256 of the file, the analysis version, a fingerprint of the
+decoder and the device, so images
+already analyzed are answered from the cache without being parsed again,
+and identical images given twice are only analyzed once.
+'''
+from __future__ import print_function
+
+import argparse
+import binascii
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from . import __version__
+from .devices import DEFAULT_DEVICE, load_device, select_device
+from .decoder import decoder_fingerprint
+from .disasm import sweep, format_instruction
+from .elf import is_avr_elf, read_elf
+from .ihex import is_ihex, read_ihex, flatten
+from .indirect import resolve
+from .memory import FLASH, address_space
+from .opcodes import BRANCH, CONDITIONAL, CALL, SKIP
+from .signatures import function_starts
+from .vectors import vector_table, handler_names
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'binja-avr')
+
+HASH_BLOCK_SIZE = 1 << 20
+
+# Bump when analyze_image gives different results or a different layout;
+# decoder changes are caught by the decoder fingerprint instead
+ANALYSIS_VERSION = 2
+
+
+def file_digest(path):
+    ''' SHA-256 of a file's contents '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _contents(path):
+    with open(path, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            return b''
+
+
+def flash_image(path):
+    ''' Return (base address, image) of the flash contents of an ELF, Intel HEX or raw binary file '''
+    contents = _contents(path)
+
+    if is_avr_elf(contents[:20]):
+        # Initialized data is stored in flash at its load address
+        segments = [(segment.paddr, bytearray(contents[segment.offset:segment.offset + segment.filesz]))
+                    for segment in read_elf(contents).segments
+                    if segment.filesz and address_space(segment.paddr) == FLASH]
+        return flatten(sorted(segments, key=lambda segment: segment[0]))
+
+    if path.lower().endswith(('.hex', '.ihx')) or is_ihex(contents[:16]):
+        return flatten([segment for segment in read_ihex(contents) if address_space(segment[0]) == FLASH])
+
+    return 0, contents
+
+
+def xref_kind(flags):
+    if flags & CALL:
+        return 'call'
+    if flags & CONDITIONAL or flags & SKIP:
+        return 'branch'
+    return 'jump'
+
+
+def analyze_image(base, image, device):
+    ''' Disassembly, function starts, xrefs and statistics of one flash image, as a JSON-able dict '''
+    disassembly = []
+    xrefs = []
+    calls = set()
+    mnemonics = Counter()
+    invalid = 0
+
+    for offset, length, decoded in sweep(image, 0, None, base):
+        disassembly.append(format_instruction(image, offset, length, decoded, base, False))
+        if decoded is None:
+            invalid += 1
+            continue
+        mnemonics[decoded.name] += 1
+        if decoded.target is not None and decoded.flags & (BRANCH | CALL | SKIP):
+            xrefs.append([base + offset, decoded.target, xref_kind(decoded.flags)])
+            if decoded.flags & CALL:
+                calls.add(decoded.target)
+
+    for indirect in resolve(image, base):
+        kind = 'call' if indirect.call else 'jump'
+        for target in indirect.targets:
+            xrefs.append([indirect.address, target, kind])
+            if indirect.call:
+                calls.add(target)
+
+    handlers = handler_names(vector_table(image[:len(device.vectors)*device.vector_size], base, device)) if base == 0 else {}
+    functions = sorted(set(function_starts(image, base)) | set(handlers) | calls)
+
+    return {
+        'base': base,
+        'size': len(image),
+        'disassembly': disassembly,
+        'functions': functions,
+        'vectors': sorted([address, name] for address, name in handlers.items()),
+        'xrefs': sorted(xrefs),
+        'stats': {
+            'instructions': sum(mnemonics.values()),
+            'invalid': invalid,
+            'functions': len(functions),
+            'xrefs': len(xrefs),
+            'mnemonics': dict(mnemonics)
+        }
+    }
+
+
+class ResultCache(object):
+    ''' Directory of analysis results, one JSON file per (file hash, analysis version and decoder, device) '''
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.directory = directory
+        self.key = 'v{}-{}'.format(ANALYSIS_VERSION, binascii.hexlify(decoder_fingerprint()[:8]).decode('ascii'))
+
+    def path(self, digest, device):
+        return os.path.join(self.directory, self.key, device, digest + '.json')
+
+    def get(self, digest, device):
+        try:
+            with open(self.path(digest, device)) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def put(self, digest, device, result):
+        path = self.path(digest, device)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+        # Written to a temporary file first, so concurrent batches never
+        # read a partial result
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(result, f, sort_keys=True, separators=(',', ':'))
+        os.rename(temporary, path)
+
+
+def _error_text(error):
+    return '{}: {}'.format(type(error).__name__, error)
+
+
+def _analyze_task(task):
+    ''' Worker: analyze one file and store its result in the cache.
+
+    Returns (digest, stats, seconds, error); a file that cannot be read or
+    parsed gives stats None and the error text, so the rest of the batch
+    goes on.
+    '''
+    path, digest, device_name, cache_directory = task
+    started = time.time()
+    try:
+        device = select_device(device_name)
+        base, image = flash_image(path)
+        result = analyze_image(base, image, device)
+        result['sha256'] = digest
+        result['version'] = __version__
+        result['analysis_version'] = ANALYSIS_VERSION
+        result['device'] = device.name
+        ResultCache(cache_directory).put(digest, device.name, result)
+    except Exception as e:
+        return digest, None, time.time() - started, _error_text(e)
+    return digest, result['stats'], time.time() - started, None
+
+
+def analyze_files(paths, device=DEFAULT_DEVICE, cache_directory=DEFAULT_CACHE_DIR, jobs=None):
+    ''' Yield (path, digest, stats, cached, seconds, error) for every file, analyzing those not in the cache.
+
+    Cached files are reported first, without waiting for the pool; the rest
+    are reported as their workers finish. A file that fails is reported with
+    stats None and the error text (and digest None when it cannot be read).
+    '''
+    # Fails on an unknown device before any work is started
+    device = load_device(device).name
+    cache = ResultCache(cache_directory)
+    pending = {}
+
+    for path in paths:
+        try:
+            digest = file_digest(path)
+        except (IOError, OSError) as e:
+            yield path, None, None, False, 0.0, _error_text(e)
+            continue
+        result = cache.get(digest, device)
+        if result is not None:
+            yield path, digest, result['stats'], True, 0.0, None
+        else:
+            pending.setdefault(digest, []).append(path)
+
+    if not pending:
+        return
+
+    tasks = [(paths_for_digest[0], digest, device, cache_directory) for digest, paths_for_digest in pending.items()]
+    if jobs == 1 or len(tasks) == 1:
+        results = (_analyze_task(task) for task in tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(min(jobs or multiprocessing.cpu_count(), len(tasks)))
+        results = pool.imap_unordered(_analyze_task, tasks)
+
+    try:
+        for digest, stats, seconds, error in results:
+            for path in pending[digest]:
+                yield path, digest, stats, False, seconds, error
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyze many AVR firmware images, reusing cached results')
+    parser.add_argument('filenames', nargs='+', help='ELF, Intel HEX or raw firmware images')
+    parser.add_argument('--device', default=DEFAULT_DEVICE, help='MCU profile (default: {})'.format(DEFAULT_DEVICE))
+    parser.add_argument('--cache', default=DEFAULT_CACHE_DIR, help='result cache directory (default: {})'.format(DEFAULT_CACHE_DIR))
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help='number of worker processes')
+    parser.add_argument('--json', action='store_true', help='write one JSON summary per image')
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for path, digest, stats, cached, seconds, error in analyze_files(args.filenames, args.device, args.cache, args.jobs):
+        failed += error is not None
+        if args.json:
+            print(json.dumps({'path': path, 'sha256': digest, 'cached': cached, 'seconds': seconds,
+                              'result': ResultCache(args.cache).path(digest, args.device.lower()) if error is None else None,
+                              'stats': stats, 'error': error}, sort_keys=True))
+        elif error is not None:
+            print('{}: {}'.format(path, error), file=sys.stderr)
+        else:
+            print('{}  {}  {:6d} instructions  {:4d} functions  {}'.format(
+                digest[:12], 'cached' if cached else '{:5.2f}s'.format(seconds),
+                stats['instructions'], stats['functions'], path))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+''' Vectorized linear-sweep disassembly of whole flash images.
+
+Requires numpy. Every 16-bit word of the image is classified through the
+opcode table at once; the operand extractors in opcodes.py are plain integer
+arithmetic, so they are applied to whole arrays of instruction words.
+'''
+from __future__ import print_function
+
+import numpy as np
+
+from .opcodes import Opcodes, OpcodeTable, ADDRESS, REL_ADDR, SKIP
+
+NO_TARGET = -1
+
+
+def _extractor_table(opcodes, operand):
+    ''' Map opcode IDs to indexes into a list of distinct operand extractors '''
+    extractors = []
+    index = np.full(len(opcodes), -1, dtype=np.int16)
+    for opcode in opcodes[1:]:
+        extractor = getattr(opcode, operand)
+        if extractor is None:
+            continue
+        if extractor not in extractors:
+            extractors.append(extractor)
+        index[opcode.id] = extractors.index(extractor)
+    return extractors, index
+
+
+class _Tables(object):
+    ''' numpy views of the opcode tables, built on first use '''
+    _instance = None
+
+    def __init__(self):
+        self.ids = np.array([opcode.id if opcode is not None else 0 for opcode in OpcodeTable], dtype=np.uint8)
+        self.lengths = np.array([2] + [opcode.length for opcode in Opcodes[1:]], dtype=np.uint8)
+        self.flags = np.array([0] + [opcode.flags for opcode in Opcodes[1:]], dtype=np.uint8)
+        self.dst_types = np.array([-1] + [opcode.dst_operand_type if opcode.dst_operand_type is not None else -1 for opcode in Opcodes[1:]], dtype=np.int8)
+        self.src_types = np.array([-1] + [opcode.src_operand_type if opcode.src_operand_type is not None else -1 for opcode in Opcodes[1:]], dtype=np.int8)
+        self.dst_extractors, self.dst_index = _extractor_table(Opcodes, 'dst')
+        self.src_extractors, self.src_index = _extractor_table(Opcodes, 'src')
+
+    @classmethod
+    def get(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+
+class BulkDisassembly(object):
+    ''' Struct-of-arrays result of disassemble(); row i describes one instruction.
+
+    dst and src hold the numeric operand fields (0 when the opcode has no such
+    operand) and targets the absolute byte address of direct branches and
+    calls, or of the instruction after the one a skip instruction skips
+    (NO_TARGET otherwise).
+    '''
+
+    def __init__(self, base, offsets, ids, lengths, flags, dst, src, targets):
+        self.base = base
+        self.offsets = offsets
+        self.ids = ids
+        self.lengths = lengths
+        self.flags = flags
+        self.dst = dst
+        self.src = src
+        self.targets = targets
+
+    @property
+    def addresses(self):
+        return self.offsets + self.base
+
+    @property
+    def valid(self):
+        return self.ids != 0
+
+    def names(self):
+        return [Opcodes[i].name if i else None for i in self.ids]
+
+    def __len__(self):
+        return len(self.offsets)
+
+
+def _extract(ids, instructions, extractors, index):
+    values = np.zeros(len(ids), dtype=np.int64)
+    extractor_ids = index[ids]
+    for i, extractor in enumerate(extractors):
+        selected = extractor_ids == i
+        if selected.any():
+            values[selected] = extractor(instructions[selected])
+    return values
+
+
+def disassemble(data, base=0):
+    ''' Linear-sweep disassemble a flash image given as bytes, bytearray, memoryview or mmap.
+
+    Invalid words are reported with opcode ID 0 and length 2. A 32-bit
+    instruction truncated by the end of the image is reported as invalid.
+    '''
+    tables = _Tables.get()
+
+    words = np.frombuffer(data, dtype='<u2', count=len(data)//2).astype(np.int64)
+    count = len(words)
+
+    word_ids = tables.ids[words]
+    is_long = tables.lengths[word_ids] == 4
+
+    # A word is the second half of a 32-bit instruction when the previous
+    # word starts a 32-bit instruction. Inside a run of words that all decode
+    # as 32-bit instructions, starts alternate from the first word of the run.
+    index = np.arange(count)
+    last_short = np.maximum.accumulate(np.where(is_long, -1, index))
+    run_start = np.zeros(count, dtype=np.int64)
+    run_start[1:] = last_short[:-1] + 1
+    is_second = np.zeros(count, dtype=bool)
+    is_second[1:] = is_long[:-1] & ((index[:-1] - run_start[1:]) % 2 == 0)
+
+    starts = np.flatnonzero(~is_second)
+    ids = word_ids[starts]
+    lengths = tables.lengths[ids]
+
+    long_starts = lengths == 4
+    truncated = long_starts & (starts + 1 >= count)
+    ids[truncated] = 0
+    lengths[truncated] = 2
+    long_starts &= ~truncated
+
+    instructions = words[starts]
+    instructions[long_starts] += words[starts[long_starts] + 1] << 16
+
+    dst = _extract(ids, instructions, tables.dst_extractors, tables.dst_index)
+    src = _extract(ids, instructions, tables.src_extractors, tables.src_index)
+
+    offsets = starts * 2
+    dst_types = tables.dst_types[ids]
+    targets = np.full(len(ids), NO_TARGET, dtype=np.int64)
+    relative = dst_types == REL_ADDR
+    targets[relative] = base + offsets[relative] + dst[relative]*2 + 1*2
+    absolute = dst_types == ADDRESS
+    targets[absolute] = dst[absolute]*2
+
+    flags = tables.flags[ids]
+    skips = np.flatnonzero((flags & SKIP != 0) & (starts + 1 < count))
+    targets[skips] = base + offsets[skips] + 1*2 + tables.lengths[word_ids[starts[skips] + 1]]
+
+    return BulkDisassembly(base, offsets, ids, lengths, flags, dst, src, targets)
@@ -0,0 +1,87 @@
+''' Bounded cache of decoded instructions shared by the architecture callbacks.
+
+Binary Ninja runs the callbacks from several analysis threads at once. A
+hit has to be cheaper than decoding again, so lookups are plain dict reads
+with no lock: under the GIL a dict get or set is never seen half done.
+Entries are keyed by address and keep the bytes they were decoded from.
+
+Eviction is coarse: entries go into the current generation, and when it
+holds more than size entries it becomes the previous one and the one before
+is dropped. size is therefore the size of a generation: the last size
+entries stored are always kept, and up to twice that are held. A hit in
+the previous generation moves the entry back into the current one, so
+addresses still in use survive, much like an LRU with two steps of recency.
+Only the generation swap takes the lock.
+'''
+import threading
+
+DECODE_CACHE_SIZE = 4096
+
+# Returned by DecodeCache.get on a miss, so None can be cached for bad opcodes
+NOT_CACHED = object()
+
+
+class DecodeCache(object):
+    ''' Cache of decoded instructions, keyed on address and checked against the opcode bytes.
+
+    hits and misses are counted without a lock, so they can drift slightly
+    under concurrent use.
+    '''
+
+    def __init__(self, size=DECODE_CACHE_SIZE):
+        self._lock = threading.Lock()
+        self.resize(size)
+
+    def get(self, addr, data, default=None):
+        ''' The value stored for addr when it was decoded from the start of data, else default '''
+        entry = self._current.get(addr)
+        if entry is None:
+            entry = self._previous.get(addr)
+            if entry is None or not data.startswith(entry[0]):
+                self.misses += 1
+                return default
+            self._store(addr, entry)
+        elif not data.startswith(entry[0]):
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry[1]
+
+    def put(self, addr, data, value):
+        ''' Store value as decoded from data at addr; later lookups hit when their bytes start with data '''
+        if self._generation_size > 0:
+            self._store(addr, (bytes(data), value))
+
+    def _store(self, addr, entry):
+        current = self._current
+        current[addr] = entry
+        if len(current) > self._generation_size:
+            with self._lock:
+                if current is self._current:
+                    self._previous = current
+                    self._current = {}
+
+    def resize(self, size):
+        ''' Set the entries per generation and empty the cache; up to twice size are held, 0 disables it '''
+        self.size = size
+        self._generation_size = max(size, 0)
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._current = {}
+            self._previous = {}
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+    def __len__(self):
+        current = self._current
+        return len(current) + sum(1 for addr in self._previous if addr not in current)
@@ -0,0 +1,141 @@
+''' Vectorized code/data classification of whole flash images.
+
+Requires numpy. The image is cut into BLOCK_SIZE byte blocks and each block
+is scored at once from
+
+ * the share of invalid opcodes in a linear sweep, which unlike a count
+   over all words ignores the operand words of 32-bit instructions,
+ * erased flash (0xffff words),
+ * printable ASCII and NUL bytes, as in progmem strings,
+ * byte entropy, which is low for padding and small lookup tables,
+ * whether Z is loaded with the block's address by an ldi r30/ldi r31 pair,
+   the usual way an lpm table or string is addressed.
+
+Consecutive blocks of the same kind are merged into regions. Blocks reached
+by branches or calls are the analyzer's business; this only keeps obvious
+data out of the instruction stream.
+'''
+from __future__ import print_function
+
+import numpy as np
+
+from .bulk import disassemble
+
+BLOCK_SIZE = 32
+
+CODE = 'code'
+DATA = 'data'
+STRING = 'string'
+ERASED = 'erased'
+
+# Share of invalid words above which a block is data; avr-gcc code has
+# none, so with the default block size one is enough
+INVALID_LIMIT = 0.05
+# Share of printable or NUL bytes above which a block is a string
+STRING_LIMIT = 0.9
+# Byte entropy in bits below which a block is data
+ENTROPY_LIMIT = 2.0
+# With an lpm reference, these lower limits already make a block data
+REFERENCED_INVALID_LIMIT = 0.0
+REFERENCED_STRING_LIMIT = 0.7
+
+
+class Region(object):
+    __slots__ = ('start', 'end', 'kind')
+
+    def __init__(self, start, end, kind):
+        self.start = start
+        self.end = end
+        self.kind = kind
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return '<Region {} 0x{:x}-0x{:x}>'.format(self.kind, self.start, self.end)
+
+
+def _z_references(words, base):
+    ''' Byte addresses loaded into Z by adjacent ldi r30, lo / ldi r31, hi pairs (in either order) '''
+    is_ldi = (words & 0xf000) == 0xe000
+    register = 16 + ((words >> 4) & 0x0f)
+    value = ((words >> 4) & 0xf0) | (words & 0x0f)
+    low = is_ldi & (register == 30)
+    high = is_ldi & (register == 31)
+
+    references = []
+    for first, second in ((low, high), (high, low)):
+        pairs = np.flatnonzero(first[:-1] & second[1:])
+        lo = np.where(low[pairs], value[pairs], value[pairs + 1])
+        hi = np.where(high[pairs], value[pairs], value[pairs + 1])
+        references.append(lo | hi << 8)
+    return np.concatenate(references) - base
+
+
+def classify_blocks(data, base=0, block_size=BLOCK_SIZE):
+    ''' Kind of every block_size byte block of a flash image, as a list of strings '''
+    if block_size % 2:
+        raise ValueError('block size must be even')
+    size = len(data) - len(data) % block_size
+    count = size // block_size
+    if count == 0:
+        return []
+    raw = np.frombuffer(data, dtype=np.uint8, count=size)
+    words = np.frombuffer(data, dtype='<u2', count=size // 2).astype(np.int64)
+
+    per_block = block_size // 2
+    sweep = disassemble(data[:size], base)
+    invalid = np.bincount(sweep.offsets[sweep.ids == 0] // block_size, minlength=count) / float(per_block)
+    erased = (words == 0xffff).reshape(count, per_block).mean(axis=1)
+    printable = (((raw >= 0x20) & (raw < 0x7f)) | (raw == 0) | (raw == 0x0a) | (raw == 0x0d)).reshape(count, block_size).mean(axis=1)
+
+    # Entropy from per-block byte histograms
+    blocks = raw.reshape(count, block_size)
+    histogram = np.zeros((count, 256), dtype=np.int32)
+    np.add.at(histogram, (np.repeat(np.arange(count), block_size), blocks.ravel()), 1)
+    p = histogram / float(block_size)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entropy = -np.nansum(np.where(p > 0, p * np.log2(p), 0.0), axis=1)
+
+    referenced = np.zeros(count, dtype=bool)
+    offsets = _z_references(words, base)
+    offsets = offsets[(offsets >= 0) & (offsets < size)]
+    referenced[offsets // block_size] = True
+
+    kinds = np.full(count, CODE, dtype=object)
+    data_blocks = ((invalid > INVALID_LIMIT) | (entropy < ENTROPY_LIMIT) |
+                   (referenced & (invalid > REFERENCED_INVALID_LIMIT)))
+    strings = (printable >= STRING_LIMIT) | (referenced & (printable >= REFERENCED_STRING_LIMIT))
+    kinds[data_blocks] = DATA
+    kinds[strings] = STRING
+    kinds[erased >= 0.5] = ERASED
+
+    # A lone code block between data blocks is data that happened to decode
+    lone = np.flatnonzero((kinds[1:-1] == CODE) & (kinds[:-2] != CODE) & (kinds[2:] != CODE)) + 1
+    kinds[lone] = np.where(kinds[lone - 1] == kinds[lone + 1], kinds[lone - 1], DATA)
+    return list(kinds)
+
+
+def classify(data, base=0, block_size=BLOCK_SIZE):
+    ''' Merge classify_blocks() into Regions covering the whole image '''
+    regions = []
+    for i, kind in enumerate(classify_blocks(data, base, block_size)):
+        start = base + i*block_size
+        if regions and regions[-1].kind == kind:
+            regions[-1].end = start + block_size
+        else:
+            regions.append(Region(start, start + block_size, kind))
+
+    tail = len(data) % block_size
+    if tail:
+        end = base + len(data)
+        if regions:
+            regions[-1].end = end
+        else:
+            regions.append(Region(base, end, CODE))
+    return regions
+
+
+def data_regions(data, base=0, block_size=BLOCK_SIZE):
+    ''' The regions that are not code '''
+    return [region for region in classify(data, base, block_size) if region.kind != CODE]
@@ -0,0 +1,113 @@
+''' Decode single AVR instructions from raw bytes. '''
+from __future__ import print_function
+
+import hashlib
+import struct
+import threading
+from collections import Counter
+
+from .opcodes import SKIP, Opcodes, OpcodeTable, DecodedInstruction, SameRegisterAliases
+
+_fingerprint = None
+
+
+def decode(data, addr):
+    ''' Decode the instruction at the start of data, located at byte address addr.
+
+    Returns a DecodedInstruction, or None when the opcode is invalid or the
+    data is too short for the instruction. The target of a skip instruction
+    is the address after the instruction it skips, which needs the following
+    word in data; it is None without it.
+    '''
+    if len(data) < 2:
+        return None
+
+    instruction = struct.unpack('<H', data[0:2])[0]
+
+    opcode = OpcodeTable[instruction]
+
+    if opcode is None:
+        return None
+
+    if opcode.length == 4:
+        if len(data) < 4:
+            return None
+        instruction += struct.unpack('<H', data[2:4])[0] << 16
+
+    decoded = DecodedInstruction(opcode, instruction, addr)
+
+    if opcode.flags & SKIP and len(data) >= 4:
+        skipped = OpcodeTable[struct.unpack('<H', data[2:4])[0]]
+        decoded.target = addr + 1*2 + (skipped.length if skipped is not None else 2)
+
+    return decoded
+
+
+def decoder_fingerprint():
+    ''' SHA-256 over the opcode table and the operands decoded from sample words of every opcode.
+
+    Changes whenever the decoder would give different results, so results
+    stored from an earlier decoder can be told apart without relying on a
+    hand-bumped version.
+    '''
+    global _fingerprint
+    if _fingerprint is None:
+        description = [SameRegisterAliases]
+        for opcode in Opcodes[1:]:
+            description.append((opcode.id, opcode.name, opcode.encoding, opcode.length, opcode.flags,
+                                opcode.dst_operand_type, opcode.src_operand_type))
+            # Operand bits all clear and all set, at an address where
+            # relative targets are not clipped
+            for operand_bits in (0, ~opcode.mask & 0xffff):
+                decoded = decode(struct.pack('<HH', opcode.match | operand_bits, 0xffff), 0x1000)
+                description.append(None if decoded is None else
+                                   (decoded.id, decoded.dst, decoded.src, decoded.target))
+        _fingerprint = hashlib.sha256(repr(description).encode('ascii')).digest()
+    return _fingerprint
+
+
+def invalid_opcode(data):
+    ''' Return the instruction word at the start of data if it is not a valid opcode, else None '''
+    if len(data) < 2:
+        return None
+    instruction = struct.unpack('<H', data[0:2])[0]
+    if OpcodeTable[instruction] is None:
+        return instruction
+    return None
+
+
+class BadOpcodeLog(object):
+    ''' Counts invalid instruction words, to be reported as one summary instead of a line per word '''
+
+    def __init__(self):
+        self.words = Counter()
+        self.first_address = {}
+        # Only taken for invalid words, which are off the fast path
+        self._lock = threading.Lock()
+
+    def add(self, instruction, addr):
+        with self._lock:
+            self.words[instruction] += 1
+            self.first_address.setdefault(instruction, addr)
+
+    def __len__(self):
+        with self._lock:
+            return sum(self.words.values())
+
+    def summary(self, most_common=8):
+        ''' One line describing the bad opcodes seen so far, or None '''
+        # Copied under the lock, so analysis threads can keep adding while
+        # the copy is sorted and formatted
+        with self._lock:
+            words = Counter(self.words)
+            first_address = dict(self.first_address)
+        if not words:
+            return None
+        examples = ', '.join('{:04x} x{} (first at 0x{:x})'.format(word, count, first_address[word])
+                             for word, count in words.most_common(most_common))
+        return '{} bad opcode(s), {} distinct: {}'.format(sum(words.values()), len(words), examples)
+
+    def clear(self):
+        with self._lock:
+            self.words.clear()
+            self.first_address.clear()
@@ -0,0 +1,125 @@
+''' Per-MCU device profiles: I/O register and bit names, vectors and memory sizes.
+
+Each device is one compact JSON file in this directory, generated from the
+Atmel ATDF device files by generate.py. Nothing is read at import; a profile
+is parsed the first time its device is loaded, so the number of available
+devices does not affect startup.
+'''
+from __future__ import print_function
+
+import json
+import os
+
+DEFAULT_DEVICE = 'atmega328p'
+
+PROFILE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_SUFFIX = '.json'
+
+# I/O registers reachable by in/out
+IO_SIZE = 0x40
+
+
+class DeviceError(ValueError):
+    pass
+
+
+class Device(object):
+    ''' Register, vector and memory layout of one MCU.
+
+    register_names maps data space addresses to register names and io_names
+    maps in/out I/O addresses to them; both hold None for unnamed addresses.
+    '''
+
+    def __init__(self, profile):
+        self.name = profile['name']
+        self.architecture = profile['architecture']
+        self.flash_size = profile['flash_size']
+        self.sram_start = profile['sram_start']
+        self.sram_size = profile['sram_size']
+        self.eeprom_size = profile['eeprom_size']
+        # Data space address of I/O register 0
+        self.io_base = profile['io_base']
+        # Bytes per vector table entry: 4 for jmp, 2 for rjmp
+        self.vector_size = profile['vector_size']
+        self.vectors = profile['vectors']
+
+        registers = profile['registers']
+        size = max([self.io_base + IO_SIZE] + [register[0] + 1 for register in registers])
+        self.register_names = [None] * size
+        self.bit_names = {}
+        for register in registers:
+            self.register_names[register[0]] = register[1]
+            if len(register) > 2:
+                self.bit_names[register[0]] = register[2]
+
+        self.io_names = self.register_names[self.io_base:self.io_base + IO_SIZE]
+        self._addresses = None
+
+    def register_name(self, address):
+        ''' Name of the register at a data space address, or None '''
+        if 0 <= address < len(self.register_names):
+            return self.register_names[address]
+        return None
+
+    def io_name(self, address):
+        ''' Name of the register at an in/out I/O address, or None '''
+        return self.register_name(self.io_base + address)
+
+    def bit_name(self, address, bit):
+        ''' Name of a bit of the register at a data space address, or None '''
+        bits = self.bit_names.get(address)
+        if bits is None or bit >= len(bits):
+            return None
+        return bits[bit]
+
+    def register_address(self, name):
+        ''' Data space address of a named register, or None '''
+        if self._addresses is None:
+            self._addresses = dict((register, address) for address, register in enumerate(self.register_names) if register is not None)
+        return self._addresses.get(name)
+
+    def vector_name(self, number):
+        ''' Name of an interrupt vector, or None for reserved vectors '''
+        if 0 <= number < len(self.vectors):
+            return self.vectors[number]
+        return None
+
+    def __repr__(self):
+        return '<Device {}>'.format(self.name)
+
+
+_loaded = {}
+_selected = None
+
+
+def available_devices():
+    ''' Names of the devices with a profile, without reading them '''
+    return sorted(filename[:-len(PROFILE_SUFFIX)] for filename in os.listdir(PROFILE_DIR)
+                  if filename.endswith(PROFILE_SUFFIX))
+
+
+def load_device(name):
+    ''' Return the Device for an MCU name such as atmega2560, reading its profile on first use '''
+    name = name.lower()
+    device = _loaded.get(name)
+    if device is None:
+        path = os.path.join(PROFILE_DIR, name + PROFILE_SUFFIX)
+        if not os.path.isfile(path):
+            raise DeviceError('no profile for device {}'.format(name))
+        with open(path) as f:
+            device = _loaded[name] = Device(json.load(f))
+    return device
+
+
+def select_device(name):
+    ''' Make name the device used for register names and vector tables '''
+    global _selected
+    _selected = load_device(name)
+    return _selected
+
+
+def current_device():
+    ''' The selected Device, DEFAULT_DEVICE unless select_device() was called '''
+    if _selected is None:
+        return select_device(DEFAULT_DEVICE)
+    return _selected
@@ -0,0 +1,127 @@
+''' Generate device profiles from Atmel ATDF device files.
+
+    python -m avr.devices.generate ATmega328P.atdf ATmega2560.atdf ...
+
+The ATDF files ship with the Atmel/Microchip device packs. Each one becomes
+<device>.json in this directory (or --output), in the format read by
+avr.devices.Device.
+'''
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import sys
+import xml.etree.ElementTree as ElementTree
+
+from . import PROFILE_DIR, PROFILE_SUFFIX
+
+
+def _int(value):
+    return int(value, 0)
+
+
+def _bit_names(register):
+    ''' Bit names indexed by bit number; fields wider than one bit are numbered like avr-libc '''
+    bits = [None] * 8 * _int(register.get('size', '1'))
+    for field in register.findall('bitfield'):
+        mask = _int(field.get('mask'))
+        positions = [bit for bit in range(len(bits)) if mask >> bit & 1]
+        for index, bit in enumerate(positions):
+            bits[bit] = field.get('name') + (str(index) if len(positions) > 1 else '')
+    return bits
+
+
+def _byte_names(name, size):
+    ''' Names of the bytes of a register, TCNT1 -> TCNT1L, TCNT1H '''
+    if size == 1:
+        return [name]
+    if size == 2:
+        return [name + 'L', name + 'H']
+    return [name + str(i) for i in range(size)]
+
+
+def _registers(root, device):
+    modules = dict((module.get('name'), module) for module in root.find('modules'))
+    xmega = device.get('architecture') != 'AVR8'
+    registers = {}
+
+    for module in device.find('peripherals'):
+        groups = dict((group.get('name'), group) for group in modules[module.get('name')].findall('register-group'))
+        for instance in module.findall('instance'):
+            for reference in instance.findall('register-group'):
+                if reference.get('address-space', 'data') != 'data':
+                    continue
+                base = _int(reference.get('offset', '0'))
+                group = groups[reference.get('name-in-module')]
+                for register in group.findall('register'):
+                    size = _int(register.get('size', '1'))
+                    address = base + _int(register.get('offset'))
+                    name = register.get('name')
+                    if xmega:
+                        # avr-libc names XMEGA registers after the instance
+                        name = '{}_{}'.format(instance.get('name'), name)
+                    bits = _bit_names(register)
+                    for i, byte_name in enumerate(_byte_names(name, size)):
+                        byte_bits = bits[i*8:i*8 + 8]
+                        while byte_bits and byte_bits[-1] is None:
+                            byte_bits.pop()
+                        registers[address + i] = [address + i, byte_name] + ([byte_bits] if byte_bits else [])
+
+    return [registers[address] for address in sorted(registers)]
+
+
+def profile_from_atdf(path):
+    ''' Build a profile dict from one ATDF file '''
+    root = ElementTree.parse(path).getroot()
+    device = root.find('devices/device')
+
+    spaces = dict((space.get('id'), space) for space in device.find('address-spaces'))
+    data = spaces['data']
+    ram = [segment for segment in data.findall('memory-segment') if segment.get('type') == 'ram']
+    io = [segment for segment in data.findall('memory-segment') if segment.get('type') == 'io']
+    flash_size = _int(spaces['prog'].get('size'))
+    eeprom = spaces.get('eeprom')
+
+    vectors = []
+    for interrupt in device.find('interrupts'):
+        index = _int(interrupt.get('index'))
+        vectors.extend([None] * (index + 1 - len(vectors)))
+        vectors[index] = interrupt.get('name')
+
+    return {
+        'name': device.get('name').lower(),
+        'architecture': device.get('architecture'),
+        'flash_size': flash_size,
+        'sram_start': _int(ram[0].get('start')) if ram else 0,
+        'sram_size': _int(ram[0].get('size')) if ram else 0,
+        'eeprom_size': _int(eeprom.get('size')) if eeprom is not None else 0,
+        'io_base': _int(io[0].get('start')) if io else 0x20,
+        # Parts with more than 8K of flash have jmp and 4-byte vectors
+        'vector_size': 4 if flash_size > 0x2000 else 2,
+        'registers': _registers(root, device),
+        'vectors': vectors
+    }
+
+
+def write_profile(profile, directory=PROFILE_DIR):
+    path = os.path.join(directory, profile['name'] + PROFILE_SUFFIX)
+    with open(path, 'w') as f:
+        json.dump(profile, f, sort_keys=True, separators=(',', ':'))
+        f.write('\n')
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate AVR device profiles from ATDF files')
+    parser.add_argument('atdf', nargs='+', help='ATDF device files')
+    parser.add_argument('-o', '--output', default=PROFILE_DIR, help='profile directory (default: avr/devices)')
+    args = parser.parse_args(argv)
+
+    for path in args.atdf:
+        print(write_profile(profile_from_atdf(path), args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
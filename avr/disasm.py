@@ -0,0 +1,153 @@
+''' Command-line AVR disassembler for raw binaries and Intel HEX files.
+
+    python -m avr.disasm firmware.hex
+    python -m avr.disasm --json --jobs 8 dump.bin > dump.jsonl
+
+Large images are split into chunks that are disassembled by a process pool.
+When a 32-bit instruction straddles a chunk boundary, the next chunk is
+resynchronized by sweeping from the end of that instruction until it meets
+an instruction start the worker already decoded.
+'''
+from __future__ import print_function
+
+import argparse
+import json
+import mmap
+import multiprocessing
+import struct
+import sys
+
+from .decoder import decode
+from .text import instruction_text
+from .ihex import is_ihex, read_ihex, flatten
+
+CHUNK_SIZE = 0x10000
+
+
+def sweep(data, start=0, end=None, base=0):
+    ''' Yield (offset, length, decoded) for a linear sweep of the instructions starting in data[start:end].
+
+    decoded is None for invalid words, which are stepped over as 2 bytes.
+    '''
+    if end is None:
+        end = len(data)
+    offset = start
+    while offset < end and offset + 2 <= len(data):
+        decoded = decode(data[offset:offset + 4], base + offset)
+        length = decoded.length if decoded is not None else 2
+        yield offset, length, decoded
+        offset += length
+
+
+def format_instruction(data, offset, length, decoded, base, as_json):
+    address = base + offset
+    raw = bytearray(data[offset:offset + length])
+    if decoded is not None:
+        text = instruction_text(decoded, address)
+    else:
+        text = '.word  0x{:04x}'.format(struct.unpack('<H', bytes(raw[0:2]))[0])
+
+    if as_json:
+        return json.dumps({
+            'address': address,
+            'bytes': ''.join('{:02x}'.format(b) for b in raw),
+            'length': length,
+            'mnemonic': decoded.name if decoded is not None else None,
+            'text': text,
+            'target': decoded.target if decoded is not None else None
+        }, sort_keys=True)
+
+    return '{:8x}:\t{:<12}\t{}'.format(address, ' '.join('{:02x}'.format(b) for b in raw), text)
+
+
+def _format_range(data, start, end, base, as_json, data_offset=0):
+    ''' Return (offset, next offset, line) records; offsets are relative to data_offset '''
+    return [
+        (data_offset + offset, data_offset + offset + length,
+         format_instruction(data, offset, length, decoded, base + data_offset, as_json))
+        for offset, length, decoded in sweep(data, start, end, base + data_offset)
+    ]
+
+
+def _disassemble_chunk(task):
+    data, chunk_start, chunk_length, base, as_json = task
+    return _format_range(data, 0, chunk_length, base, as_json, chunk_start)
+
+
+def disassemble_lines(image, base=0, as_json=False, jobs=None, chunk_size=CHUNK_SIZE):
+    ''' Yield one output line per instruction of image, in address order '''
+    chunk_size = max(chunk_size - chunk_size % 2, 2)
+    chunks = [(start, min(start + chunk_size, len(image))) for start in range(0, len(image), chunk_size)]
+
+    if jobs == 1 or len(chunks) <= 1:
+        for _, _, line in _format_range(image, 0, len(image), base, as_json):
+            yield line
+        return
+
+    # Each worker also gets the word after its chunk, so a 32-bit
+    # instruction at the end of the chunk still decodes
+    tasks = ((image[start:end + 2], start, end - start, base, as_json) for start, end in chunks)
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        expected = 0
+        for (start, end), records in zip(chunks, pool.imap(_disassemble_chunk, tasks)):
+            index = 0
+            if expected != start:
+                # The previous chunk ended with an instruction that runs into
+                # this one; sweep from its end until we meet a decoded start.
+                starts = dict((record[0], i) for i, record in enumerate(records))
+                index = len(records)
+                for offset, next_offset, line in _format_range(image, expected, end, base, as_json):
+                    if offset in starts:
+                        index = starts[offset]
+                        break
+                    yield line
+                    expected = next_offset
+
+            for _, next_offset, line in records[index:]:
+                yield line
+                expected = next_offset
+    finally:
+        pool.terminate()
+
+
+def load_image(path, image_format='auto'):
+    ''' Return (base address, image) for a raw binary or Intel HEX file '''
+    with open(path, 'rb') as f:
+        try:
+            contents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            return 0, b''
+
+    if image_format == 'ihex' or (image_format == 'auto' and (path.lower().endswith(('.hex', '.ihx')) or is_ihex(contents[:16]))):
+        return flatten(read_ihex(contents))
+
+    return 0, contents
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Disassemble AVR firmware from raw binaries or Intel HEX files')
+    parser.add_argument('filename', help='path to the firmware image')
+    parser.add_argument('--format', choices=['auto', 'raw', 'ihex'], default='auto', help='input format (default: guess from the file)')
+    parser.add_argument('--base', type=lambda value: int(value, 0), default=None, help='load address of a raw image')
+    parser.add_argument('--json', action='store_true', help='write one JSON object per instruction')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help='number of worker processes')
+    parser.add_argument('--chunk-size', type=lambda value: int(value, 0), default=CHUNK_SIZE, help='bytes disassembled per worker task')
+    parser.add_argument('-o', '--output', type=argparse.FileType('w'), default=sys.stdout, help='output file (default: stdout)')
+
+    args = parser.parse_args(argv)
+
+    base, image = load_image(args.filename, args.format)
+    if args.base is not None:
+        base = args.base
+
+    for line in disassemble_lines(image, base, args.json, args.jobs, args.chunk_size):
+        args.output.write(line + '\n')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
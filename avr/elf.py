@@ -0,0 +1,85 @@
+''' Minimal reader for AVR ELF program headers.
+
+Only the ELF header and program header table are read, so the file can be
+an mmap or memoryview and segment contents are never copied.
+'''
+from __future__ import print_function
+
+import struct
+
+from .memory import address_space
+
+EM_AVR = 83
+PT_LOAD = 1
+
+PF_X = 0x1
+PF_W = 0x2
+PF_R = 0x4
+
+ELF_HEADER = struct.Struct('<HHIIIIIHHHHHH')
+PROGRAM_HEADER = struct.Struct('<IIIIIIII')
+
+
+class ElfError(ValueError):
+    pass
+
+
+class ElfSegment(object):
+    __slots__ = ('vaddr', 'paddr', 'offset', 'filesz', 'memsz', 'flags', 'space')
+
+    def __init__(self, vaddr, paddr, offset, filesz, memsz, flags):
+        self.vaddr = vaddr
+        self.paddr = paddr
+        self.offset = offset
+        self.filesz = filesz
+        self.memsz = memsz
+        self.flags = flags
+        self.space = address_space(vaddr)
+
+    def __repr__(self):
+        return '<ElfSegment {} 0x{:x}+0x{:x}>'.format(self.space, self.vaddr, self.memsz)
+
+
+class ElfImage(object):
+    def __init__(self, entry, flags, segments):
+        self.entry = entry
+        self.flags = flags
+        self.segments = segments
+
+
+def is_avr_elf(header):
+    ''' Check the first 20 bytes of a file for a 32-bit little-endian AVR ELF header '''
+    header = bytes(header[:20])
+    if len(header) < 20 or header[:4] != b'\x7fELF':
+        return False
+    # ELFCLASS32, ELFDATA2LSB
+    if header[4:6] != b'\x01\x01':
+        return False
+    return struct.unpack('<H', header[18:20])[0] == EM_AVR
+
+
+def read_elf(data):
+    ''' Parse the loadable segments of an AVR ELF file held in data (bytes, mmap or memoryview) '''
+    if not is_avr_elf(data[:20]):
+        raise ElfError('not a 32-bit little-endian AVR ELF file')
+
+    (e_type, e_machine, e_version, e_entry, e_phoff, e_shoff, e_flags, e_ehsize,
+     e_phentsize, e_phnum, e_shentsize, e_shnum, e_shstrndx) = ELF_HEADER.unpack(bytes(data[16:16 + ELF_HEADER.size]))
+
+    if e_phnum and e_phentsize < PROGRAM_HEADER.size:
+        raise ElfError('bad program header size {}'.format(e_phentsize))
+
+    segments = []
+    for i in range(e_phnum):
+        start = e_phoff + i*e_phentsize
+        entry = bytes(data[start:start + PROGRAM_HEADER.size])
+        if len(entry) < PROGRAM_HEADER.size:
+            raise ElfError('truncated program header table')
+        p_type, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, p_flags, p_align = PROGRAM_HEADER.unpack(entry)
+        if p_type != PT_LOAD or p_memsz == 0:
+            continue
+        if p_offset + p_filesz > len(data):
+            raise ElfError('segment at 0x{:x} extends past the end of the file'.format(p_vaddr))
+        segments.append(ElfSegment(p_vaddr, p_paddr, p_offset, p_filesz, p_memsz, p_flags))
+
+    return ElfImage(e_entry, e_flags, segments)
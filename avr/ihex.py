@@ -0,0 +1,122 @@
+''' Intel HEX reader. '''
+from __future__ import print_function
+
+import binascii
+
+DATA = 0x00
+END_OF_FILE = 0x01
+EXTENDED_SEGMENT_ADDRESS = 0x02
+START_SEGMENT_ADDRESS = 0x03
+EXTENDED_LINEAR_ADDRESS = 0x04
+START_LINEAR_ADDRESS = 0x05
+
+
+class IntelHexError(ValueError):
+    pass
+
+
+def is_ihex(data):
+    ''' Cheap check whether data looks like an Intel HEX file '''
+    return data[:1] == b':' and all(c in b'0123456789abcdefABCDEF' for c in bytearray(data[1:9]))
+
+
+def read_ihex(data):
+    ''' Parse Intel HEX text into a list of (address, bytearray) segments.
+
+    data can be bytes or an mmap; an mmap is read line by line instead of
+    being copied. Adjacent records are merged, so each segment is one
+    contiguous run of bytes. Segments are sorted by address.
+    '''
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    if hasattr(data, 'splitlines'):
+        lines = data.splitlines()
+    else:
+        data.seek(0)
+        lines = iter(data.readline, b'')
+
+    segments = []
+    base = 0
+    current_address = None
+    current = None
+
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line[:1] != b':':
+            raise IntelHexError('line {}: missing record mark'.format(number))
+        try:
+            record = bytearray(binascii.unhexlify(line[1:]))
+        except (TypeError, binascii.Error):
+            raise IntelHexError('line {}: invalid hex digits'.format(number))
+        if len(record) < 5 or len(record) != record[0] + 5:
+            raise IntelHexError('line {}: bad record length'.format(number))
+        if sum(record) & 0xff:
+            raise IntelHexError('line {}: bad checksum'.format(number))
+
+        count, offset, record_type = record[0], (record[1] << 8) | record[2], record[3]
+        payload = record[4:4 + count]
+
+        if record_type == DATA:
+            if not payload:
+                continue
+            address = base + offset
+            if current is not None and address == current_address + len(current):
+                current += payload
+            else:
+                current_address, current = address, bytearray(payload)
+                segments.append((current_address, current))
+        elif record_type == END_OF_FILE:
+            break
+        elif record_type == EXTENDED_SEGMENT_ADDRESS:
+            base = ((payload[0] << 8) | payload[1]) << 4
+        elif record_type == EXTENDED_LINEAR_ADDRESS:
+            base = ((payload[0] << 8) | payload[1]) << 16
+        elif record_type in (START_SEGMENT_ADDRESS, START_LINEAR_ADDRESS):
+            pass
+        else:
+            raise IntelHexError('line {}: unknown record type {:02x}'.format(number, record_type))
+
+    return _merge(segments)
+
+
+def _merge(segments):
+    merged = []
+    for address, data in sorted(segments, key=lambda segment: segment[0]):
+        if merged and address <= merged[-1][0] + len(merged[-1][1]):
+            last_address, last = merged[-1]
+            start = address - last_address
+            if start + len(data) > len(last):
+                last.extend(bytearray(start + len(data) - len(last)))
+            last[start:start + len(data)] = data
+        else:
+            merged.append((address, data))
+    return merged
+
+
+def flatten(segments, fill=0xff):
+    ''' Join segments into a single (base address, bytearray) image, filling gaps with erased flash '''
+    if not segments:
+        return 0, bytearray()
+    base = segments[0][0]
+    end = max(address + len(data) for address, data in segments)
+    image = bytearray([fill]) * (end - base)
+    for address, data in segments:
+        image[address - base:address - base + len(data)] = data
+    return base, image
+
+
+def pack(segments):
+    ''' Concatenate segments without filling the gaps between them.
+
+    Returns the packed bytearray and a list of (address, offset, length)
+    giving where each segment landed, so sparse images (a bootloader near
+    the top of flash, EEPROM at 0x810000) stay small.
+    '''
+    packed = bytearray()
+    layout = []
+    for address, data in segments:
+        layout.append((address, len(packed), len(data)))
+        packed += data
+    return packed, layout
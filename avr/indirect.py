@@ -0,0 +1,423 @@
+''' Resolve ijmp/icall targets by tracking the values built in Z.
+
+A linear sweep over flash follows ldi, mov/movw, subi/sbci, add/adc,
+lsl/rol, adiw/sbiw and lpm, keeping every register as a small set of
+possible values. A compare against a constant followed by brsh bounds an
+unknown index register, which is how avr-gcc guards its switch tables, so
+
+    cpi r24, 5 ; cpc r25, r1 ; brsh .Ldefault
+    movw r30, r24
+    subi r30, lo8(-(gs(.Ltable))) ; sbci r31, hi8(-(gs(.Ltable)))
+    jmp __tablejump2__
+
+leaves Z holding the five word addresses of the table entries. Jumps with
+a known Z are followed into the libgcc helper (__tablejump2__ doubles Z,
+loads the entry with lpm and ijmps), and the indirect jump or call
+reached is reported with every target Z can hold.
+
+Values of different registers are only combined when they are constants
+or derived from the same bounded index, so they never multiply out. State
+is dropped at every branch target, since other paths may reach it. EIND
+and RAMPZ are taken to be 0 unless an out to them was seen.
+'''
+from __future__ import print_function
+
+from .decoder import decode
+from .opcodes import (
+    REGISTER, INDIR_ADDR,
+
+    BRANCH, CONDITIONAL, CALL, SKIP, RETURN, INDIRECT,
+
+    X_INC, X_DEC, Y_INC, Y_DEC, Z, Z_INC, Z_DEC)
+
+# Most values one register may hold, and largest switch table bounded
+VALUE_LIMIT = 1024
+
+# Instructions followed through a jump before giving up on reaching ijmp
+TRACE_LIMIT = 16
+
+# Registers an avr-gcc call may change; r1 is zero again on return
+CALL_CLOBBERED = (0, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 30, 31)
+
+RAMPZ = 0x3b
+EIND = 0x3c
+
+TABLEJUMP = '__tablejump__'
+TABLEJUMP2 = '__tablejump2__'
+
+# Pointer register pairs changed by post increment and pre decrement operands
+PointerUpdates = {X_INC: 26, X_DEC: 26, Y_INC: 28, Y_DEC: 28, Z_INC: 30, Z_DEC: 30}
+
+
+class IndirectTarget(object):
+    ''' Resolved targets of one indirect jump or call '''
+    __slots__ = ('address', 'targets', 'call', 'via', 'helper', 'helper_address')
+
+    def __init__(self, address, targets, call, via=None, helper=None, helper_address=None):
+        # Address of the ijmp/eijmp/icall/eicall
+        self.address = address
+        # Sorted byte addresses Z can lead to
+        self.targets = targets
+        self.call = call
+        # When the indirect jump was reached through a jmp, the jmp; when
+        # that jump went into a libgcc table jump such as __tablejump2__,
+        # the helper's name and address
+        self.via = via
+        self.helper = helper
+        self.helper_address = helper_address
+
+    def __repr__(self):
+        return '<IndirectTarget 0x{:x} -> [{}]{}>'.format(
+            self.address, ', '.join('0x{:x}'.format(target) for target in self.targets),
+            ' via 0x{:x}'.format(self.via) if self.via is not None else '')
+
+
+# A register value is None when unknown, or (index, values): the possible
+# values in the order of the bounded index they were derived from. index is
+# None for a constant, which has a single value.
+
+def _constant(value):
+    return (None, (value,))
+
+
+def _apply(operation, *operands):
+    ''' Apply operation element-wise; it returns a tuple of results, each becomes a value '''
+    index = None
+    count = 1
+    for operand in operands:
+        if operand is None:
+            return None
+        if operand[0] is not None:
+            if index is not None and operand[0] is not index:
+                return None
+            index = operand[0]
+            count = len(operand[1])
+
+    columns = [operand[1] if operand[0] is not None else operand[1]*count for operand in operands]
+    results = [operation(*row) for row in zip(*columns)]
+    return tuple((index, tuple(result[i] for result in results)) for i in range(len(results[0])))
+
+
+def _bounded(count):
+    ''' Low and high byte values of a fresh index ranging over 0..count-1 '''
+    index = object()
+    return (index, tuple(i & 0xff for i in range(count))), (index, tuple(i >> 8 for i in range(count)))
+
+
+class _State(object):
+    __slots__ = ('regs', 'carry', 'compare', 'io')
+
+    def __init__(self):
+        self.regs = [None] * 32
+        # avr-gcc keeps r1 zero everywhere outside of a mul sequence
+        self.regs[1] = _constant(0)
+        self.carry = None
+        # (register, bound, wide) of a cpi/cpc not yet followed by a branch
+        self.compare = None
+        # Known values of RAMPZ and EIND
+        self.io = {RAMPZ: 0, EIND: 0}
+
+    def copy(self):
+        state = _State.__new__(_State)
+        state.regs = list(self.regs)
+        state.carry = self.carry
+        state.compare = self.compare
+        state.io = dict(self.io)
+        return state
+
+    def merge(self, other):
+        ''' Keep only what both states agree on '''
+        self.regs = [a if a == b else None for a, b in zip(self.regs, other.regs)]
+        self.carry = self.carry if self.carry == other.carry else None
+        self.compare = None
+        self.io = dict((k, v) for k, v in self.io.items() if other.io.get(k) == v)
+
+    def pair(self, low):
+        value = _apply(lambda lo, hi: (lo | hi << 8,), self.regs[low], self.regs[low + 1])
+        return value[0] if value is not None else None
+
+    def set_pair(self, low, value):
+        if value is None:
+            self.regs[low] = self.regs[low + 1] = None
+            return
+        self.regs[low], self.regs[low + 1] = _apply(lambda v: (v & 0xff, v >> 8 & 0xff), value)
+
+    def set(self, register, results):
+        ''' Set a register and the carry from an (value, carry) result pair '''
+        if results is None:
+            self.regs[register] = self.carry = None
+        else:
+            self.regs[register], self.carry = results
+
+
+def _written(decoded):
+    ''' Registers an instruction may change '''
+    name = decoded.name
+    if decoded.flags & CALL:
+        return CALL_CLOBBERED
+    if name in ('mul', 'muls', 'mulsu', 'fmul', 'fmuls', 'fmulsu'):
+        return (0, 1)
+    written = []
+    if decoded.dst_operand_type == REGISTER and name not in ('cp', 'cpc', 'cpi', 'cpse', 'sbrc', 'sbrs', 'bst'):
+        written.append(decoded.dst)
+        if name in ('movw', 'adiw', 'sbiw'):
+            written.append(decoded.dst + 1)
+    if name in ('xch', 'las', 'lac', 'lat'):
+        written.append(decoded.src)
+    if name in ('lpm', 'elpm') and decoded.dst_operand_type is None:
+        written.append(0)
+    for operand_type, operand in ((decoded.dst_operand_type, decoded.dst), (decoded.src_operand_type, decoded.src)):
+        if operand_type == INDIR_ADDR and operand in PointerUpdates:
+            written.extend((PointerUpdates[operand], PointerUpdates[operand] + 1))
+    return written
+
+
+def _add(a, b, c=0):
+    total = a + b + c
+    return total & 0xff, total >> 8
+
+
+def _subtract(a, b, c=0):
+    return (a - b - c) & 0xff, int(a < b + c)
+
+
+def _execute(state, decoded, image):
+    ''' Update state for one instruction '''
+    name = decoded.name
+    regs = state.regs
+    dst, src = decoded.dst, decoded.src
+    compare = state.compare
+    state.compare = None
+
+    if name == 'ldi':
+        regs[dst] = _constant(src)
+        state.compare = compare
+    elif name == 'mov':
+        regs[dst] = regs[src]
+    elif name == 'movw':
+        regs[dst], regs[dst + 1] = regs[src], regs[src + 1]
+    elif name == 'eor' and dst == src:
+        # clr leaves C alone; the ELPM __tablejump2__ moves it into RAMPZ next
+        regs[dst] = _constant(0)
+    elif name in ('subi', 'sub'):
+        operand = _constant(src) if name == 'subi' else regs[src]
+        state.set(dst, _apply(_subtract, regs[dst], operand))
+    elif name in ('sbci', 'sbc'):
+        operand = _constant(src) if name == 'sbci' else regs[src]
+        state.set(dst, _apply(_subtract, regs[dst], operand, state.carry))
+    elif name == 'add':
+        state.set(dst, _apply(_add, regs[dst], regs[src]))
+    elif name == 'adc':
+        state.set(dst, _apply(_add, regs[dst], regs[src], state.carry))
+    elif name == 'lsl':
+        state.set(dst, _apply(_add, regs[dst], regs[dst]))
+    elif name == 'rol':
+        state.set(dst, _apply(_add, regs[dst], regs[dst], state.carry))
+    elif name in ('andi', 'ori'):
+        mask = src
+        results = _apply((lambda a: (a & mask,)) if name == 'andi' else (lambda a: (a | mask,)), regs[dst])
+        regs[dst] = results[0] if results is not None else None
+    elif name in ('adiw', 'sbiw'):
+        step = src if name == 'adiw' else -src
+        value = _apply(lambda v: ((v + step) & 0xffff,), state.pair(dst))
+        state.set_pair(dst, value[0] if value is not None else None)
+        state.carry = None
+    elif name == 'cpi' and regs[dst] is None:
+        state.compare = (dst, src, False)
+    elif name == 'cpc' and compare is not None and compare[0] + 1 == dst and not compare[2]:
+        high = regs[src]
+        if high is not None and high[0] is None:
+            state.compare = (compare[0], compare[1] | high[1][0] << 8, True)
+    elif name == 'brcc' and compare is not None:
+        # Falling through brsh, the compared register is below the bound
+        register, bound, wide = compare
+        if bound <= VALUE_LIMIT:
+            low, high = _bounded(bound)
+            regs[register] = low
+            if wide:
+                regs[register + 1] = high
+    elif name in ('lpm', 'elpm'):
+        _program_load(state, decoded, image)
+    elif name == 'out' and decoded.dst in (RAMPZ, EIND):
+        # A value derived from an index is still known when it is the same
+        # for every entry, as the carry of a table that does not cross 128K
+        value = regs[src]
+        if value is not None and len(set(value[1])) == 1:
+            state.io[dst] = value[1][0]
+        else:
+            state.io.pop(dst, None)
+    else:
+        for register in _written(decoded):
+            regs[register] = None
+        if decoded.dst_operand_type == REGISTER or decoded.flags & CALL:
+            state.carry = None
+
+
+def _program_load(state, decoded, image):
+    ''' lpm/elpm Rd, Z(+) reading the image at every address Z may hold '''
+    dst = decoded.dst if decoded.dst_operand_type is not None else 0
+    z = state.pair(30)
+    high = state.io.get(RAMPZ) if decoded.name == 'elpm' else 0
+    if z is None or high is None:
+        state.regs[dst] = None
+    else:
+        values = [image.byte(high << 16 | address) for address in z[1]]
+        state.regs[dst] = (z[0], tuple(values)) if None not in values else None
+    if decoded.src == Z_INC:
+        value = _apply(lambda v: ((v + 1) & 0xffff,), z)
+        state.set_pair(30, value[0] if value is not None else None)
+
+
+def _targets(state, decoded):
+    ''' Sorted byte addresses an indirect jump or call may reach, or None '''
+    z = state.pair(30)
+    high = state.io.get(EIND) if decoded.name in ('eijmp', 'eicall') else 0
+    if z is None or high is None:
+        return None
+    return sorted(set((high << 16 | address) * 2 for address in z[1]))
+
+
+class _Image(object):
+    ''' Decoded linear sweep over a flash image '''
+
+    def __init__(self, data, base):
+        self.data = data
+        self.bytes = bytearray(data)
+        self.base = base
+        self.instructions = []
+        self.labels = set()
+        offset = 0
+        while offset + 2 <= len(data):
+            decoded = decode(data[offset:offset + 4], base + offset)
+            if decoded is None:
+                self.instructions.append((base + offset, None))
+                offset += 2
+                continue
+            self.instructions.append((base + offset, decoded))
+            if decoded.target is not None and decoded.flags & (BRANCH | SKIP):
+                self.labels.add(decoded.target)
+            offset += decoded.length
+
+    def byte(self, address):
+        offset = address - self.base
+        if 0 <= offset < len(self.bytes):
+            return self.bytes[offset]
+        return None
+
+    def at(self, address):
+        offset = address - self.base
+        if not 0 <= offset < len(self.data) - 1:
+            return None
+        return decode(self.data[offset:offset + 4], address)
+
+
+def _is(decoded, name, dst=None, src=None):
+    return decoded.name == name and dst in (None, decoded.dst) and src in (None, decoded.src)
+
+
+def _tablejump_helper(body):
+    ''' TABLEJUMP2 or TABLEJUMP when body, the instructions up to an indirect jump, is that libgcc helper; else None.
+
+        [lsl r30 ; rol r31]                       __tablejump2__ only
+        [clr r0 ; rol r0 ; out RAMPZ, r0]         ELPM devices
+        [rol r24 ; out RAMPZ, r24]                EIJMP devices
+        (e)lpm r0, Z+ ; (e)lpm r31, Z ; mov r30, r0
+        [out RAMPZ, r1]
+        ijmp or eijmp
+    '''
+    i = 0
+    doubled = len(body) > 2 and _is(body[0], 'lsl', 30) and _is(body[1], 'rol', 31)
+    if doubled:
+        i = 2
+    if (len(body) > i + 3 and _is(body[i], 'eor', 0, 0) and _is(body[i + 1], 'rol', 0) and
+            _is(body[i + 2], 'out', RAMPZ, 0)):
+        i += 3
+    elif len(body) > i + 2 and _is(body[i], 'rol', 24) and _is(body[i + 1], 'out', RAMPZ, 24):
+        i += 2
+    if len(body) < i + 4:
+        return None
+    load = body[i].name
+    if not (load in ('lpm', 'elpm') and _is(body[i], load, 0, Z_INC) and _is(body[i + 1], load, 31, Z) and
+            _is(body[i + 2], 'mov', 30, 0)):
+        return None
+    i += 3
+    if _is(body[i], 'out', RAMPZ, 1):
+        i += 1
+    if i != len(body) - 1 or body[i].name not in ('ijmp', 'eijmp'):
+        return None
+    return TABLEJUMP2 if doubled else TABLEJUMP
+
+
+def _trace(image, state, jump, target):
+    ''' Follow a jmp/rjmp with the state at the jump to the indirect jump it leads to.
+
+    The helper is only named when the code jumped to is a libgcc table jump.
+    '''
+    state = state.copy()
+    address = target
+    body = []
+    for _ in range(TRACE_LIMIT):
+        decoded = image.at(address)
+        if decoded is None:
+            return None
+        body.append(decoded)
+        if decoded.flags & INDIRECT:
+            targets = _targets(state, decoded)
+            if not targets:
+                return None
+            helper = _tablejump_helper(body)
+            return IndirectTarget(address, targets, bool(decoded.flags & CALL), jump, helper,
+                                  target if helper is not None else None)
+        if decoded.flags & (BRANCH | CALL | SKIP | RETURN):
+            return None
+        _execute(state, decoded, image)
+        address += decoded.length
+    return None
+
+
+def resolve(data, base=0):
+    ''' Return an IndirectTarget for every indirect jump or call whose targets are known.
+
+    data is the flash image starting at byte address base. An indirect jump
+    in a helper reached from several switches is reported once per jump
+    into it, with that switch's targets.
+    '''
+    image = _Image(data, base)
+    resolved = []
+    state = _State()
+    skipped = False
+
+    for address, decoded in image.instructions:
+        if address in image.labels:
+            state = _State()
+        if decoded is None:
+            state = _State()
+            skipped = False
+            continue
+
+        flags = decoded.flags
+        if skipped:
+            # The skip may or may not have executed this instruction
+            before = state.copy()
+            _execute(state, decoded, image)
+            state.merge(before)
+            skipped = False
+            continue
+
+        if flags & INDIRECT:
+            targets = _targets(state, decoded)
+            if targets:
+                resolved.append(IndirectTarget(address, targets, bool(flags & CALL)))
+        elif flags & BRANCH and not flags & CONDITIONAL and state.pair(30) is not None:
+            indirect = _trace(image, state, address, decoded.target)
+            if indirect is not None:
+                resolved.append(indirect)
+
+        if flags & RETURN or flags & BRANCH and not flags & CONDITIONAL:
+            state = _State()
+            continue
+
+        _execute(state, decoded, image)
+        skipped = bool(flags & SKIP)
+
+    return resolved
@@ -0,0 +1,27 @@
+''' AVR address spaces as laid out by avr-gcc/avr-objcopy.
+
+Flash, SRAM and EEPROM all start at address 0 on the device. The toolchain
+keeps them apart in ELF files and combined HEX files by offsetting the data
+space and EEPROM, and the loaders map them at the same addresses.
+'''
+from __future__ import print_function
+
+FLASH = 'flash'
+SRAM = 'sram'
+EEPROM = 'eeprom'
+
+DATA_SPACE_BASE = 0x800000
+EEPROM_BASE = 0x810000
+# Fuses, lock bits and signatures live above this and are not mapped
+EEPROM_END = 0x820000
+
+
+def address_space(address):
+    ''' Return FLASH, SRAM or EEPROM for a toolchain address, or None for unmapped spaces '''
+    if address < DATA_SPACE_BASE:
+        return FLASH
+    elif address < EEPROM_BASE:
+        return SRAM
+    elif address < EEPROM_END:
+        return EEPROM
+    return None
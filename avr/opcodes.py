@@ -0,0 +1,354 @@
+''' Table-driven AVR opcode decoding.
+
+Every 16-bit instruction word indexes straight into OpcodeTable, which holds the
+Opcode describing the mnemonic, length and operand extractors for that word.
+The table is built once at import from the encoding patterns in Encodings.
+'''
+from __future__ import print_function
+
+#https://en.wikipedia.org/wiki/Atmel_AVR_instruction_set
+
+REGISTER = 0
+IOREGISTER = 1
+ADDRESS = 2
+INDIR_ADDR = 3
+IMMEDIATE = 4
+T = 5
+DES = 6
+REL_ADDR = 7
+DISPLACEMENT = 8
+DATA_ADDR = 9
+
+Registers = [
+    'r0',
+    'r1',
+    'r2',
+    'r3',
+    'r4',
+    'r5',
+    'r6',
+    'r7',
+    'r8',
+    'r9',
+    'r10',
+    'r11',
+    'r12',
+    'r13',
+    'r14',
+    'r15',
+    'r16',
+    'r17',
+    'r18',
+    'r19',
+    'r20',
+    'r21',
+    'r22',
+    'r23',
+    'r24',
+    'r25',
+    'r26',
+    'r27',
+    'r28',
+    'r29',
+    'r30',
+    'r31'
+]
+
+# Values of INDIR_ADDR operands index into this list
+IndirectOperands = ['x', 'x+', '-x', 'y', 'y+', '-y', 'z', 'z+', '-z']
+X, X_INC, X_DEC, Y, Y_INC, Y_DEC, Z, Z_INC, Z_DEC = range(9)
+
+# Operand formats: (operand type, field extractor). Extractors take the
+# instruction word; for 32-bit instructions the second word is in bits 16-31.
+Rd5 = (REGISTER, lambda instruction: (instruction&0x01f0)>>4)
+Rr5 = (REGISTER, lambda instruction: ((instruction&0x0200)>>5) + (instruction&0x000f))
+Rd4 = (REGISTER, lambda instruction: 16 + ((instruction&0x00f0)>>4))
+Rr4 = (REGISTER, lambda instruction: 16 + (instruction&0x000f))
+Rd3 = (REGISTER, lambda instruction: 16 + ((instruction&0x0070)>>4))
+Rr3 = (REGISTER, lambda instruction: 16 + (instruction&0x0007))
+RdW = (REGISTER, lambda instruction: ((instruction&0x00f0)>>4)*2)
+RrW = (REGISTER, lambda instruction: (instruction&0x000f)*2)
+RdPair = (REGISTER, lambda instruction: 24 + ((instruction&0x0030)>>3))
+K8 = (IMMEDIATE, lambda instruction: ((instruction&0x0f00)>>4) + (instruction&0x000f))
+K6 = (IMMEDIATE, lambda instruction: ((instruction&0x00c0)>>2) + (instruction&0x000f))
+K4 = (DES, lambda instruction: (instruction&0x00f0)>>4)
+b3 = (IMMEDIATE, lambda instruction: instruction&0x0007)
+A5 = (IOREGISTER, lambda instruction: (instruction&0x00f8)>>3)
+A6 = (IOREGISTER, lambda instruction: ((instruction&0x0600)>>5) + (instruction&0x000f))
+k7 = (REL_ADDR, lambda instruction: ((instruction&0x03f8)>>3) - ((instruction&0x0200)>>2))
+k12 = (REL_ADDR, lambda instruction: (instruction&0x0fff) - ((instruction&0x0800)<<1))
+k16 = (DATA_ADDR, lambda instruction: instruction>>16)
+k22 = (ADDRESS, lambda instruction: ((((instruction&0x01f0)>>3) + (instruction&0x0001))<<16) + (instruction>>16))
+q6 = (DISPLACEMENT, lambda instruction: ((instruction&0x0008)<<3) + ((instruction&0x2000)>>8) + ((instruction&0x0c00)>>7) + (instruction&0x0007))
+
+def Indirect(pointer):
+    return (INDIR_ADDR, lambda instruction: pointer)
+
+# mnemonic, encoding, dst operand, src operand
+# Letters in an encoding are operand bits; only the 0 and 1 bits are matched.
+Encodings = [
+    ('nop',    '0000 0000 0000 0000', None, None),
+    ('movw',   '0000 0001 dddd rrrr', RdW, RrW),
+    ('muls',   '0000 0010 dddd rrrr', Rd4, Rr4),
+    ('mulsu',  '0000 0011 0ddd 0rrr', Rd3, Rr3),
+    ('fmul',   '0000 0011 0ddd 1rrr', Rd3, Rr3),
+    ('fmuls',  '0000 0011 1ddd 0rrr', Rd3, Rr3),
+    ('fmulsu', '0000 0011 1ddd 1rrr', Rd3, Rr3),
+    ('cpc',    '0000 01rd dddd rrrr', Rd5, Rr5),
+    ('sbc',    '0000 10rd dddd rrrr', Rd5, Rr5),
+    ('add',    '0000 11rd dddd rrrr', Rd5, Rr5),
+    ('cpse',   '0001 00rd dddd rrrr', Rd5, Rr5),
+    ('cp',     '0001 01rd dddd rrrr', Rd5, Rr5),
+    ('sub',    '0001 10rd dddd rrrr', Rd5, Rr5),
+    ('adc',    '0001 11rd dddd rrrr', Rd5, Rr5),
+    ('and',    '0010 00rd dddd rrrr', Rd5, Rr5),
+    ('eor',    '0010 01rd dddd rrrr', Rd5, Rr5),
+    ('or',     '0010 10rd dddd rrrr', Rd5, Rr5),
+    ('mov',    '0010 11rd dddd rrrr', Rd5, Rr5),
+    ('cpi',    '0011 KKKK dddd KKKK', Rd4, K8),
+    ('sbci',   '0100 KKKK dddd KKKK', Rd4, K8),
+    ('subi',   '0101 KKKK dddd KKKK', Rd4, K8),
+    ('ori',    '0110 KKKK dddd KKKK', Rd4, K8), #Technically is both ORI and SBR as they perform the same operation
+    ('andi',   '0111 KKKK dddd KKKK', Rd4, K8), #Technically is both ANDI and CBR as they perform the same operation
+    ('ld',     '1000 000d dddd 0000', Rd5, Indirect(Z)),
+    ('ld',     '1000 000d dddd 1000', Rd5, Indirect(Y)),
+    ('ldd',    '10q0 qq0d dddd yqqq', Rd5, q6),
+    ('st',     '1000 001r rrrr 0000', Indirect(Z), Rd5),
+    ('st',     '1000 001r rrrr 1000', Indirect(Y), Rd5),
+    ('std',    '10q0 qq1r rrrr yqqq', q6, Rd5),
+    ('lds',    '1001 000d dddd 0000', Rd5, k16),
+    ('ld',     '1001 000d dddd 0001', Rd5, Indirect(Z_INC)),
+    ('ld',     '1001 000d dddd 0010', Rd5, Indirect(Z_DEC)),
+    ('lpm',    '1001 000d dddd 0100', Rd5, Indirect(Z)),
+    ('lpm',    '1001 000d dddd 0101', Rd5, Indirect(Z_INC)),
+    ('elpm',   '1001 000d dddd 0110', Rd5, Indirect(Z)),
+    ('elpm',   '1001 000d dddd 0111', Rd5, Indirect(Z_INC)),
+    ('ld',     '1001 000d dddd 1001', Rd5, Indirect(Y_INC)),
+    ('ld',     '1001 000d dddd 1010', Rd5, Indirect(Y_DEC)),
+    ('ld',     '1001 000d dddd 1100', Rd5, Indirect(X)),
+    ('ld',     '1001 000d dddd 1101', Rd5, Indirect(X_INC)),
+    ('ld',     '1001 000d dddd 1110', Rd5, Indirect(X_DEC)),
+    ('pop',    '1001 000d dddd 1111', Rd5, None),
+    ('sts',    '1001 001r rrrr 0000', k16, Rd5),
+    ('st',     '1001 001r rrrr 0001', Indirect(Z_INC), Rd5),
+    ('st',     '1001 001r rrrr 0010', Indirect(Z_DEC), Rd5),
+    ('xch',    '1001 001r rrrr 0100', Indirect(Z), Rd5),
+    ('las',    '1001 001r rrrr 0101', Indirect(Z), Rd5),
+    ('lac',    '1001 001r rrrr 0110', Indirect(Z), Rd5),
+    ('lat',    '1001 001r rrrr 0111', Indirect(Z), Rd5),
+    ('st',     '1001 001r rrrr 1001', Indirect(Y_INC), Rd5),
+    ('st',     '1001 001r rrrr 1010', Indirect(Y_DEC), Rd5),
+    ('st',     '1001 001r rrrr 1100', Indirect(X), Rd5),
+    ('st',     '1001 001r rrrr 1101', Indirect(X_INC), Rd5),
+    ('st',     '1001 001r rrrr 1110', Indirect(X_DEC), Rd5),
+    ('push',   '1001 001r rrrr 1111', None, Rd5),
+    ('com',    '1001 010d dddd 0000', Rd5, None),
+    ('neg',    '1001 010d dddd 0001', Rd5, None),
+    ('swap',   '1001 010d dddd 0010', Rd5, None),
+    ('inc',    '1001 010d dddd 0011', Rd5, None),
+    ('asr',    '1001 010d dddd 0101', Rd5, None),
+    ('lsr',    '1001 010d dddd 0110', Rd5, None),
+    ('ror',    '1001 010d dddd 0111', Rd5, None),
+    ('sec',    '1001 0100 0000 1000', None, None),
+    ('sez',    '1001 0100 0001 1000', None, None),
+    ('sen',    '1001 0100 0010 1000', None, None),
+    ('sev',    '1001 0100 0011 1000', None, None),
+    ('ses',    '1001 0100 0100 1000', None, None),
+    ('seh',    '1001 0100 0101 1000', None, None),
+    ('set',    '1001 0100 0110 1000', None, None),
+    ('sei',    '1001 0100 0111 1000', None, None),
+    ('clc',    '1001 0100 1000 1000', None, None),
+    ('clz',    '1001 0100 1001 1000', None, None),
+    ('cln',    '1001 0100 1010 1000', None, None),
+    ('clv',    '1001 0100 1011 1000', None, None),
+    ('cls',    '1001 0100 1100 1000', None, None),
+    ('clh',    '1001 0100 1101 1000', None, None),
+    ('clt',    '1001 0100 1110 1000', None, None),
+    ('cli',    '1001 0100 1111 1000', None, None),
+    ('ret',    '1001 0101 0000 1000', None, None),
+    ('reti',   '1001 0101 0001 1000', None, None),
+    ('sleep',  '1001 0101 1000 1000', None, None),
+    ('break',  '1001 0101 1001 1000', None, None),
+    ('wdr',    '1001 0101 1010 1000', None, None),
+    ('lpm',    '1001 0101 1100 1000', None, None),
+    ('elpm',   '1001 0101 1101 1000', None, None),
+    ('spm',    '1001 0101 1110 1000', None, None),
+    ('spm',    '1001 0101 1111 1000', Indirect(Z_INC), None),
+    ('ijmp',   '1001 0100 0000 1001', None, None),
+    ('eijmp',  '1001 0100 0001 1001', None, None),
+    ('icall',  '1001 0101 0000 1001', None, None),
+    ('eicall', '1001 0101 0001 1001', None, None),
+    ('dec',    '1001 010d dddd 1010', Rd5, None),
+    ('des',    '1001 0100 KKKK 1011', K4, None),
+    ('jmp',    '1001 010k kkkk 110k', k22, None),
+    ('call',   '1001 010k kkkk 111k', k22, None),
+    ('adiw',   '1001 0110 KKdd KKKK', RdPair, K6),
+    ('sbiw',   '1001 0111 KKdd KKKK', RdPair, K6),
+    ('cbi',    '1001 1000 AAAA Abbb', A5, b3),
+    ('sbic',   '1001 1001 AAAA Abbb', A5, b3),
+    ('sbi',    '1001 1010 AAAA Abbb', A5, b3),
+    ('sbis',   '1001 1011 AAAA Abbb', A5, b3),
+    ('mul',    '1001 11rd dddd rrrr', Rd5, Rr5),
+    ('in',     '1011 0AAd dddd AAAA', Rd5, A6),
+    ('out',    '1011 1AAr rrrr AAAA', A6, Rd5),
+    ('rjmp',   '1100 kkkk kkkk kkkk', k12, None),
+    ('rcall',  '1101 kkkk kkkk kkkk', k12, None),
+    ('ldi',    '1110 KKKK dddd KKKK', Rd4, K8),
+    ('brcs',   '1111 00kk kkkk k000', k7, None), #BRCS and BRLO are the same command
+    ('breq',   '1111 00kk kkkk k001', k7, None),
+    ('brmi',   '1111 00kk kkkk k010', k7, None),
+    ('brvs',   '1111 00kk kkkk k011', k7, None),
+    ('brlt',   '1111 00kk kkkk k100', k7, None),
+    ('brhs',   '1111 00kk kkkk k101', k7, None),
+    ('brts',   '1111 00kk kkkk k110', k7, None),
+    ('brie',   '1111 00kk kkkk k111', k7, None),
+    ('brcc',   '1111 01kk kkkk k000', k7, None), #BRCC and BRSH are the same command
+    ('brne',   '1111 01kk kkkk k001', k7, None),
+    ('brpl',   '1111 01kk kkkk k010', k7, None),
+    ('brvc',   '1111 01kk kkkk k011', k7, None),
+    ('brge',   '1111 01kk kkkk k100', k7, None),
+    ('brhc',   '1111 01kk kkkk k101', k7, None),
+    ('brtc',   '1111 01kk kkkk k110', k7, None),
+    ('brid',   '1111 01kk kkkk k111', k7, None),
+    ('bld',    '1111 100d dddd 0bbb', Rd5, b3),
+    ('bst',    '1111 101d dddd 0bbb', Rd5, b3),
+    ('sbrc',   '1111 110r rrrr 0bbb', Rd5, b3),
+    ('sbrs',   '1111 111r rrrr 0bbb', Rd5, b3),
+]
+
+# Aliases that only apply when both register operands are the same
+SameRegisterAliases = [
+    ('lsl', 'add'),
+    ('rol', 'adc'),
+]
+
+LongInstructions = ['lds', 'sts', 'jmp', 'call']
+
+# Category bits, precomputed per opcode so callbacks can test them instead
+# of comparing mnemonics
+BRANCH = 0x01
+CONDITIONAL = 0x02
+CALL = 0x04
+SKIP = 0x08
+RETURN = 0x10
+INDIRECT = 0x20
+LONG = 0x40
+
+Categories = {
+    'jmp': BRANCH,
+    'rjmp': BRANCH,
+    'ijmp': BRANCH | INDIRECT,
+    'eijmp': BRANCH | INDIRECT,
+    'call': CALL,
+    'rcall': CALL,
+    'icall': CALL | INDIRECT,
+    'eicall': CALL | INDIRECT,
+    'ret': RETURN,
+    'reti': RETURN,
+    'cpse': SKIP,
+    'sbrc': SKIP,
+    'sbrs': SKIP,
+    'sbic': SKIP,
+    'sbis': SKIP,
+}
+for name in ('brcs', 'breq', 'brmi', 'brvs', 'brlt', 'brhs', 'brts', 'brie',
+             'brcc', 'brne', 'brpl', 'brvc', 'brge', 'brhc', 'brtc', 'brid'):
+    Categories[name] = BRANCH | CONDITIONAL
+
+
+class Opcode(object):
+    __slots__ = ('id', 'name', 'encoding', 'mask', 'match', 'length', 'flags',
+                 'dst_operand_type', 'dst', 'src_operand_type', 'src')
+
+    def __init__(self, id, name, encoding, dst, src):
+        self.id = id
+        self.name = name
+        self.encoding = encoding
+
+        bits = encoding.replace(' ', '')
+        self.mask = int(''.join('1' if b in '01' else '0' for b in bits), 2)
+        self.match = int(''.join(b if b in '01' else '0' for b in bits), 2)
+
+        self.length = 4 if name in LongInstructions else 2
+        self.flags = Categories.get(name, 0) | (LONG if self.length == 4 else 0)
+
+        self.dst_operand_type, self.dst = dst if dst is not None else (None, None)
+        self.src_operand_type, self.src = src if src is not None else (None, None)
+
+    def words(self):
+        ''' Yield every 16-bit instruction word matching this encoding '''
+        free = ~self.mask & 0xffff
+        operand_bits = free
+        while True:
+            yield self.match | operand_bits
+            if operand_bits == 0:
+                break
+            operand_bits = (operand_bits - 1) & free
+
+    def __repr__(self):
+        return '<Opcode {} {}>'.format(self.id, self.name)
+
+
+class DecodedInstruction(object):
+    ''' A decoded instruction with its operand fields and branch target resolved '''
+    __slots__ = ('opcode', 'id', 'name', 'flags', 'length',
+                 'dst_operand_type', 'dst', 'src_operand_type', 'src', 'target')
+
+    def __init__(self, opcode, instruction, addr):
+        self.opcode = opcode
+        self.id = opcode.id
+        self.name = opcode.name
+        self.flags = opcode.flags
+        self.length = opcode.length
+        self.dst_operand_type = opcode.dst_operand_type
+        self.src_operand_type = opcode.src_operand_type
+        self.dst = opcode.dst(instruction) if opcode.dst is not None else None
+        self.src = opcode.src(instruction) if opcode.src is not None else None
+
+        # Absolute byte address of a direct branch or call; decode() sets
+        # it for skip instructions
+        if self.dst_operand_type == REL_ADDR:
+            self.target = addr + self.dst*2 + 1*2
+        elif self.dst_operand_type == ADDRESS:
+            self.target = self.dst*2
+        else:
+            self.target = None
+
+    def __repr__(self):
+        return '<DecodedInstruction {} {} {}>'.format(self.name, self.dst, self.src)
+
+
+def _build_opcodes():
+    # Opcode ID 0 is reserved for invalid instruction words
+    opcodes = [None]
+    for name, encoding, dst, src in Encodings:
+        opcodes.append(Opcode(len(opcodes), name, encoding, dst, src))
+    for alias, name in SameRegisterAliases:
+        base = [opcode for opcode in opcodes[1:] if opcode.name == name][0]
+        opcodes.append(Opcode(len(opcodes), alias, base.encoding, Rd5, None))
+    return opcodes
+
+
+def _build_table(opcodes):
+    table = [None] * 0x10000
+
+    # Most specific encodings claim their words first
+    for opcode in sorted(opcodes[1:], key=lambda opcode: -bin(opcode.mask).count('1')):
+        for word in opcode.words():
+            if table[word] is None:
+                table[word] = opcode
+
+    for alias, name in SameRegisterAliases:
+        alias_opcode = [opcode for opcode in opcodes[1:] if opcode.name == alias][0]
+        _, extract_dst = Rd5
+        _, extract_src = Rr5
+        for word in alias_opcode.words():
+            if extract_dst(word) == extract_src(word):
+                table[word] = alias_opcode
+
+    return table
+
+
+# Tuples, so the tables shared by every analysis thread cannot be changed
+Opcodes = tuple(_build_opcodes())
+OpcodeTable = tuple(_build_table(Opcodes))
@@ -0,0 +1,156 @@
+''' Opt-in call counters and timers for the architecture callbacks.
+
+    profiler = Profiler(AVR)
+    profiler.start()
+    ...                       # let Binary Ninja analyze
+    profiler.stop()
+    print(profiler.table())
+
+start() replaces the callbacks on the class with timing wrappers and stop()
+puts the originals back, so nothing is paid while profiling is off. The
+decode wrapper also counts decoded mnemonics and bad opcodes.
+'''
+from __future__ import print_function
+
+import functools
+import json
+import time
+from collections import Counter
+
+# Methods timed by default; decode_instruction is also called by the
+# others, so its time is included in theirs
+CALLBACKS = (
+    'decode_instruction',
+    'perform_get_instruction_info',
+    'perform_get_instruction_text',
+    'perform_get_instruction_low_level_il',
+    'perform_get_flag_write_low_level_il',
+    'perform_get_flag_condition_low_level_il',
+)
+
+DECODE = 'decode_instruction'
+
+# Name counted for invalid words in the mnemonic histogram
+BAD_OPCODE = '(bad)'
+
+try:
+    _clock = time.perf_counter
+except AttributeError:
+    _clock = time.time
+
+
+class Profiler(object):
+    ''' Counters for the callbacks of one class.
+
+    The counters are updated without a lock, so calls from concurrent
+    analysis threads can occasionally be lost: counts and times are
+    approximate, which is enough to rank the callbacks.
+    '''
+
+    def __init__(self, cls, callbacks=CALLBACKS):
+        self.cls = cls
+        self.callbacks = [name for name in callbacks if hasattr(cls, name)]
+        self._originals = {}
+        self.calls = Counter()
+        self.seconds = Counter()
+        self.mnemonics = Counter()
+        self._started = None
+        self.reset()
+
+    @property
+    def running(self):
+        return bool(self._originals)
+
+    def reset(self):
+        ''' Zero the counters; when running, profiling goes on from now '''
+        # Cleared in place, since the running wrappers hold these counters
+        self.calls.clear()
+        self.seconds.clear()
+        self.mnemonics.clear()
+        self.bad_opcodes = 0
+        self.elapsed = 0.0
+        if self.running:
+            self._started = _clock()
+
+    def start(self):
+        if self.running:
+            return
+        for name in self.callbacks:
+            # None when the method is inherited, so stop() deletes the wrapper
+            self._originals[name] = self.cls.__dict__.get(name)
+            setattr(self.cls, name, self._wrap(name, getattr(self.cls, name)))
+        self._started = _clock()
+
+    def stop(self):
+        if not self.running:
+            return
+        for name, original in self._originals.items():
+            if original is None:
+                delattr(self.cls, name)
+            else:
+                setattr(self.cls, name, original)
+        self._originals = {}
+        self.elapsed += _clock() - self._started
+        self._started = None
+
+    def _wrap(self, name, original):
+        calls = self.calls
+        seconds = self.seconds
+
+        if name == DECODE:
+            mnemonics = self.mnemonics
+
+            @functools.wraps(original)
+            def wrapper(*args, **kwargs):
+                start = _clock()
+                decoded = original(*args, **kwargs)
+                seconds[name] += _clock() - start
+                calls[name] += 1
+                if decoded is None:
+                    self.bad_opcodes += 1
+                    mnemonics[BAD_OPCODE] += 1
+                else:
+                    mnemonics[decoded.name] += 1
+                return decoded
+        else:
+            @functools.wraps(original)
+            def wrapper(*args, **kwargs):
+                start = _clock()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    seconds[name] += _clock() - start
+                    calls[name] += 1
+        return wrapper
+
+    def report(self):
+        ''' All counters as a JSON-able dict '''
+        elapsed = self.elapsed + (_clock() - self._started if self._started is not None else 0.0)
+        return {
+            'elapsed': elapsed,
+            'callbacks': dict((name, {
+                'calls': self.calls[name],
+                'seconds': self.seconds[name],
+                'us_per_call': self.seconds[name] / self.calls[name] * 1e6 if self.calls[name] else 0.0
+            }) for name in self.callbacks),
+            'mnemonics': dict(self.mnemonics),
+            'bad_opcodes': self.bad_opcodes
+        }
+
+    def json(self, **kwargs):
+        return json.dumps(self.report(), sort_keys=True, **kwargs)
+
+    def table(self, mnemonics=20):
+        ''' Plain text report: callbacks by total time, then the most decoded mnemonics '''
+        report = self.report()
+        lines = ['{:<42} {:>10} {:>10} {:>10} {:>7}'.format('callback', 'calls', 'seconds', 'us/call', '% wall')]
+        for name, counters in sorted(report['callbacks'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append('{:<42} {:>10d} {:>10.3f} {:>10.2f} {:>7.1f}'.format(
+                name, counters['calls'], counters['seconds'], counters['us_per_call'],
+                100.0 * counters['seconds'] / report['elapsed'] if report['elapsed'] else 0.0))
+        lines.append('')
+        lines.append('bad opcodes: {}'.format(report['bad_opcodes']))
+        total = sum(self.mnemonics.values())
+        for name, count in self.mnemonics.most_common(mnemonics):
+            lines.append('{:<10} {:>10d} {:>6.1f}%'.format(name, count, 100.0 * count / total))
+        return '\n'.join(lines)
@@ -0,0 +1,227 @@
+''' Locate progmem strings and tables from the code that reads them.
+
+Requires numpy. One linear sweep is scanned for the ways avr-gcc points Z
+(or a helper's argument register pair) at flash:
+
+    ldi r30, lo8(x) ; ldi r31, hi8(x)                   either order
+    ldi r24, lo8(x) ; ldi r25, hi8(x) ; movw r30, r24   any register pair
+    subi r30, lo8(-(x)) ; sbci r31, hi8(-(x))           x plus an index
+
+and keeps the addresses whose pointer reaches an lpm or elpm, or a call to
+a progmem helper such as strcpy_P, before any control flow or other load
+of the pointer. Adding an index to Z in between (add, adiw, ...) keeps the
+address, since it is the start of the table being indexed. elpm addresses
+take their high byte from an ldi/out RAMPZ pair shortly before.
+
+Each address becomes a NUL-terminated string when it holds printable text,
+and otherwise a byte array up to the next address found.
+'''
+from __future__ import print_function
+
+import numpy as np
+
+from .bulk import disassemble
+from .classify import Region, DATA, STRING
+from .opcodes import Opcodes, REGISTER, BRANCH, CALL, RETURN
+
+# Progmem argument register of avr-libc helpers, and what it points at
+ProgmemHelpers = {
+    'strcpy_P': (22, STRING),
+    'strncpy_P': (22, STRING),
+    'strcat_P': (22, STRING),
+    'strncat_P': (22, STRING),
+    'strcmp_P': (22, STRING),
+    'strncmp_P': (22, STRING),
+    'strcasecmp_P': (22, STRING),
+    'strstr_P': (22, STRING),
+    'strlen_P': (24, STRING),
+    'strnlen_P': (24, STRING),
+    'puts_P': (24, STRING),
+    'fputs_P': (24, STRING),
+    'memcpy_P': (22, DATA),
+    'memcmp_P': (22, DATA),
+}
+
+# Instructions between setting the pointer and reading through it
+WINDOW = 16
+
+# Strings are at least this long and at most this long including the NUL
+MIN_STRING = 2
+MAX_STRING = 1024
+
+# Byte arrays end at the next address found, or after this many bytes
+MAX_ARRAY = 256
+
+# I/O address of RAMPZ
+RAMPZ = 0x3b
+
+# Instructions that offset a pointer register instead of loading it
+OFFSETS = ('add', 'adc', 'adiw', 'sub', 'sbc', 'subi', 'sbci', 'sbiw', 'inc', 'dec', 'lsl', 'rol')
+
+
+def _ids(names):
+    return np.array([opcode.id for opcode in Opcodes[1:] if opcode.name in names], dtype=np.int64)
+
+
+class _Ids(object):
+    ''' Opcode IDs used by the scan, built on first use '''
+    _instance = None
+
+    def __init__(self):
+        self.ldi = _ids(('ldi',))
+        self.movw = _ids(('movw',))
+        self.subi = _ids(('subi',))
+        self.sbci = _ids(('sbci',))
+        self.out = _ids(('out',))
+        self.lpm = _ids(('lpm',))
+        self.elpm = _ids(('elpm',))
+        self.offsets = _ids(OFFSETS)
+        self.register_dst = np.array([0] + [opcode.dst_operand_type == REGISTER for opcode in Opcodes[1:]], dtype=bool)
+
+    @classmethod
+    def get(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+
+def _pair_values(sweep, ids, low):
+    ''' Value loaded into low:low+1 by two adjacent ldi, at the row of the second one; -1 elsewhere '''
+    is_ldi = np.isin(sweep.ids, ids.ldi)
+    lo = is_ldi & (sweep.dst == low)
+    hi = is_ldi & (sweep.dst == low + 1)
+    values = np.full(len(sweep), -1, dtype=np.int64)
+    for first, second in ((lo, hi), (hi, lo)):
+        rows = np.flatnonzero(first[:-1] & second[1:]) + 1
+        values[rows] = (np.where(lo[rows], sweep.src[rows], sweep.src[rows - 1]) |
+                        np.where(hi[rows], sweep.src[rows], sweep.src[rows - 1]) << 8)
+    return values
+
+
+def _pointer_values(sweep, ids, low):
+    ''' Flash addresses set in low:low+1 at each row, by ldi pairs, movw from an ldi pair or subi/sbci; -1 elsewhere '''
+    values = _pair_values(sweep, ids, low)
+
+    movw = np.flatnonzero(np.isin(sweep.ids[1:], ids.movw) & (sweep.dst[1:] == low)) + 1
+    for source in np.unique(sweep.src[movw]):
+        pair = _pair_values(sweep, ids, source)
+        rows = movw[(sweep.src[movw] == source) & (pair[movw - 1] >= 0)]
+        values[rows] = pair[rows - 1]
+
+    rows = np.flatnonzero(np.isin(sweep.ids[:-1], ids.subi) & (sweep.dst[:-1] == low) &
+                          np.isin(sweep.ids[1:], ids.sbci) & (sweep.dst[1:] == low + 1)) + 1
+    values[rows] = -(sweep.src[rows - 1] | sweep.src[rows] << 8) & 0xffff
+    return values
+
+
+def _last(rows, count):
+    ''' For every row, the last of rows at or before it; -1 before the first '''
+    marks = np.full(count, -1, dtype=np.int64)
+    marks[rows] = rows
+    return np.maximum.accumulate(marks)
+
+
+def _reaching(sweep, ids, low, values, uses):
+    ''' (use rows, values) of the uses reached by a pointer value in low:low+1 within WINDOW rows '''
+    count = len(sweep)
+    defined = values >= 0
+    loads = (ids.register_dst[sweep.ids] & ((sweep.dst == low) | (sweep.dst == low + 1)) &
+             ~np.isin(sweep.ids, ids.offsets))
+    barriers = ((sweep.flags & (BRANCH | CALL | RETURN)) != 0) | (loads & ~defined)
+    last_defined = _last(np.flatnonzero(defined), count)
+    last_barrier = np.concatenate(([-1], _last(np.flatnonzero(barriers), count)[:-1]))
+
+    uses = uses[uses > 0]
+    source = last_defined[uses]
+    reached = (source >= 0) & (source > last_barrier[uses]) & (uses - source <= WINDOW)
+    return uses[reached], values[source[reached]]
+
+
+def _rampz_values(sweep, ids, rows):
+    ''' RAMPZ set by an ldi/out pair within WINDOW rows before each of rows; 0 when none '''
+    out = np.flatnonzero(np.isin(sweep.ids[1:], ids.out) & (sweep.dst[1:] == RAMPZ) &
+                         np.isin(sweep.ids[:-1], ids.ldi) & (sweep.dst[:-1] == sweep.src[1:])) + 1
+    last = _last(out, len(sweep))[rows]
+    known = (last >= 0) & (rows - last <= WINDOW)
+    return np.where(known, sweep.src[np.maximum(last - 1, 0)], 0)
+
+
+def flash_references(sweep, helpers=None):
+    ''' (addresses, sources, kinds) of the flash read through pointers set up by the code of a bulk sweep.
+
+    helpers maps the addresses of progmem helpers to their
+    (argument register, kind), as in ProgmemHelpers. Kinds are STRING for
+    string helpers and None for lpm/elpm, whose data may be either. Sorted
+    by address, then source.
+    '''
+    ids = _Ids.get()
+    rows = np.arange(len(sweep))
+    addresses, sources, kinds = [], [], []
+
+    lpm = rows[np.isin(sweep.ids, ids.lpm) | np.isin(sweep.ids, ids.elpm)]
+    used, values = _reaching(sweep, ids, 30, _pointer_values(sweep, ids, 30), lpm)
+    elpm = np.isin(sweep.ids[used], ids.elpm)
+    values[elpm] |= _rampz_values(sweep, ids, used[elpm]) << 16
+    addresses.append(values)
+    sources.append(sweep.addresses[used])
+    kinds.extend([None] * len(used))
+
+    calls = rows[((sweep.flags & CALL) != 0) & np.isin(sweep.targets, list(helpers or ()))]
+    by_register = {}
+    for target, (register, kind) in (helpers or {}).items():
+        by_register.setdefault(register, []).append((target, kind))
+    for register, targets in sorted(by_register.items()):
+        kind_of = dict(targets)
+        used, values = _reaching(sweep, ids, register, _pointer_values(sweep, ids, register),
+                                 calls[np.isin(sweep.targets[calls], list(kind_of))])
+        addresses.append(values)
+        sources.append(sweep.addresses[used])
+        kinds.extend(kind_of[int(target)] for target in sweep.targets[used])
+
+    addresses = np.concatenate(addresses)
+    sources = np.concatenate(sources)
+    order = np.lexsort((sources, addresses))
+    return addresses[order], sources[order], [kinds[i] for i in order]
+
+
+def _string_end(data, offset):
+    ''' Offset just past the NUL of the printable string at offset, or None '''
+    end = data.find(b'\0', offset, offset + MAX_STRING)
+    if end - offset < MIN_STRING:
+        return None
+    text = bytearray(data[offset:end])
+    if any((byte < 0x20 or byte >= 0x7f) and byte not in (0x09, 0x0a, 0x0d) for byte in text):
+        return None
+    return end + 1
+
+
+def progmem_objects(data, base=0, helpers=None, regions=None):
+    ''' Regions of the strings and byte arrays read by the code of a flash image, sorted by start.
+
+    With regions, the data regions classified beforehand, a byte array is
+    cut at the end of the region holding it, and one outside every region
+    only covers its first byte.
+    '''
+    data = bytes(data)
+    addresses, sources, kinds = flash_references(disassemble(data, base), helpers)
+    inside = (addresses >= base) & (addresses < base + len(data))
+    starts = sorted(set(int(address) for address in addresses[inside]))
+    strings = set(int(address) for address, kind in zip(addresses, kinds) if kind == STRING)
+
+    objects = []
+    for i, start in enumerate(starts):
+        if objects and start < objects[-1].end:
+            continue
+        limit = starts[i + 1] if i + 1 < len(starts) else base + len(data)
+        end = _string_end(data, start - base)
+        if end is not None:
+            objects.append(Region(start, base + end, STRING))
+            continue
+        if start in strings:
+            continue
+        end = min(limit, start + MAX_ARRAY)
+        if regions is not None:
+            holding = [region for region in regions if region.start <= start < region.end]
+            end = min(end, holding[0].end) if holding else start + 1
+        objects.append(Region(start, end, DATA))
+    return objects
@@ -0,0 +1,92 @@
+''' avr-gcc function prologue and epilogue signatures.
+
+All signatures are alternatives of one compiled regular expression, wrapped
+in a lookahead so a single finditer pass over the image reports every
+position where any of them matches, overlapping or not. Only word-aligned
+hits are kept. Nothing is decoded; the patterns are the instruction bytes.
+'''
+from __future__ import print_function
+
+import re
+
+# Hit kinds. Prologue kinds start a function at the hit; epilogue kinds end one.
+FRAME_PROLOGUE = 'frame_prologue'
+PROLOGUE_SAVES = 'prologue_saves'
+ISR_PROLOGUE = 'isr_prologue'
+AFTER_RETURN = 'after_return'
+FRAME_EPILOGUE = 'frame_epilogue'
+EPILOGUE_RESTORES = 'epilogue_restores'
+
+PROLOGUES = (FRAME_PROLOGUE, PROLOGUE_SAVES, ISR_PROLOGUE, AFTER_RETURN)
+EPILOGUES = (FRAME_EPILOGUE, EPILOGUE_RESTORES)
+
+# push Rr / pop Rd of any register
+REGISTER_BYTE = b'[\\x0f\\x1f\\x2f\\x3f\\x4f\\x5f\\x6f\\x7f\\x8f\\x9f\\xaf\\xbf\\xcf\\xdf\\xef\\xff]'
+PUSH = REGISTER_BYTE + b'[\\x92\\x93]'
+POP = REGISTER_BYTE + b'[\\x90\\x91]'
+
+
+def _ldi(register):
+    ''' ldi Rd, K of any constant '''
+    low = (register - 16) << 4
+    return '[\\x{:02x}-\\x{:02x}][\\xe0-\\xef]'.format(low, low | 0x0f).encode('ascii')
+
+
+# jmp within the first 128K of flash, or rjmp
+JUMP = b'(?:[\\x0c\\x0d]\\x94|[\\x00-\\xff][\\xc0-\\xcf])'
+
+# (kind, pattern, offset of the function start from the hit); epilogues end
+# their function where the pattern ends
+Signatures = [
+    # push ...; push r28; push r29; in r28, SPL; in r29, SPH, starting at
+    # the first push. Also matches main, which sets up Y without saving it.
+    (FRAME_PROLOGUE, b'(?<!' + PUSH + b')(?:' + PUSH + b')*(?:\\xcf\\x93\\xdf\\x93)?\\xcd\\xb7\\xde\\xb7', 0),
+    # ldi r26/r27, frame size; ldi r30/r31, resume address; jmp __prologue_saves__+n
+    (PROLOGUE_SAVES, _ldi(26) + _ldi(27) + _ldi(30) + _ldi(31) + JUMP, 0),
+    # ISR: push r1; push r0; in r0, SREG; push r0; clr r1
+    (ISR_PROLOGUE, b'\\x1f\\x92\\x0f\\x92\\x0f\\xb6\\x0f\\x92\\x11\\x24', 0),
+    # ret directly followed by pushes: the next function saving registers
+    (AFTER_RETURN, b'\\x08\\x95(?=' + PUSH + b')', 2),
+    # pop r29; pop r28; pop ...; ret
+    (FRAME_EPILOGUE, b'\\xdf\\x91\\xcf\\x91(?:' + POP + b')*\\x08\\x95', None),
+    # ldi r30, register count; jmp __epilogue_restores__+n
+    (EPILOGUE_RESTORES, _ldi(30) + JUMP, None),
+]
+
+_pattern = None
+
+
+def _compiled():
+    global _pattern
+    if _pattern is None:
+        alternatives = [b'(?P<' + kind.encode('ascii') + b'>' + pattern + b')' for kind, pattern, _ in Signatures]
+        _pattern = re.compile(b'(?=' + b'|'.join(alternatives) + b')', re.DOTALL)
+    return _pattern
+
+
+_offsets = dict((kind, offset) for kind, _, offset in Signatures)
+
+
+def scan(data, base=0):
+    ''' Yield (address, kind) for every word-aligned signature hit in a flash image.
+
+    data can be bytes, bytearray, an mmap or a memoryview. For prologue kinds
+    address is the function start; for epilogue kinds it is the address just
+    past the function's last instruction. When several signatures match at
+    one position the first in Signatures wins.
+    '''
+    for match in _compiled().finditer(data):
+        start = match.start()
+        if start & 1:
+            continue
+        kind = match.lastgroup
+        offset = _offsets[kind]
+        if offset is None:
+            yield base + match.end(kind), kind
+        else:
+            yield base + start + offset, kind
+
+
+def function_starts(data, base=0):
+    ''' Sorted addresses of the functions found by the prologue signatures '''
+    return sorted(set(address for address, kind in scan(data, base) if kind in PROLOGUES))
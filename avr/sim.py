@@ -0,0 +1,1058 @@
+''' AVR instruction set simulator for running firmware fragments headless.
+
+    sim = Simulator(image, device='atmega328p')
+    sim.on_write('UDR0', lambda address, value: output.append(value))
+    sim.r[24] = 0x10
+    sim.call(0x1a4)                 # run a function until it returns
+    sim.run(1000000)                # or run from sim.pc
+
+Registers, SREG, the stack pointer, SRAM and the I/O registers are plain
+memory laid out as in the device profile, so in/out, ld/st and sbi/cbi
+reach them all the same way. Hooks on named or numbered data space
+addresses stand in for peripherals; no peripheral or interrupt is modelled.
+
+Code is run one basic block at a time. A block is decoded once into a
+tuple of closures with their operands bound, ending at the first branch,
+call, return or skip, and cached by address; running it is one call per
+instruction with no decoding. Flags of 8-bit additions and subtractions
+come from lookup tables built on first use.
+'''
+from __future__ import print_function
+
+from array import array
+
+from .decoder import decode
+from .devices import current_device, load_device
+from .opcodes import IMMEDIATE, BRANCH, CALL, SKIP, RETURN
+
+# Most instructions decoded into one block
+BLOCK_LIMIT = 64
+
+# Instructions run by call() before giving up on the function returning
+CALL_LIMIT = 10000000
+
+# I/O addresses of the CPU registers, from the device's io_base
+RAMPZ = 0x3b
+EIND = 0x3c
+SPL = 0x3d
+SPH = 0x3e
+SREG = 0x3f
+
+# SREG bits
+C = 0x01
+Z = 0x02
+N = 0x04
+V = 0x08
+S = 0x10
+H = 0x20
+T = 0x40
+I = 0x80
+
+# Low register of the X, Y and Z pointer pairs and the post increment (1) or
+# pre decrement (-1) applied, indexed by INDIR_ADDR operand value
+Pointers = [
+    (26, 0), (26, 1), (26, -1),  # x, x+, -x
+    (28, 0), (28, 1), (28, -1),  # y, y+, -y
+    (30, 0), (30, 1), (30, -1)   # z, z+, -z
+]
+Y_LOW = 28
+Z_LOW = 30
+
+# Instructions that end a block besides branches, calls, returns and skips
+Stops = ('sleep', 'break')
+
+
+class SimulatorError(RuntimeError):
+    pass
+
+
+class _Halt(Exception):
+    ''' Raised by sleep and break to stop run() '''
+
+    def __init__(self, pc, reason):
+        Exception.__init__(self, reason)
+        self.pc = pc
+        self.reason = reason
+
+
+_tables = []
+
+
+def _flag_tables():
+    ''' (ADD, SUB, LOGIC): result | HSVNZC << 8 of 8-bit a + b + c and a - b - c
+    indexed by c << 16 | a << 8 | b, and SVNZ of a logic result '''
+    if _tables:
+        return _tables
+
+    def flags(result, carries, overflow):
+        n = result >> 5 & N
+        v = overflow >> 4 & V
+        return (carries >> 7 & C | carries << 2 & H | n | v | (n << 2 ^ v << 1) |
+                (0 if result else Z)) << 8 | result
+
+    add = array('H')
+    sub = array('H')
+    for c in (0, 1):
+        for a in range(256):
+            for b in range(256):
+                result = (a + b + c) & 0xff
+                add.append(flags(result, a & b | (a | b) & ~result, (a ^ result) & (b ^ result) & 0x80))
+                result = (a - b - c) & 0xff
+                sub.append(flags(result, ~a & b | b & result | result & ~a, (a ^ b) & (a ^ result) & 0x80))
+    logic = array('B', ((result >> 5 & N) << 2 | result >> 5 & N | (0 if result else Z) for result in range(256)))
+    _tables.extend((add, sub, logic))
+    return _tables
+
+
+class Simulator(object):
+    ''' One AVR CPU with its flash, registers and data space.
+
+    r holds r0-r31 at indices 0-31; on devices that map the registers into
+    the data space it is data itself. pc is a byte address.
+    '''
+
+    def __init__(self, image=b'', base=0, device=None):
+        if device is None:
+            device = current_device()
+        elif not hasattr(device, 'flash_size'):
+            device = load_device(device)
+        self.device = device
+
+        io_base = device.io_base
+        size = max(device.sram_start + device.sram_size, io_base + 0x40, len(device.register_names))
+        self.data = bytearray(size)
+        # Classic AVRs map r0-r31 at data space address 0
+        self.r = self.data if io_base >= 0x20 else bytearray(32)
+        self.flash = bytearray(b'\xff' * device.flash_size)
+
+        self.sreg_address = io_base + SREG
+        self.spl_address = io_base + SPL
+        self.sph_address = io_base + SPH
+        self.rampz_address = io_base + RAMPZ
+        self.eind_address = io_base + EIND
+        # Devices with more than 128K of flash push 3-byte return addresses
+        self.pc_bytes = 3 if device.flash_size > 0x20000 else 2
+
+        self.read_hooks = {}
+        self.write_hooks = {}
+        self._blocks = {}
+
+        self.load(image, base)
+        self.reset()
+
+    def reset(self):
+        ''' Clear the registers and data space and start from address 0 with SP at the end of SRAM '''
+        self.data[:] = bytearray(len(self.data))
+        self.r[:] = bytearray(len(self.r))
+        self.sp = self.device.sram_start + self.device.sram_size - 1
+        self.pc = 0
+        self.instructions = 0
+        self.halted = None
+
+    def load(self, image, base=0):
+        ''' Copy image into flash at byte address base '''
+        if base < 0 or base + len(image) > len(self.flash):
+            raise SimulatorError('image at 0x{:x} does not fit {} bytes of flash'.format(base, len(self.flash)))
+        self.flash[base:base + len(image)] = image
+        self.invalidate()
+
+    def invalidate(self):
+        ''' Drop every decoded block, after flash or the hooks changed '''
+        self._blocks.clear()
+
+    @property
+    def sp(self):
+        return self.data[self.spl_address] | self.data[self.sph_address] << 8
+
+    @sp.setter
+    def sp(self, value):
+        self.data[self.spl_address] = value & 0xff
+        self.data[self.sph_address] = value >> 8 & 0xff
+
+    @property
+    def sreg(self):
+        return self.data[self.sreg_address]
+
+    @sreg.setter
+    def sreg(self, value):
+        self.data[self.sreg_address] = value
+
+    def pair(self, low):
+        ''' Value of the register pair r(low+1):r(low), such as 30 for Z '''
+        return self.r[low] | self.r[low + 1] << 8
+
+    def set_pair(self, low, value):
+        self.r[low] = value & 0xff
+        self.r[low + 1] = value >> 8 & 0xff
+
+    def _address(self, register):
+        if isinstance(register, int):
+            return register
+        address = self.device.register_address(register)
+        if address is None:
+            raise SimulatorError('{} has no register {}'.format(self.device.name, register))
+        return address
+
+    def on_read(self, register, function):
+        ''' Call function(address) for reads of a data space address or register name; it returns the byte read '''
+        self.read_hooks[self._address(register)] = function
+        self.invalidate()
+
+    def on_write(self, register, function):
+        ''' Call function(address, value) after each write to a data space address or register name '''
+        self.write_hooks[self._address(register)] = function
+        self.invalidate()
+
+    def read(self, address):
+        ''' Read a data space byte, through its hook if it has one '''
+        hook = self.read_hooks.get(address)
+        if hook is not None:
+            return hook(address)
+        return self.data[address]
+
+    def write(self, address, value):
+        self.data[address] = value
+        hook = self.write_hooks.get(address)
+        if hook is not None:
+            hook(address, value)
+
+    def push(self, value):
+        sp = self.sp
+        self.data[sp] = value
+        self.sp = sp - 1
+
+    def pop(self):
+        sp = self.sp + 1
+        self.sp = sp
+        return self.data[sp]
+
+    def run(self, max_instructions=None, until=None):
+        ''' Run from pc until max_instructions have run, pc reaches until, or sleep or break.
+
+        Both limits are checked between blocks, so up to a block more may run
+        and until should be an address control is transferred to. Returns the
+        number of instructions run. After an error pc is left at the start of
+        the block that raised it.
+        '''
+        blocks = self._blocks
+        translate = self._translate
+        limit = max_instructions if max_instructions is not None else float('inf')
+        pc = self.pc
+        executed = 0
+        count = 0
+        self.halted = None
+        try:
+            while executed < limit and pc != until:
+                body, end, count = blocks.get(pc) or translate(pc)
+                for handler in body:
+                    handler()
+                pc = end()
+                executed += count
+        except _Halt as halt:
+            executed += count
+            pc = halt.pc
+            self.halted = halt.reason
+        except IndexError:
+            raise SimulatorError('data space or flash access out of range in the block at 0x{:x}'.format(pc))
+        finally:
+            self.pc = pc
+            self.instructions += executed
+        return executed
+
+    def step(self):
+        ''' Run the one instruction at pc, without caching it '''
+        self.halted = None
+        body, end, count = self._translate(self.pc, limit=1, cache=False)
+        try:
+            for handler in body:
+                handler()
+            self.pc = end()
+        except _Halt as halt:
+            self.pc = halt.pc
+            self.halted = halt.reason
+        self.instructions += count
+
+    def call(self, address, max_instructions=CALL_LIMIT):
+        ''' Call the function at byte address with the current registers and run it until it returns.
+
+        The return address pushed is the highest word address, which is
+        outside flash on every device whose return addresses can hold it.
+        '''
+        exit = ((1 << 8*self.pc_bytes) - 1) * 2
+        self._push_return(exit // 2)
+        self.pc = address
+        executed = self.run(max_instructions, until=exit)
+        if self.pc != exit:
+            raise SimulatorError('function at 0x{:x} did not return within {} instructions (pc 0x{:x})'.format(
+                address, executed, self.pc))
+        return executed
+
+    def _push_return(self, word):
+        for _ in range(self.pc_bytes):
+            self.push(word & 0xff)
+            word >>= 8
+
+    def _translate(self, pc, limit=BLOCK_LIMIT, cache=True):
+        ''' Decode the block at pc into (body handlers, end handler returning the next pc, instruction count) '''
+        flash = self.flash
+        if not 0 <= pc < len(flash):
+            raise SimulatorError('pc 0x{:x} is outside flash'.format(pc))
+
+        body = []
+        addr = pc
+        count = 0
+        while True:
+            decoded = decode(bytes(flash[addr:addr + 4]), addr)
+            count += 1
+            if decoded is None:
+                end = _invalid(flash, addr)
+                break
+            handler = Handlers[decoded.name](self, decoded, addr)
+            if decoded.flags & (BRANCH | CALL | RETURN | SKIP) or decoded.name in Stops:
+                end = handler
+                break
+            if handler is not None:
+                body.append(handler)
+            addr += decoded.length
+            if count == limit or addr >= len(flash):
+                end = _fallthrough(addr)
+                break
+
+        block = (tuple(body), end, count)
+        if cache:
+            self._blocks[pc] = block
+        return block
+
+
+def _fallthrough(addr):
+    return lambda: addr
+
+
+def _invalid(flash, addr):
+    def invalid():
+        raise SimulatorError('invalid instruction {:02x}{:02x} at 0x{:x}'.format(flash[addr + 1], flash[addr], addr))
+    return invalid
+
+
+def _unsupported(sim, decoded, addr):
+    def unsupported():
+        raise SimulatorError('{} at 0x{:x} is not simulated'.format(decoded.name, addr))
+    return unsupported
+
+
+def _nop(sim, decoded, addr):
+    return None
+
+
+# Handler factories take the Simulator, the DecodedInstruction and its byte
+# address, and return a closure with the operands bound. Block ending
+# instructions return the next pc from it.
+
+def _add(carry):
+    ''' add/adc, and lsl/rol which only have Rd '''
+    def factory(sim, decoded, addr):
+        r, d, sreg = sim.r, sim.data, sim.sreg_address
+        table = _flag_tables()[0]
+        rd = decoded.dst
+        rr = decoded.src if decoded.src is not None else rd
+        if carry:
+            def adc():
+                v = table[(d[sreg] & C) << 16 | r[rd] << 8 | r[rr]]
+                r[rd] = v & 0xff
+                d[sreg] = d[sreg] & 0xc0 | v >> 8
+            return adc
+
+        def add():
+            v = table[r[rd] << 8 | r[rr]]
+            r[rd] = v & 0xff
+            d[sreg] = d[sreg] & 0xc0 | v >> 8
+        return add
+    return factory
+
+
+def _sub(carry, store=True):
+    ''' sub/sbc/cp/cpc and their immediate forms; with carry Z is only kept, never set '''
+    def factory(sim, decoded, addr):
+        r, d, sreg = sim.r, sim.data, sim.sreg_address
+        table = _flag_tables()[1]
+        rd = decoded.dst
+        if decoded.src_operand_type == IMMEDIATE:
+            k = decoded.src
+            if carry:
+                def subtract_immediate():
+                    s = d[sreg]
+                    v = table[(s & C) << 16 | r[rd] << 8 | k]
+                    if store:
+                        r[rd] = v & 0xff
+                    d[sreg] = s & 0xc0 | v >> 8 & (0x3d | s)
+            else:
+                def subtract_immediate():
+                    v = table[r[rd] << 8 | k]
+                    if store:
+                        r[rd] = v & 0xff
+                    d[sreg] = d[sreg] & 0xc0 | v >> 8
+            return subtract_immediate
+
+        rr = decoded.src
+        if carry:
+            def subtract():
+                s = d[sreg]
+                v = table[(s & C) << 16 | r[rd] << 8 | r[rr]]
+                if store:
+                    r[rd] = v & 0xff
+                d[sreg] = s & 0xc0 | v >> 8 & (0x3d | s)
+        else:
+            def subtract():
+                v = table[r[rd] << 8 | r[rr]]
+                if store:
+                    r[rd] = v & 0xff
+                d[sreg] = d[sreg] & 0xc0 | v >> 8
+        return subtract
+    return factory
+
+
+def _logic(operation):
+    ''' and/or/eor and andi/ori: S, N and Z from the result, V cleared '''
+    def factory(sim, decoded, addr):
+        r, d, sreg = sim.r, sim.data, sim.sreg_address
+        table = _flag_tables()[2]
+        rd = decoded.dst
+        if decoded.src_operand_type == IMMEDIATE:
+            k = decoded.src
+            if operation == 'and':
+                def logic():
+                    r[rd] = v = r[rd] & k
+                    d[sreg] = d[sreg] & 0xe1 | table[v]
+            else:
+                def logic():
+                    r[rd] = v = r[rd] | k
+                    d[sreg] = d[sreg] & 0xe1 | table[v]
+            return logic
+
+        rr = decoded.src
+        if operation == 'and':
+            def logic():
+                r[rd] = v = r[rd] & r[rr]
+                d[sreg] = d[sreg] & 0xe1 | table[v]
+        elif operation == 'or':
+            def logic():
+                r[rd] = v = r[rd] | r[rr]
+                d[sreg] = d[sreg] & 0xe1 | table[v]
+        else:
+            def logic():
+                r[rd] = v = r[rd] ^ r[rr]
+                d[sreg] = d[sreg] & 0xe1 | table[v]
+        return logic
+    return factory
+
+
+def _com(sim, decoded, addr):
+    r, d, sreg = sim.r, sim.data, sim.sreg_address
+    table = _flag_tables()[2]
+    rd = decoded.dst
+
+    def com():
+        r[rd] = v = r[rd] ^ 0xff
+        d[sreg] = d[sreg] & 0xe0 | table[v] | C
+    return com
+
+
+def _neg(sim, decoded, addr):
+    r, d, sreg = sim.r, sim.data, sim.sreg_address
+    table = _flag_tables()[1]
+    rd = decoded.dst
+
+    def neg():
+        v = table[r[rd]]
+        r[rd] = v & 0xff
+        d[sreg] = d[sreg] & 0xc0 | v >> 8
+    return neg
+
+
+def _step(delta, overflow):
+    ''' inc/dec: S, V, N and Z, V set when Rd was overflow '''
+    def factory(sim, decoded, addr):
+        r, d, sreg = sim.r, sim.data, sim.sreg_address
+        table = _flag_tables()[2]
+        rd = decoded.dst
+
+        def step():
+            a = r[rd]
+            r[rd] = v = (a + delta) & 0xff
+            if a == overflow:
+                d[sreg] = d[sreg] & 0xe1 | table[v] ^ S | V
+            else:
+                d[sreg] = d[sreg] & 0xe1 | table[v]
+        return step
+    return factory
+
+
+def _shift_right(name):
+    ''' asr/lsr/ror: C from bit 0, V = N xor C '''
+    def factory(sim, decoded, addr):
+        r, d, sreg = sim.r, sim.data, sim.sreg_address
+        rd = decoded.dst
+
+        def shift():
+            s = d[sreg]
+            a = r[rd]
+            if name == 'asr':
+                v = a >> 1 | a & 0x80
+            elif name == 'lsr':
+                v = a >> 1
+            else:
+                v = a >> 1 | (s & C) << 7
+            r[rd] = v
+            n = v >> 7
+            c = a & 1
+            flags = c | (0 if v else Z) | n << 2 | (n ^ c) << 3 | c << 4
+            d[sreg] = s & 0xe0 | flags
+        return shift
+    return factory
+
+
+def _swap(sim, decoded, addr):
+    r = sim.r
+    rd = decoded.dst
+
+    def swap():
+        a = r[rd]
+        r[rd] = (a << 4 | a >> 4) & 0xff
+    return swap
+
+
+def _word(subtract):
+    ''' adiw/sbiw on a register pair '''
+    def factory(sim, decoded, addr):
+        r, d, sreg = sim.r, sim.data, sim.sreg_address
+        rd = decoded.dst
+        k = -decoded.src if subtract else decoded.src
+
+        def word():
+            high = r[rd + 1]
+            v = ((high << 8 | r[rd]) + k) & 0xffff
+            r[rd] = v & 0xff
+            r[rd + 1] = v >> 8
+            n = v >> 15
+            if subtract:
+                c = n & ~high >> 7 & 1
+                overflow = high >> 7 & ~n & 1
+            else:
+                c = ~n & high >> 7 & 1
+                overflow = ~high >> 7 & n & 1
+            d[sreg] = d[sreg] & 0xe0 | c | (0 if v else Z) | n << 2 | overflow << 3 | (n ^ overflow) << 4
+        return word
+    return factory
+
+
+def _multiply(signed_dst, signed_src, fractional=False):
+    ''' r1:r0 = Rd * Rr, shifted left once for the fractional forms; C is bit 15 of the product '''
+    def factory(sim, decoded, addr):
+        r, d, sreg = sim.r, sim.data, sim.sreg_address
+        rd, rr = decoded.dst, decoded.src
+
+        def multiply():
+            a = r[rd]
+            b = r[rr]
+            if signed_dst and a & 0x80:
+                a -= 0x100
+            if signed_src and b & 0x80:
+                b -= 0x100
+            product = (a * b) & 0xffff
+            c = product >> 15
+            if fractional:
+                product = product << 1 & 0xffff
+            r[0] = product & 0xff
+            r[1] = product >> 8
+            d[sreg] = d[sreg] & 0xfc | c | (0 if product else Z)
+        return multiply
+    return factory
+
+
+def _mov(sim, decoded, addr):
+    r = sim.r
+    rd, rr = decoded.dst, decoded.src
+
+    def mov():
+        r[rd] = r[rr]
+    return mov
+
+
+def _movw(sim, decoded, addr):
+    r = sim.r
+    rd, rr = decoded.dst, decoded.src
+
+    def movw():
+        r[rd] = r[rr]
+        r[rd + 1] = r[rr + 1]
+    return movw
+
+
+def _ldi(sim, decoded, addr):
+    r = sim.r
+    rd, k = decoded.dst, decoded.src
+
+    def ldi():
+        r[rd] = k
+    return ldi
+
+
+def _load(sim, decoded, addr):
+    ''' ld Rd, X/Y/Z with post increment or pre decrement '''
+    r, d, reads = sim.r, sim.data, sim.read_hooks
+    rd = decoded.dst
+    low, step = Pointers[decoded.src]
+
+    def load():
+        a = r[low] | r[low + 1] << 8
+        if step < 0:
+            a = (a - 1) & 0xffff
+        r[rd] = reads[a](a) if a in reads else d[a]
+        if step:
+            if step > 0:
+                a = (a + 1) & 0xffff
+            r[low] = a & 0xff
+            r[low + 1] = a >> 8
+    return load
+
+
+def _store(sim, decoded, addr):
+    ''' st X/Y/Z, Rr with post increment or pre decrement '''
+    r, d, writes = sim.r, sim.data, sim.write_hooks
+    rr = decoded.src
+    low, step = Pointers[decoded.dst]
+
+    def store():
+        a = r[low] | r[low + 1] << 8
+        if step < 0:
+            a = (a - 1) & 0xffff
+        d[a] = v = r[rr]
+        if a in writes:
+            writes[a](a, v)
+        if step:
+            if step > 0:
+                a = (a + 1) & 0xffff
+            r[low] = a & 0xff
+            r[low + 1] = a >> 8
+    return store
+
+
+def _load_displacement(sim, decoded, addr):
+    r, d, reads = sim.r, sim.data, sim.read_hooks
+    rd = decoded.dst
+    low = Y_LOW if decoded.src & 0x40 else Z_LOW
+    q = decoded.src & 0x3f
+
+    def ldd():
+        a = (r[low] | r[low + 1] << 8) + q
+        r[rd] = reads[a](a) if a in reads else d[a]
+    return ldd
+
+
+def _store_displacement(sim, decoded, addr):
+    r, d, writes = sim.r, sim.data, sim.write_hooks
+    rr = decoded.src
+    low = Y_LOW if decoded.dst & 0x40 else Z_LOW
+    q = decoded.dst & 0x3f
+
+    def std():
+        a = (r[low] | r[low + 1] << 8) + q
+        d[a] = v = r[rr]
+        if a in writes:
+            writes[a](a, v)
+    return std
+
+
+def _read_constant(sim, rd, a):
+    ''' Rd = (a) for lds and in, with the hook chosen when the block is decoded '''
+    r, d = sim.r, sim.data
+    hook = sim.read_hooks.get(a)
+    if hook is not None:
+        def read_hooked():
+            r[rd] = hook(a)
+        return read_hooked
+
+    def read():
+        r[rd] = d[a]
+    return read
+
+
+def _write_constant(sim, a, rr):
+    ''' (a) = Rr for sts and out '''
+    r, d = sim.r, sim.data
+    hook = sim.write_hooks.get(a)
+    if hook is not None:
+        def write_hooked():
+            d[a] = v = r[rr]
+            hook(a, v)
+        return write_hooked
+
+    def write():
+        d[a] = r[rr]
+    return write
+
+
+def _lds(sim, decoded, addr):
+    return _read_constant(sim, decoded.dst, decoded.src)
+
+
+def _sts(sim, decoded, addr):
+    return _write_constant(sim, decoded.dst, decoded.src)
+
+
+def _in(sim, decoded, addr):
+    return _read_constant(sim, decoded.dst, sim.device.io_base + decoded.src)
+
+
+def _out(sim, decoded, addr):
+    return _write_constant(sim, sim.device.io_base + decoded.dst, decoded.src)
+
+
+def _program_load(extended):
+    ''' lpm/elpm: the implied form loads r0 from (Z), the others Rd from Z or Z+ '''
+    def factory(sim, decoded, addr):
+        r, d, flash = sim.r, sim.data, sim.flash
+        rampz = sim.rampz_address
+        if decoded.dst_operand_type is None:
+            rd, increment = 0, False
+        else:
+            rd, increment = decoded.dst, Pointers[decoded.src][1] > 0
+
+        def program_load():
+            z = r[30] | r[31] << 8
+            if extended:
+                z |= d[rampz] << 16
+            r[rd] = flash[z % len(flash)]
+            if increment:
+                z += 1
+                r[30] = z & 0xff
+                r[31] = z >> 8 & 0xff
+                if extended:
+                    d[rampz] = z >> 16 & 0xff
+        return program_load
+    return factory
+
+
+def _exchange(combine):
+    ''' xch/las/lac/lat: Rd is swapped with (Z) after combining it into memory '''
+    def factory(sim, decoded, addr):
+        r = sim.r
+        rd = decoded.src
+
+        def exchange():
+            a = r[30] | r[31] << 8
+            memory = sim.read(a)
+            sim.write(a, combine(r[rd], memory) & 0xff)
+            r[rd] = memory
+        return exchange
+    return factory
+
+
+def _push(sim, decoded, addr):
+    r, d = sim.r, sim.data
+    spl, sph = sim.spl_address, sim.sph_address
+    rr = decoded.src
+
+    def push():
+        sp = d[spl] | d[sph] << 8
+        d[sp] = r[rr]
+        sp -= 1
+        d[spl] = sp & 0xff
+        d[sph] = sp >> 8 & 0xff
+    return push
+
+
+def _pop(sim, decoded, addr):
+    r, d = sim.r, sim.data
+    spl, sph = sim.spl_address, sim.sph_address
+    rd = decoded.dst
+
+    def pop():
+        sp = (d[spl] | d[sph] << 8) + 1
+        r[rd] = d[sp]
+        d[spl] = sp & 0xff
+        d[sph] = sp >> 8 & 0xff
+    return pop
+
+
+def _io_bit(value):
+    ''' cbi/sbi '''
+    def factory(sim, decoded, addr):
+        a = sim.device.io_base + decoded.dst
+        mask = 1 << decoded.src
+
+        def io_bit():
+            current = sim.read(a)
+            sim.write(a, current | mask if value else current & ~mask)
+        if a in sim.read_hooks or a in sim.write_hooks:
+            return io_bit
+
+        d = sim.data
+        if value:
+            def set_bit():
+                d[a] |= mask
+            return set_bit
+
+        def clear_bit():
+            d[a] &= ~mask
+        return clear_bit
+    return factory
+
+
+def _bst(sim, decoded, addr):
+    r, d, sreg = sim.r, sim.data, sim.sreg_address
+    rd, bit = decoded.dst, decoded.src
+
+    def bst():
+        d[sreg] = d[sreg] & ~T | (r[rd] >> bit & 1) << 6
+    return bst
+
+
+def _bld(sim, decoded, addr):
+    r, d, sreg = sim.r, sim.data, sim.sreg_address
+    rd, mask = decoded.dst, 1 << decoded.src
+
+    def bld():
+        if d[sreg] & T:
+            r[rd] |= mask
+        else:
+            r[rd] &= ~mask
+    return bld
+
+
+def _status(flag, value):
+    ''' sec/clc and the other SREG bit instructions '''
+    def factory(sim, decoded, addr):
+        d, sreg = sim.data, sim.sreg_address
+        if value:
+            def set_flag():
+                d[sreg] |= flag
+            return set_flag
+
+        def clear_flag():
+            d[sreg] &= ~flag
+        return clear_flag
+    return factory
+
+
+def _skip(condition):
+    ''' cpse/sbrc/sbrs/sbic/sbis: condition(sim, decoded) returns a test closure; the next pc skips when it holds '''
+    def factory(sim, decoded, addr):
+        test = condition(sim, decoded)
+        following = addr + 2
+        skip = decoded.target if decoded.target is not None else addr + 4
+
+        def skip_if():
+            return skip if test() else following
+        return skip_if
+    return factory
+
+
+def _equal(sim, decoded):
+    r, rd, rr = sim.r, decoded.dst, decoded.src
+    return lambda: r[rd] == r[rr]
+
+
+def _register_bit(value):
+    def condition(sim, decoded):
+        r, rd, mask = sim.r, decoded.dst, 1 << decoded.src
+        if value:
+            return lambda: r[rd] & mask
+        return lambda: not r[rd] & mask
+    return condition
+
+
+def _io_bit_test(value):
+    def condition(sim, decoded):
+        a, mask = sim.device.io_base + decoded.dst, 1 << decoded.src
+        if value:
+            return lambda: sim.read(a) & mask
+        return lambda: not sim.read(a) & mask
+    return condition
+
+
+def _conditional(flag, value):
+    ''' brXX on one SREG flag being set (value 1) or clear (value 0) '''
+    def factory(sim, decoded, addr):
+        d, sreg = sim.data, sim.sreg_address
+        target = decoded.target % len(sim.flash)
+        following = addr + 2
+        if value:
+            def branch():
+                return target if d[sreg] & flag else following
+            return branch
+
+        def branch():
+            return following if d[sreg] & flag else target
+        return branch
+    return factory
+
+
+def _jump(sim, decoded, addr):
+    target = decoded.target % len(sim.flash)
+    return lambda: target
+
+
+def _return_pusher(sim):
+    ''' Closure pushing a word return address low byte first, as the CPU does '''
+    d = sim.data
+    spl, sph = sim.spl_address, sim.sph_address
+    size = sim.pc_bytes
+
+    def push_return(word):
+        sp = d[spl] | d[sph] << 8
+        for _ in range(size):
+            d[sp] = word & 0xff
+            word >>= 8
+            sp -= 1
+        d[spl] = sp & 0xff
+        d[sph] = sp >> 8 & 0xff
+    return push_return
+
+
+def _call(sim, decoded, addr):
+    push_return = _return_pusher(sim)
+    target = decoded.target % len(sim.flash)
+    following = (addr + decoded.length) // 2
+
+    def call():
+        push_return(following)
+        return target
+    return call
+
+
+def _indirect(call, extended):
+    ''' ijmp/icall and eijmp/eicall to the word address in Z, extended by EIND '''
+    def factory(sim, decoded, addr):
+        r, d = sim.r, sim.data
+        eind = sim.eind_address
+        push_return = _return_pusher(sim)
+        following = (addr + 2) // 2
+
+        def indirect():
+            word = r[30] | r[31] << 8
+            if extended:
+                word |= d[eind] << 16
+            if call:
+                push_return(following)
+            return word * 2
+        return indirect
+    return factory
+
+
+def _return(interrupt):
+    def factory(sim, decoded, addr):
+        d, sreg = sim.data, sim.sreg_address
+        spl, sph = sim.spl_address, sim.sph_address
+        size = sim.pc_bytes
+
+        def ret():
+            sp = d[spl] | d[sph] << 8
+            word = 0
+            for _ in range(size):
+                sp += 1
+                word = word << 8 | d[sp]
+            d[spl] = sp & 0xff
+            d[sph] = sp >> 8 & 0xff
+            if interrupt:
+                d[sreg] |= I
+            return word * 2
+        return ret
+    return factory
+
+
+def _halt(sim, decoded, addr):
+    following = addr + 2
+    name = decoded.name
+
+    def halt():
+        raise _Halt(following, name)
+    return halt
+
+
+Handlers = {
+    'nop': _nop,
+    'movw': _movw,
+    'muls': _multiply(True, True),
+    'mulsu': _multiply(True, False),
+    'fmul': _multiply(False, False, fractional=True),
+    'fmuls': _multiply(True, True, fractional=True),
+    'fmulsu': _multiply(True, False, fractional=True),
+    'mul': _multiply(False, False),
+    'cpc': _sub(True, store=False),
+    'sbc': _sub(True),
+    'add': _add(False),
+    'cpse': _skip(_equal),
+    'cp': _sub(False, store=False),
+    'sub': _sub(False),
+    'adc': _add(True),
+    'and': _logic('and'),
+    'eor': _logic('eor'),
+    'or': _logic('or'),
+    'mov': _mov,
+    'cpi': _sub(False, store=False),
+    'sbci': _sub(True),
+    'subi': _sub(False),
+    'ori': _logic('or'),
+    'andi': _logic('and'),
+    'ld': _load,
+    'ldd': _load_displacement,
+    'st': _store,
+    'std': _store_displacement,
+    'lds': _lds,
+    'sts': _sts,
+    'lpm': _program_load(False),
+    'elpm': _program_load(True),
+    'xch': _exchange(lambda register, memory: register),
+    'las': _exchange(lambda register, memory: register | memory),
+    'lac': _exchange(lambda register, memory: ~register & memory),
+    'lat': _exchange(lambda register, memory: register ^ memory),
+    'pop': _pop,
+    'push': _push,
+    'com': _com,
+    'neg': _neg,
+    'swap': _swap,
+    'inc': _step(1, 0x7f),
+    'dec': _step(-1, 0x80),
+    'asr': _shift_right('asr'),
+    'lsr': _shift_right('lsr'),
+    'ror': _shift_right('ror'),
+    'lsl': _add(False),
+    'rol': _add(True),
+    'ret': _return(False),
+    'reti': _return(True),
+    'sleep': _halt,
+    'break': _halt,
+    'wdr': _nop,
+    'spm': _unsupported,
+    'des': _unsupported,
+    'ijmp': _indirect(False, False),
+    'eijmp': _indirect(False, True),
+    'icall': _indirect(True, False),
+    'eicall': _indirect(True, True),
+    'jmp': _jump,
+    'rjmp': _jump,
+    'call': _call,
+    'rcall': _call,
+    'adiw': _word(False),
+    'sbiw': _word(True),
+    'cbi': _io_bit(False),
+    'sbi': _io_bit(True),
+    'sbic': _skip(_io_bit_test(False)),
+    'sbis': _skip(_io_bit_test(True)),
+    'in': _in,
+    'out': _out,
+    'ldi': _ldi,
+    'bld': _bld,
+    'bst': _bst,
+    'sbrc': _skip(_register_bit(False)),
+    'sbrs': _skip(_register_bit(True)),
+}
+for _bit, (_set, _clear) in enumerate(zip(('sec', 'sez', 'sen', 'sev', 'ses', 'seh', 'set', 'sei'),
+                                          ('clc', 'clz', 'cln', 'clv', 'cls', 'clh', 'clt', 'cli'))):
+    Handlers[_set] = _status(1 << _bit, True)
+    Handlers[_clear] = _status(1 << _bit, False)
+for _bit, _name in enumerate(('cs', 'eq', 'mi', 'vs', 'lt', 'hs', 'ts', 'ie')):
+    Handlers['br' + _name] = _conditional(1 << _bit, 1)
+for _bit, _name in enumerate(('cc', 'ne', 'pl', 'vc', 'ge', 'hc', 'tc', 'id')):
+    Handlers['br' + _name] = _conditional(1 << _bit, 0)
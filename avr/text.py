@@ -0,0 +1,132 @@
+''' Instruction text formatting.
+
+Tokens are (token type, text, value) tuples. The token type is the name of the
+matching binaryninja InstructionTextTokenType member, so the architecture
+adapter can convert them without this module importing binaryninja.
+'''
+from __future__ import print_function
+
+from .opcodes import (
+    ADDRESS, REL_ADDR, DATA_ADDR,
+
+    Registers, IndirectOperands, Opcodes)
+from .devices import IO_SIZE, current_device
+
+TextToken = 'TextToken'
+RegisterToken = 'RegisterToken'
+IntegerToken = 'IntegerToken'
+PossibleAddressToken = 'PossibleAddressToken'
+
+
+def _tuple_token(token_type, text, value):
+    return (token_type, text, value)
+
+
+class TokenTables(object):
+    ''' Interned instruction text tokens.
+
+    Mnemonic, register, pointer, displacement and small integer tokens are
+    built once; direct and data addresses are built on first use and then
+    reused. Only the address-dependent REL_ADDR token is built per call.
+
+    make_token(token type, text, value) constructs one token. The default
+    keeps (token type, text, value) tuples; the architecture adapter passes
+    a constructor for InstructionTextTokens. I/O and data addresses are named
+    after the registers of device, the selected device by default; unnamed
+    ones are shown as numbers.
+
+    The tables are safe to share between threads: the interned tokens are
+    never changed, and two threads filling the same address memo store
+    equal tokens, so either one may win.
+    '''
+
+    def __init__(self, make_token=_tuple_token, device=None):
+        self.make_token = make_token
+        self.device = device if device is not None else current_device()
+
+        self.mnemonics = [None] + [make_token(TextToken, '{:7s}'.format(opcode.name), 0) for opcode in Opcodes[1:]]
+        self.separator = make_token(TextToken, ',', 0)
+
+        registers = [make_token(RegisterToken, name, 0) for name in Registers]
+        io_registers = [
+            make_token(RegisterToken, name, 0) if name is not None else make_token(IntegerToken, hex(address), address)
+            for address, name in enumerate(self.device.io_names[:IO_SIZE])
+        ]
+        indirect = [make_token(TextToken, name, 0) for name in IndirectOperands]
+        integers = [make_token(IntegerToken, hex(value), value) for value in range(0x100)]
+        displacements = [make_token(TextToken, ('y+' if value&0x40 else 'z+') + str(value&0x3f), 0) for value in range(0x80)]
+
+        self.addresses = {}
+        self.data_addresses = {}
+
+        # Indexed by operand type; None marks types built in operand()
+        self.operands = [
+            registers,      # REGISTER
+            io_registers,   # IOREGISTER
+            None,           # ADDRESS
+            indirect,       # INDIR_ADDR
+            integers,       # IMMEDIATE
+            None,           # T
+            integers,       # DES
+            None,           # REL_ADDR
+            displacements,  # DISPLACEMENT
+            None            # DATA_ADDR
+        ]
+
+    def operand(self, operand_type, value, addr):
+        table = self.operands[operand_type]
+        if table is not None:
+            return table[value]
+
+        if operand_type == REL_ADDR:
+            target = addr + value*2 + 1*2
+            return self.make_token(PossibleAddressToken, hex(value*2) + ', ' + hex(target).replace('L', ''), target)
+        elif operand_type == ADDRESS:
+            token = self.addresses.get(value)
+            if token is None:
+                token = self.addresses[value] = self.make_token(PossibleAddressToken, hex(value*2), value*2)
+            return token
+        elif operand_type == DATA_ADDR:
+            token = self.data_addresses.get(value)
+            if token is None:
+                name = self.device.register_name(value)
+                token = self.data_addresses[value] = self.make_token(PossibleAddressToken, name or hex(value), value)
+            return token
+        return self.make_token(TextToken, str(value), 0)
+
+    def tokens(self, decoded, addr):
+        ''' Return the list of tokens for a DecodedInstruction at byte address addr '''
+        tokens = [self.mnemonics[decoded.id]]
+
+        src_operand_type = decoded.src_operand_type
+        dst_operand_type = decoded.dst_operand_type
+
+        if dst_operand_type is not None:
+            tokens.append(self.operand(dst_operand_type, decoded.dst, addr))
+            if src_operand_type is not None:
+                tokens.append(self.separator)
+        if src_operand_type is not None:
+            tokens.append(self.operand(src_operand_type, decoded.src, addr))
+
+        return tokens
+
+
+DefaultTokenTables = None
+
+
+def default_token_tables():
+    ''' Tuple token tables for the selected device, rebuilt when the selection changes '''
+    global DefaultTokenTables
+    if DefaultTokenTables is None or DefaultTokenTables.device is not current_device():
+        DefaultTokenTables = TokenTables()
+    return DefaultTokenTables
+
+
+def instruction_tokens(decoded, addr):
+    ''' Return the (token type, text, value) tokens for a DecodedInstruction at byte address addr '''
+    return default_token_tables().tokens(decoded, addr)
+
+
+def instruction_text(decoded, addr):
+    ''' Return the disassembly text for a DecodedInstruction at byte address addr '''
+    return ''.join(text for _, text, _ in instruction_tokens(decoded, addr)).rstrip()
@@ -0,0 +1,361 @@
+''' Static cycle counts per instruction, basic block and call path.
+
+Requires numpy. Cycle counts come from the AVR Instruction Set Manual for
+the AVRe (classic tinyAVR), AVRe+ (megaAVR), AVRxm (XMEGA) and AVRxt
+(tinyAVR 0/1/2, megaAVR 0) cores, and are applied to a whole bulk sweep at
+once. Every count is a (minimum, maximum) pair:
+
+ * a conditional branch takes 1 cycle, or 2 when taken,
+ * a skip instruction takes 1 cycle, plus one per word it skips,
+ * on AVRxm data memory loads take an extra cycle from internal SRAM,
+ * calls and returns take an extra cycle with 3-byte return addresses.
+
+Data memory times assume internal SRAM. Time spent in spm programming or in
+sleep is not counted.
+
+    counts = CycleCounts(disassemble(image), device=load_device('atmega328p'))
+    counts.range(0x68, 0x7a)         # (min, max) of the instructions in the range
+    counts.path(0x68)                # (min, max) from 0x68 until it returns
+    counts.unresolved_calls(0x68)    # [(call address, target)] it could not follow
+
+path() follows branches and calls; its maximum is None when a loop,
+recursion, indirect jump, invalid instruction or a call that cannot be
+followed is reachable, since no bound can be given for those statically.
+A call cannot be followed when its target is not the start of a block of
+the sweep, for instance outside the analyzed range.
+'''
+from __future__ import print_function
+
+import heapq
+
+import numpy as np
+
+from .devices import current_device
+from .opcodes import (
+    Opcodes,
+
+    BRANCH, CONDITIONAL, CALL, SKIP, RETURN, INDIRECT,
+
+    X_DEC, Y_DEC, Z_DEC)
+
+AVRE = 'AVRe'
+AVRE_PLUS = 'AVRe+'
+AVRXM = 'AVRxm'
+AVRXT = 'AVRxt'
+CORES = (AVRE, AVRE_PLUS, AVRXM, AVRXT)
+
+# (minimum, maximum) cycles on AVRe with 2-byte return addresses; anything
+# not listed takes 1 cycle
+Cycles = {
+    'adiw': (2, 2), 'sbiw': (2, 2),
+    'mul': (2, 2), 'muls': (2, 2), 'mulsu': (2, 2), 'fmul': (2, 2), 'fmuls': (2, 2), 'fmulsu': (2, 2),
+    'rjmp': (2, 2), 'ijmp': (2, 2), 'eijmp': (2, 2), 'jmp': (3, 3),
+    'rcall': (3, 3), 'icall': (3, 3), 'eicall': (4, 4), 'call': (4, 4),
+    'ret': (4, 4), 'reti': (4, 4),
+    'ld': (2, 2), 'ldd': (2, 2), 'lds': (2, 2),
+    'st': (2, 2), 'std': (2, 2), 'sts': (2, 2),
+    'push': (2, 2), 'pop': (2, 2),
+    'lpm': (3, 3), 'elpm': (3, 3),
+    'cbi': (2, 2), 'sbi': (2, 2),
+}
+for _name in ('brcs', 'breq', 'brmi', 'brvs', 'brlt', 'brhs', 'brts', 'brie',
+              'brcc', 'brne', 'brpl', 'brvc', 'brge', 'brhc', 'brtc', 'brid'):
+    Cycles[_name] = (1, 2)
+
+# Where the other cores differ from AVRe
+CoreCycles = {
+    AVRE: {},
+    AVRE_PLUS: {},
+    AVRXM: {
+        'rcall': (2, 2), 'icall': (2, 2), 'eicall': (3, 3), 'call': (3, 3),
+        'ld': (1, 2), 'ldd': (2, 3), 'lds': (2, 3),
+        'st': (1, 1), 'std': (2, 2), 'sts': (2, 2),
+        'push': (1, 1), 'pop': (2, 2),
+        'cbi': (1, 1), 'sbi': (1, 1),
+        'sbic': (2, 2), 'sbis': (2, 2),
+        'xch': (2, 2), 'las': (2, 2), 'lac': (2, 2), 'lat': (2, 2),
+        'des': (1, 2),
+    },
+    AVRXT: {
+        'rcall': (2, 2), 'icall': (2, 2), 'eicall': (3, 3), 'call': (3, 3),
+        'ld': (2, 2), 'ldd': (2, 2), 'lds': (3, 3),
+        'st': (1, 1), 'std': (1, 1), 'sts': (2, 2),
+        'push': (1, 1), 'pop': (2, 2),
+        'cbi': (1, 1), 'sbi': (1, 1),
+    },
+}
+
+# Extra cycle for ld/st with pre decrement
+PredecrementCycles = {AVRXM: 1}
+
+# Extra cycle with 3-byte return addresses (devices with more than 128K flash)
+LongPCInstructions = ('rcall', 'icall', 'call', 'ret', 'reti')
+
+# Successor of an edge that path() cannot follow, and of a return
+_UNKNOWN = -1
+_RETURN = -2
+
+
+def core_for(device):
+    ''' Core of a device profile; classic tinyAVRs are AVRe and other classic AVRs AVRe+ '''
+    if device.architecture == 'AVR8_XMEGA':
+        return AVRXM
+    if device.architecture == 'AVR8X':
+        return AVRXT
+    if device.name.startswith('attiny'):
+        return AVRE
+    return AVRE_PLUS
+
+
+def cycle_tables(core, pc_bytes=2):
+    ''' (minimum, maximum) arrays of cycles indexed by opcode ID; invalid opcodes take 0 '''
+    if core not in CoreCycles:
+        raise ValueError('unknown core {}; expected one of {}'.format(core, ', '.join(CORES)))
+    cycles = dict(Cycles)
+    cycles.update(CoreCycles[core])
+    minimum = np.zeros(len(Opcodes), dtype=np.int64)
+    maximum = np.zeros(len(Opcodes), dtype=np.int64)
+    for opcode in Opcodes[1:]:
+        low, high = cycles.get(opcode.name, (1, 1))
+        if pc_bytes > 2 and opcode.name in LongPCInstructions:
+            low, high = low + 1, high + 1
+        minimum[opcode.id] = low
+        maximum[opcode.id] = high
+    return minimum, maximum
+
+
+def instruction_cycles(sweep, core=AVRE_PLUS, pc_bytes=2):
+    ''' (minimum, maximum) cycles of every instruction of a bulk sweep '''
+    table_minimum, table_maximum = cycle_tables(core, pc_bytes)
+    minimum = table_minimum[sweep.ids]
+    maximum = table_maximum[sweep.ids]
+
+    extra = PredecrementCycles.get(core, 0)
+    if extra:
+        decrements = (X_DEC, Y_DEC, Z_DEC)
+        loads = np.isin(sweep.ids, [opcode.id for opcode in Opcodes[1:] if opcode.name == 'ld'])
+        stores = np.isin(sweep.ids, [opcode.id for opcode in Opcodes[1:] if opcode.name == 'st'])
+        predecrement = (loads & np.isin(sweep.src, decrements)) | (stores & np.isin(sweep.dst, decrements))
+        minimum[predecrement] += extra
+        maximum[predecrement] += extra
+
+    # A skip takes one more cycle per word skipped
+    skips = (sweep.flags & SKIP != 0) & (sweep.targets >= 0)
+    maximum[skips] += (sweep.targets[skips] - sweep.addresses[skips] - 2) // 2
+    return minimum, maximum
+
+
+class CycleCounts(object):
+    ''' Cycle counts of one bulk sweep, for address ranges, basic blocks and call paths '''
+
+    def __init__(self, sweep, core=None, device=None):
+        if device is None:
+            device = current_device()
+        self.core = core if core is not None else core_for(device)
+        self.sweep = sweep
+        self.addresses = sweep.addresses
+        self.minimum, self.maximum = instruction_cycles(sweep, self.core, 3 if device.flash_size > 0x20000 else 2)
+        # Prefix sums, so any range is two lookups
+        self._minimum_sums = np.concatenate(([0], np.cumsum(self.minimum)))
+        self._maximum_sums = np.concatenate(([0], np.cumsum(self.maximum)))
+        self._blocks = None
+        self._paths = {}
+        self._unresolved = {}
+
+    def _index(self, addresses):
+        return np.searchsorted(self.addresses, addresses)
+
+    def ranges(self, starts, ends):
+        ''' (minimum, maximum) arrays of the instructions starting in each [start, end) '''
+        first = self._index(np.asarray(starts))
+        last = self._index(np.asarray(ends))
+        return (self._minimum_sums[last] - self._minimum_sums[first],
+                self._maximum_sums[last] - self._maximum_sums[first])
+
+    def range(self, start, end):
+        minimum, maximum = self.ranges([start], [end])
+        return int(minimum[0]), int(maximum[0])
+
+    def blocks(self):
+        ''' (starts, ends, minimum, maximum) arrays of the basic blocks of the sweep.
+
+        Blocks start at branch, call and skip targets and after every
+        branch, call, return and skip. Targets inside an instruction are
+        left out.
+        '''
+        if self._blocks is None:
+            sweep = self.sweep
+            addresses = self.addresses
+            ends_block = (sweep.flags & (BRANCH | CALL | RETURN | SKIP) != 0) | (sweep.ids == 0)
+            targets = sweep.targets[sweep.targets >= 0]
+            aligned = targets[np.isin(targets, addresses)]
+            leaders = np.union1d(aligned, addresses[np.flatnonzero(ends_block[:-1]) + 1])
+            if len(addresses):
+                leaders = np.union1d(leaders, addresses[:1])
+            first = self._index(leaders)
+            last = np.append(first[1:], len(addresses))
+            minimum = self._minimum_sums[last] - self._minimum_sums[first]
+            maximum = self._maximum_sums[last] - self._maximum_sums[first]
+            ends = np.append(leaders[1:], addresses[-1] + sweep.lengths[-1] if len(addresses) else 0)
+            self._blocks = (leaders, ends, minimum, maximum, first, last)
+        return self._blocks[:4]
+
+    def _successors(self, block):
+        ''' Edges [(block, minimum, maximum, callee)] out of a block, with the cycles of its last instruction;
+        to _RETURN for a return and to _UNKNOWN when the successor cannot be followed '''
+        leaders, ends, _, _, first, last = self._blocks
+        sweep = self.sweep
+        i = last[block] - 1
+        flags = int(sweep.flags[i])
+        low, high = int(self.minimum[i]), int(self.maximum[i])
+        following = int(ends[block])
+        target = int(sweep.targets[i])
+
+        def block_at(address):
+            j = np.searchsorted(leaders, address)
+            if j < len(leaders) and leaders[j] == address:
+                return int(j)
+            return _UNKNOWN
+
+        if sweep.ids[i] == 0:
+            return [(_UNKNOWN, 0, 0, None)]
+        if flags & RETURN:
+            return [(_RETURN, low, high, None)]
+        if flags & INDIRECT:
+            return [(_UNKNOWN, low, high, None)]
+        if flags & CALL:
+            return [(block_at(following), low, high, target)]
+        if flags & BRANCH and flags & CONDITIONAL or flags & SKIP:
+            if target < 0:
+                return [(_UNKNOWN, low, high, None)]
+            return [(block_at(target), high, high, None), (block_at(following), low, low, None)]
+        if flags & BRANCH:
+            return [(block_at(target), low, high, None)]
+        # Split by a leader; the last instruction is part of the block body
+        return [(block_at(following), 0, 0, None)]
+
+    def path(self, entry):
+        ''' (minimum, maximum) cycles from entry until the function returns, including the calls made.
+
+        The minimum is None when no return is reachable, the maximum when a
+        loop, recursion, indirect jump, invalid instruction or unresolved
+        call is; see unresolved_calls(). Both are None when entry is not the
+        start of a block.
+        '''
+        if entry in self._paths:
+            return self._paths[entry]
+        self.blocks()
+        start = self._block_at(entry)
+        if start is None:
+            return None, None
+
+        # Recursion has no static bound; a recursive call counts 0 cycles
+        # towards the minimum
+        self._paths[entry] = (0, None)
+        unresolved = self._unresolved[entry] = set()
+        addresses = self.addresses
+        last = self._blocks[5]
+        edges = {}
+        pending = [int(start)]
+        while pending:
+            block = pending.pop()
+            if block in edges:
+                continue
+            edges[block] = []
+            for successor, low, high, callee in self._successors(block):
+                if callee is not None and self._block_at(callee) is None:
+                    # Whether and when the callee returns is unknown: its
+                    # cycles count 0 towards the minimum and the maximum has
+                    # no bound
+                    unresolved.add((int(addresses[last[block] - 1]), callee))
+                    high = None
+                elif callee is not None:
+                    callee_low, callee_high = self.path(callee)
+                    unresolved.update(self._unresolved[callee])
+                    if callee_low is None:
+                        # The callee never returns, so neither does this edge
+                        continue
+                    low += callee_low
+                    high = high + callee_high if callee_high is not None else None
+                edges[block].append((successor, low, high))
+                if successor >= 0:
+                    pending.append(successor)
+
+        result = (self._shortest(start, edges), self._longest(start, edges))
+        self._paths[entry] = result
+        return result
+
+    def unresolved_calls(self, entry):
+        ''' Sorted (call address, target) of the calls reachable from entry whose target path() could not follow '''
+        self.path(entry)
+        return sorted(self._unresolved.get(entry, ()))
+
+    def _block_at(self, address):
+        ''' Index of the block starting at address, or None '''
+        leaders = self._blocks[0]
+        i = np.searchsorted(leaders, address)
+        if i < len(leaders) and leaders[i] == address:
+            return int(i)
+        return None
+
+    def _body(self, block):
+        ''' Cycles of a block without its last instruction when that one ends it '''
+        _, _, minimum, maximum, first, last = self._blocks
+        i = last[block] - 1
+        ends_block = self.sweep.flags[i] & (BRANCH | CALL | RETURN | SKIP) or self.sweep.ids[i] == 0
+        if not ends_block:
+            return int(minimum[block]), int(maximum[block])
+        return int(minimum[block] - self.minimum[i]), int(maximum[block] - self.maximum[i])
+
+    def _shortest(self, start, edges):
+        ''' Dijkstra over the blocks reachable from start, to the cheapest return '''
+        queue = [(0, start)]
+        done = set()
+        while queue:
+            cycles, block = heapq.heappop(queue)
+            if block == _RETURN:
+                return cycles
+            if block in done:
+                continue
+            done.add(block)
+            body = self._body(block)[0]
+            for successor, low, high in edges[block]:
+                if successor == _UNKNOWN:
+                    continue
+                heapq.heappush(queue, (cycles + body + low, successor))
+        return None
+
+    def _longest(self, start, edges):
+        ''' Longest path to a return, or None when a cycle or an unknown successor is reachable '''
+        longest = {}
+        active = set()
+        stack = [(start, False)]
+        while stack:
+            block, expanded = stack.pop()
+            if expanded:
+                active.discard(block)
+                total = 0
+                for successor, low, high in edges[block]:
+                    rest = 0 if successor == _RETURN else longest.get(successor)
+                    if successor == _UNKNOWN or high is None or rest is None:
+                        total = None
+                        break
+                    total = max(total, high + rest)
+                if total is not None and not edges[block]:
+                    total = None
+                longest[block] = None if total is None else self._body(block)[1] + total
+                continue
+            if block in longest:
+                continue
+            if block in active:
+                return None
+            active.add(block)
+            stack.append((block, True))
+            for successor, _, _ in edges[block]:
+                if successor < 0:
+                    continue
+                if successor in active:
+                    return None
+                if successor not in longest:
+                    stack.append((successor, False))
+        return longest.get(start)
@@ -0,0 +1,77 @@
+''' Interrupt vector table parsing.
+
+The table sits at the start of flash with one jmp (or rjmp, on parts with
+8K of flash or less) per vector, in the order given by the device profile.
+'''
+from __future__ import print_function
+
+from .decoder import decode
+from .devices import current_device
+from .opcodes import BRANCH, CONDITIONAL, CALL, INDIRECT
+
+VECTOR_PREFIX = '__vector_'
+
+# avr-libc points every vector without a handler at this stub
+BAD_INTERRUPT = '__bad_interrupt'
+
+
+class Vector(object):
+    ''' One vector table entry and the handler its jump leads to '''
+    __slots__ = ('number', 'name', 'address', 'handler')
+
+    def __init__(self, number, name, address, handler):
+        self.number = number
+        self.name = name
+        self.address = address
+        # Byte address of the handler, or None when the entry is not a jump
+        self.handler = handler
+
+    def __repr__(self):
+        handler = '0x{:x}'.format(self.handler) if self.handler is not None else None
+        return '<Vector {} {} at 0x{:x} -> {}>'.format(self.number, self.name, self.address, handler)
+
+
+def vector_table(data, base=0, device=None):
+    ''' Parse the vector table at the start of a flash image.
+
+    Reserved vectors are named by number. Entries past the end of data are
+    left out.
+    '''
+    if device is None:
+        device = current_device()
+    size = device.vector_size
+    vectors = []
+
+    for number in range(len(device.vectors)):
+        offset = number*size
+        if offset + 2 > len(data):
+            break
+        address = base + offset
+        decoded = decode(data[offset:offset + size], address)
+        handler = None
+        if decoded is not None and decoded.flags & (BRANCH | CONDITIONAL | CALL | INDIRECT) == BRANCH:
+            # rjmp wraps around the end of flash on parts without jmp
+            handler = decoded.target % device.flash_size
+        vectors.append(Vector(number, device.vector_name(number) or str(number), address, handler))
+
+    return vectors
+
+
+def handler_names(vectors):
+    ''' Map handler addresses to symbol names like __vector_INT0.
+
+    A handler shared by several vectors is avr-libc's __bad_interrupt, unless
+    one of them is the reset vector.
+    '''
+    shared = {}
+    for vector in vectors:
+        if vector.handler is not None:
+            shared.setdefault(vector.handler, []).append(vector)
+
+    names = {}
+    for handler, sharing in shared.items():
+        if len(sharing) == 1 or sharing[0].number == 0:
+            names[handler] = VECTOR_PREFIX + sharing[0].name
+        else:
+            names[handler] = BAD_INTERRUPT
+    return names
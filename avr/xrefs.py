@@ -0,0 +1,234 @@
+''' Cross-reference indexes built from one bulk sweep over a flash image.
+
+Requires numpy. Each index is three parallel arrays (target, source, kind)
+sorted by target, so a lookup is a binary search, and update() re-sweeps
+only the words around a change.
+
+DataXrefs maps data space addresses (I/O registers and SRAM
+globals) to the instructions that access them with a constant address:
+
+    in, lds             read
+    out, sts            write
+    sbi, cbi            modify (read-modify-write of one bit)
+    sbic, sbis          test
+
+CodeXrefs maps code addresses to the direct branches, jumps, calls and
+skips that reach them, for finding callers and branch targets that fall
+inside an instruction.
+
+    xrefs = DataXrefs(image)
+    xrefs.references('PORTB')       # [(instruction address, 'write'), ...]
+    CodeXrefs(image).callers(0x1a4) # [call instruction addresses]
+'''
+from __future__ import print_function
+
+import numbers
+import struct
+
+import numpy as np
+
+from .bulk import disassemble
+from .devices import current_device
+from .opcodes import Opcodes, OpcodeTable, BRANCH, CONDITIONAL, CALL, SKIP
+
+READ = 'read'
+WRITE = 'write'
+MODIFY = 'modify'
+TEST = 'test'
+# Kinds are stored as indexes into this tuple
+Kinds = (READ, WRITE, MODIFY, TEST)
+
+# Kinds of code references, as in avr.batch; skips count as branches
+CodeKinds = ('call', 'jump', 'branch')
+
+# Operand holding the data address of each accessing instruction, its
+# kind, and whether it is an I/O address (offset by the device's io_base)
+DataAccesses = {
+    'in': ('src', READ, True),
+    'out': ('dst', WRITE, True),
+    'sbi': ('dst', MODIFY, True),
+    'cbi': ('dst', MODIFY, True),
+    'sbic': ('dst', TEST, True),
+    'sbis': ('dst', TEST, True),
+    'lds': ('src', READ, False),
+    'sts': ('dst', WRITE, False),
+}
+
+
+class _AccessTables(object):
+    ''' DataAccesses indexed by opcode ID, built on first use '''
+    _instance = None
+
+    def __init__(self):
+        # 0: no data access, 1: address in dst, 2: address in src
+        self.operand = np.zeros(len(Opcodes), dtype=np.int8)
+        self.kind = np.zeros(len(Opcodes), dtype=np.uint8)
+        self.io = np.zeros(len(Opcodes), dtype=bool)
+        for opcode in Opcodes[1:]:
+            access = DataAccesses.get(opcode.name)
+            if access is None:
+                continue
+            operand, kind, io = access
+            self.operand[opcode.id] = 1 if operand == 'dst' else 2
+            self.kind[opcode.id] = Kinds.index(kind)
+            self.io[opcode.id] = io
+
+    @classmethod
+    def get(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+
+def data_accesses(sweep, io_base):
+    ''' (targets, sources, kinds) arrays of the constant-address data accesses of a bulk sweep, sorted by target '''
+    tables = _AccessTables.get()
+    operand = tables.operand[sweep.ids]
+    selected = operand != 0
+    values = np.where(operand == 1, sweep.dst, sweep.src)[selected]
+    targets = values + tables.io[sweep.ids][selected] * io_base
+    sources = sweep.addresses[selected]
+    kinds = tables.kind[sweep.ids][selected]
+    order = np.lexsort((sources, targets))
+    return targets[order], sources[order], kinds[order]
+
+
+def _is_long(data, offset):
+    ''' Whether the word at offset decodes as a 32-bit instruction '''
+    opcode = OpcodeTable[struct.unpack_from('<H', data, offset)[0]]
+    return opcode is not None and opcode.length == 4
+
+
+def code_references(sweep):
+    ''' (targets, sources, kinds) arrays of the direct branches, calls and skips of a bulk sweep, sorted by target '''
+    selected = (sweep.flags & (BRANCH | CALL | SKIP) != 0) & (sweep.targets >= 0)
+    flags = sweep.flags[selected]
+    kinds = np.where(flags & CALL != 0, 0, np.where(flags & (CONDITIONAL | SKIP) != 0, 2, 1)).astype(np.uint8)
+    targets = sweep.targets[selected]
+    sources = sweep.addresses[selected]
+    order = np.lexsort((sources, targets))
+    return targets[order], sources[order], kinds[order]
+
+
+class _SweepIndex(object):
+    ''' (target, source, kind) arrays of one flash image, sorted by target and then source.
+
+    starts holds the address of every instruction of the sweep.
+    '''
+    kinds_names = ()
+
+    def __init__(self, data, base=0):
+        self.base = base
+        self.size = len(data)
+        sweep = disassemble(data, base)
+        self.starts = sweep.addresses
+        self.targets, self.sources, self.kinds = self._entries(sweep)
+
+    def _entries(self, sweep):
+        raise NotImplementedError
+
+    def __len__(self):
+        return len(self.targets)
+
+    def _references(self, start, end):
+        ''' (source, kind name) of the entries with targets in [start, end), by source '''
+        first, last = np.searchsorted(self.targets, [start, end])
+        order = np.argsort(self.sources[first:last], kind='stable')
+        return [(int(source), self.kinds_names[kind]) for source, kind in
+                zip(self.sources[first:last][order], self.kinds[first:last][order])]
+
+    def counts(self):
+        ''' {target: number of references} '''
+        addresses, counts = np.unique(self.targets, return_counts=True)
+        return dict(zip(addresses.tolist(), counts.tolist()))
+
+    def update(self, data, start, end):
+        ''' Re-index after the bytes at addresses [start, end) of the image changed; data is the whole new image.
+
+        Only the words whose decoding can have changed are swept again: from
+        the start of the run of 32-bit-looking words before the change to
+        the first other word after it, where the sweep is aligned again.
+        '''
+        if len(data) != self.size:
+            raise ValueError('the image changed size; build a new index')
+        words = self.size // 2
+        first = max((start - self.base) // 2 - 1, 0)
+        while first > 0 and _is_long(data, (first - 1) * 2):
+            first -= 1
+        last = min(-(-(end - self.base) // 2), words)
+        while last < words and _is_long(data, last * 2):
+            last += 1
+        last = min(last + 1, words)
+
+        low, high = self.base + first * 2, self.base + last * 2
+        # One word more, so that a skip at the end sees the length of what it skips
+        sweep = disassemble(data[first * 2:last * 2 + 2], low)
+        before, after = np.searchsorted(self.starts, [low, high])
+        self.starts = np.concatenate((self.starts[:before], sweep.addresses[sweep.addresses < high], self.starts[after:]))
+
+        kept = (self.sources < low) | (self.sources >= high)
+        targets, sources, kinds = self._entries(sweep)
+        inside = sources < high
+        targets, sources, kinds = targets[inside], sources[inside], kinds[inside]
+        targets = np.concatenate((self.targets[kept], targets))
+        sources = np.concatenate((self.sources[kept], sources))
+        kinds = np.concatenate((self.kinds[kept], kinds))
+        order = np.lexsort((sources, targets))
+        self.targets, self.sources, self.kinds = targets[order], sources[order], kinds[order]
+
+
+class DataXrefs(_SweepIndex):
+    ''' Constant-address data space accesses of one flash image '''
+    kinds_names = Kinds
+
+    def __init__(self, data, base=0, device=None):
+        self.device = device if device is not None else current_device()
+        _SweepIndex.__init__(self, data, base)
+
+    def _entries(self, sweep):
+        return data_accesses(sweep, self.device.io_base)
+
+    def _address(self, register):
+        if isinstance(register, numbers.Integral):
+            return register
+        address = self.device.register_address(register)
+        if address is None:
+            raise ValueError('{} has no register {}'.format(self.device.name, register))
+        return address
+
+    def references(self, register, end=None):
+        ''' Sorted (instruction address, kind) of the accesses to a register name or data address.
+
+        With end, every access to a data address in [register, end) is
+        returned, such as all bytes of a multi-byte SRAM global.
+        '''
+        start = self._address(register)
+        return self._references(start, self._address(end) if end is not None else start + 1)
+
+
+class CodeXrefs(_SweepIndex):
+    ''' Direct branches, jumps, calls and skips of one flash image, by target '''
+    kinds_names = CodeKinds
+
+    def _entries(self, sweep):
+        return code_references(sweep)
+
+    def references(self, address, end=None):
+        ''' Sorted (instruction address, kind) of the references to address, or to [address, end) '''
+        return self._references(address, end if end is not None else address + 1)
+
+    def callers(self, address):
+        ''' Addresses of the calls to address '''
+        return [source for source, kind in self.references(address) if kind == 'call']
+
+    def call_targets(self):
+        ''' Sorted addresses called from anywhere in the image '''
+        return np.unique(self.targets[self.kinds == CodeKinds.index('call')]).tolist()
+
+    def misaligned(self):
+        ''' (source, target, kind) of the references to addresses inside the image that are not
+        instruction starts of the sweep, which point at data decoded as code or at a misaligned sweep '''
+        inside = (self.targets >= self.base) & (self.targets < self.base + self.size)
+        selected = inside & ~np.isin(self.targets, self.starts)
+        return [(int(source), int(target), CodeKinds[kind]) for target, source, kind in
+                zip(self.targets[selected], self.sources[selected], self.kinds[selected])]
@@ -0,0 +1,290 @@
+''' Micro-benchmarks for the decoder and the architecture callbacks.
+
+Runs decode(), AVR.decode_instruction, perform_get_instruction_info and
+perform_get_instruction_text over the whole 16-bit opcode space and over
+firmware images, with binaryninja replaced by bench/binja_stub.py.
+
+    python bench/bench_callbacks.py --save baseline.json
+    python bench/bench_callbacks.py --compare baseline.json --threshold 0.15
+    python bench/bench_callbacks.py --image firmware.hex
+
+Reports the median ns per instruction over the timing runs, how much the
+runs spread around it, the peak bytes allocated during a call and the
+memory blocks still allocated per call while the results are kept alive
+(both from tracemalloc). Before timing, cached decodes of skip instructions
+are checked against decode() with the next word patched, and the run fails
+on any mismatch. --compare exits with status 1 when any case got slower
+than the baseline by more than the threshold plus the spread measured in
+both runs, with the spread counting for at most half the threshold so a
+noisy run cannot hide a real regression.
+'''
+from __future__ import print_function
+
+import argparse
+import binascii
+import gc
+import importlib
+import json
+import os
+import platform
+import random
+import struct
+import sys
+import timeit
+import tracemalloc
+import types
+
+import binja_stub
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = 'binja_avr'
+
+# Largest share of the regression threshold that run-to-run noise can add
+MAX_NOISE = 0.5
+
+# Rough instruction mix of avr-gcc output, used for the synthetic image
+SyntheticMix = {
+    'ldi': 14, 'mov': 6, 'movw': 6, 'lds': 5, 'sts': 5, 'ld': 6, 'ldd': 6,
+    'st': 4, 'std': 4, 'push': 4, 'pop': 4, 'rcall': 3, 'call': 4, 'ret': 2,
+    'rjmp': 3, 'jmp': 1, 'breq': 3, 'brne': 4, 'brcs': 1, 'brcc': 1, 'cp': 3,
+    'cpc': 3, 'cpi': 3, 'add': 3, 'adc': 3, 'sub': 2, 'sbc': 2, 'subi': 3,
+    'sbci': 3, 'and': 1, 'andi': 2, 'or': 1, 'ori': 1, 'eor': 2, 'in': 2,
+    'out': 2, 'sbi': 1, 'cbi': 1, 'sbrs': 1, 'sbrc': 1, 'lpm': 1, 'adiw': 1,
+    'sbiw': 1, 'lsl': 1, 'lsr': 1, 'ror': 1, 'rol': 1, 'mul': 1, 'com': 1,
+}
+
+
+def load_plugin():
+    ''' Import the plugin's arch module and headless core without running the plugin __init__ '''
+    binja_stub.install()
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [ROOT]
+    sys.modules[PACKAGE] = package
+    arch = importlib.import_module(PACKAGE + '.arch')
+    core = importlib.import_module(PACKAGE + '.avr')
+    disasm = importlib.import_module(PACKAGE + '.avr.disasm')
+    return arch, core, disasm
+
+
+def synthetic_image(core, size=0x10000, seed=0):
+    ''' Deterministic image drawn from SyntheticMix '''
+    rng = random.Random(seed)
+    forms = {}
+    for opcode in core.Opcodes[1:]:
+        if opcode.name in SyntheticMix:
+            forms.setdefault(opcode.name, []).append(opcode)
+    names = sorted(forms)
+    weights = [SyntheticMix[name] for name in names]
+
+    words = []
+    while len(words) < size // 2:
+        opcode = rng.choice(forms[rng.choices(names, weights)[0]])
+        word = opcode.match | (rng.getrandbits(16) & ~opcode.mask & 0xffff)
+        if core.OpcodeTable[word] is not opcode:
+            continue
+        words.append(word)
+        if opcode.length == 4:
+            words.append(rng.getrandbits(16))
+    return struct.pack('<{}H'.format(size // 2), *words[:size // 2])
+
+
+def opcode_space_inputs():
+    return [(struct.pack('<HH', word, 0), 0x100) for word in range(0x10000)]
+
+
+def image_inputs(disasm, image, base=0):
+    return [(bytes(image[offset:offset + 4]), base + offset)
+            for offset, _, _ in disasm.sweep(image, base=base)]
+
+
+def check_cache(arch, core, addr=0x200):
+    ''' Descriptions of the cached decodes that differ from decode() after the bytes around them change.
+
+    The target of a skip depends on the next instruction, so each skip is
+    decoded before a call, then looked up again with the call patched to a
+    nop, and decoded from its own word alone before the full bytes.
+    '''
+    call = [opcode for opcode in core.Opcodes[1:] if opcode.name == 'call'][0]
+    skips = [opcode for opcode in core.Opcodes[1:] if opcode.flags & core.SKIP]
+    failures = []
+    for skip in skips:
+        word = struct.pack('<H', skip.match)
+        for first, second in ((word + struct.pack('<H', call.match), word + b'\0\0'),
+                              (word, word + struct.pack('<H', call.match))):
+            arch.decode_cache.clear()
+            arch.decode_instruction(first, addr)
+            cached = arch.decode_instruction(second, addr)
+            expected = core.decode(second, addr)
+            if cached.target != expected.target:
+                failures.append('{} decoded from {} then {}: target {} instead of {}'.format(
+                    skip.name, binascii.hexlify(first).decode(), binascii.hexlify(second).decode(),
+                    cached.target, expected.target))
+    arch.decode_cache.clear()
+    return failures
+
+
+def measure(function, inputs, repeat, setup=None):
+    ''' (median ns per input, half the range of the runs relative to the median) '''
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = timeit.default_timer()
+        for data, addr in inputs:
+            function(data, addr)
+        times.append(timeit.default_timer() - start)
+    times.sort()
+    middle = len(times) // 2
+    median = times[middle] if len(times) % 2 else (times[middle - 1] + times[middle]) / 2
+    return median / len(inputs) * 1e9, (times[-1] - times[0]) / 2 / median
+
+
+def allocations_per_call(function, inputs, setup=None):
+    ''' (peak bytes allocated during a call, blocks still allocated after it) averaged over inputs.
+
+    CPython has no count of allocations, so tracemalloc's peak stands in
+    for memory allocated and freed within a call; the results are kept
+    alive so blocks they hold count as retained.
+    '''
+    if setup is not None:
+        setup()
+    results = [None] * len(inputs)
+    gc.collect()
+    tracemalloc.start()
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    before = tracemalloc.take_snapshot().filter_traces(ignore)
+    peak = 0
+    for i, (data, addr) in enumerate(inputs):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        results[i] = function(data, addr)
+        peak += tracemalloc.get_traced_memory()[1] - current
+    after = tracemalloc.take_snapshot().filter_traces(ignore)
+    tracemalloc.stop()
+    retained = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    del results
+    return float(peak) / len(inputs), float(retained) / len(inputs)
+
+
+def run(images, repeat):
+    arch_module, core, disasm = load_plugin()
+    arch = arch_module.AVR()
+    cache = arch.decode_cache
+    cache_size = cache.size
+
+    def uncached():
+        cache.resize(0)
+        cache.clear()
+
+    def cached(inputs):
+        def setup():
+            cache.resize(len(inputs))
+            cache.clear()
+            for data, addr in inputs:
+                arch.decode_instruction(data, addr)
+        return setup
+
+    inputs = [('opcode-space', opcode_space_inputs())]
+    inputs.append(('synthetic-64k', image_inputs(disasm, synthetic_image(core))))
+    for path in images:
+        base, image = disasm.load_image(path)
+        inputs.append((os.path.basename(path), image_inputs(disasm, image, base)))
+
+    results = {}
+    for input_name, data in inputs:
+        cases = [
+            ('decode', core.decode, None),
+            ('decode_instruction', arch.decode_instruction, uncached),
+            ('perform_get_instruction_info', arch.perform_get_instruction_info, uncached),
+            ('perform_get_instruction_text', arch.perform_get_instruction_text, uncached),
+        ]
+        # The cache is keyed by address, so it only serves inputs at distinct
+        # addresses (not the opcode space, which is all decoded at one)
+        if len(set(addr for _, addr in data)) == len(data):
+            cases.extend([
+                ('decode_instruction[cached]', arch.decode_instruction, cached(data)),
+                ('perform_get_instruction_info[cached]', arch.perform_get_instruction_info, cached(data)),
+                ('perform_get_instruction_text[cached]', arch.perform_get_instruction_text, cached(data)),
+            ])
+        for case_name, function, setup in cases:
+            name = '{}/{}'.format(input_name, case_name)
+            ns, spread = measure(function, data, repeat, setup)
+            peak_bytes, blocks = allocations_per_call(function, data, setup)
+            results[name] = {
+                'ns_per_instruction': ns,
+                'spread': spread,
+                'peak_bytes_per_call': peak_bytes,
+                'blocks_per_call': blocks,
+                'instructions': len(data)
+            }
+            print('{:64s} {:10.1f} ns {:>6} {:8.1f} B peak {:6.2f} blocks'.format(
+                name, ns, '+-{:.0%}'.format(spread), peak_bytes, blocks))
+
+    cache.resize(cache_size)
+    return results
+
+
+def compare(results, baseline, threshold):
+    ''' Print the change against baseline and return the names of regressed cases.
+
+    A case regressed when it got slower by more than threshold plus the
+    spread of its runs in both the baseline and the results, where the
+    spread allows at most MAX_NOISE times threshold.
+    '''
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        before = baseline[name]['ns_per_instruction']
+        after = results[name]['ns_per_instruction']
+        change = after / before - 1
+        # Baselines saved before spreads were recorded count as noise-free
+        noise = baseline[name].get('spread', 0) + results[name]['spread']
+        allowed = threshold + min(noise, MAX_NOISE * threshold)
+        regressed = change > allowed
+        if regressed:
+            regressions.append(name)
+        print('{:64s} {:+7.1%} (allowed {:+.1%}){}'.format(name, change, allowed, '  REGRESSION' if regressed else ''))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the AVR decoder and architecture callbacks')
+    parser.add_argument('--image', action='append', default=[], help='raw or Intel HEX firmware image to include (repeatable)')
+    parser.add_argument('--repeat', type=int, default=7, help='timing runs per case; the median is reported')
+    parser.add_argument('--save', help='write the results to this JSON baseline')
+    parser.add_argument('--compare', help='JSON baseline to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown before a case counts as a regression (default: 0.2)')
+    args = parser.parse_args(argv)
+
+    arch_module, core, _ = load_plugin()
+    failures = check_cache(arch_module.AVR(), core)
+    for failure in failures:
+        print('stale cache entry: ' + failure)
+    if failures:
+        return 1
+
+    results = run(args.image, args.repeat)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'results': results
+            }, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        print()
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('\n{} case(s) regressed by more than {:.0%}'.format(len(regressions), args.threshold))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+''' Throughput benchmark for the instruction set simulator.
+
+Assembles a few small routines, runs each in avr.sim.Simulator and reports
+simulated instructions per second next to the result, which is checked
+against the same computation in Python.
+
+    python bench/bench_sim.py
+    python bench/bench_sim.py --size 0x800 --repeat 5
+
+Exits with status 1 when a routine computes the wrong result.
+'''
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import struct
+import sys
+import timeit
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avr import Opcodes
+from avr.sim import Simulator
+
+DEVICE = 'atmega2560'
+# Where the routines are assembled and where their input is placed in flash
+CODE = 0x100
+TABLE = 0x1000
+
+
+def encode(name, suffix='', **fields):
+    ''' Word of the first 16-bit encoding of name ending in suffix, with each letter's bits filled from fields '''
+    for opcode in Opcodes[1:]:
+        if opcode.name == name and opcode.length == 2 and opcode.encoding.replace(' ', '').endswith(suffix):
+            break
+    else:
+        raise ValueError('no encoding for {} {}'.format(name, suffix))
+    bits = opcode.encoding.replace(' ', '')
+    counts = dict((letter, bits.count(letter)) for letter in set(bits) if letter not in '01')
+    word = 0
+    for bit in bits:
+        if bit in '01':
+            word = word << 1 | int(bit)
+        else:
+            counts[bit] -= 1
+            word = word << 1 | (fields[bit] >> counts[bit] & 1)
+    return [word]
+
+
+def ldi(register, value):
+    return encode('ldi', d=register - 16, K=value & 0xff)
+
+
+def assemble(lines):
+    ''' Words of lines, where a string defines a label and a callable gets the label dict and the word address '''
+    labels = {}
+    address = CODE // 2
+    for line in lines:
+        if isinstance(line, str):
+            labels[line] = address
+        else:
+            # Only the length matters here, so labels not defined yet read as 0
+            address += len(line(defaultdict(int), address) if callable(line) else line)
+    words = []
+    address = CODE // 2
+    for line in lines:
+        if not isinstance(line, str):
+            line = line(labels, address) if callable(line) else line
+            words.extend(line)
+            address += len(line)
+    return struct.pack('<{}H'.format(len(words)), *words)
+
+
+def branch(name, label):
+    return lambda labels, address: encode(name, k=(labels[label] - address - 1) & 0x7f)
+
+
+def checksum_routine(size):
+    ''' r25:r24 = 16-bit sum of size bytes at TABLE, rotated left once per byte '''
+    return [
+        ldi(30, TABLE), ldi(31, TABLE >> 8),
+        ldi(26, size), ldi(27, size >> 8),
+        encode('eor', d=24, r=24), encode('eor', d=25, r=25), encode('eor', d=1, r=1),
+        'loop',
+        encode('lpm', '0101', d=0),
+        encode('lsl', d=24, r=24), encode('rol', d=25, r=25), encode('adc', d=24, r=1),
+        encode('add', d=24, r=0), encode('adc', d=25, r=1),
+        encode('sbiw', d=1, K=1),
+        branch('brne', 'loop'),
+        encode('ret'),
+    ]
+
+
+def checksum(data):
+    value = 0
+    for byte in data:
+        value = (value << 1 | value >> 15) & 0xffff
+        value = (value + byte) & 0xffff
+    return value
+
+
+def crc_routine(size):
+    ''' r25:r24 = CRC-16/XMODEM of size bytes at TABLE, bit by bit '''
+    return [
+        ldi(30, TABLE), ldi(31, TABLE >> 8),
+        ldi(26, size), ldi(27, size >> 8),
+        encode('eor', d=24, r=24), encode('eor', d=25, r=25),
+        ldi(18, 0x21), ldi(19, 0x10),
+        'byte',
+        encode('lpm', '0101', d=0),
+        encode('eor', d=25, r=0),
+        ldi(20, 8),
+        'bit',
+        encode('lsl', d=24, r=24), encode('rol', d=25, r=25),
+        branch('brcc', 'next'),
+        encode('eor', d=24, r=18), encode('eor', d=25, r=19),
+        'next',
+        encode('dec', d=20),
+        branch('brne', 'bit'),
+        encode('sbiw', d=1, K=1),
+        branch('brne', 'byte'),
+        encode('ret'),
+    ]
+
+
+def crc(data):
+    value = 0
+    for byte in data:
+        value ^= byte << 8
+        for _ in range(8):
+            value = (value << 1) ^ (0x1021 if value & 0x8000 else 0)
+            value &= 0xffff
+    return value
+
+
+def copy_routine(size):
+    ''' Copy size bytes from TABLE in flash to SRAM at 0x200 with push/pop and a call per byte, returning r25:r24 = last byte '''
+    return [
+        ldi(30, TABLE), ldi(31, TABLE >> 8),
+        ldi(28, 0x00), ldi(29, 0x02),
+        ldi(26, size), ldi(27, size >> 8),
+        'loop',
+        lambda labels, address: encode('rcall', k=(labels['store'] - address - 1) & 0xfff),
+        encode('sbiw', d=1, K=1),
+        branch('brne', 'loop'),
+        encode('ld', '1010', d=24),
+        encode('eor', d=25, r=25),
+        encode('ret'),
+        'store',
+        encode('push', r=16),
+        encode('lpm', '0101', d=16),
+        encode('st', '1001', r=16),
+        encode('pop', d=16),
+        encode('ret'),
+    ]
+
+
+Routines = [
+    ('checksum', checksum_routine, checksum),
+    ('crc16', crc_routine, crc),
+    ('copy', copy_routine, lambda data: data[-1]),
+]
+
+
+def run(size, repeat):
+    rng = random.Random(0)
+    data = bytearray(rng.getrandbits(8) for _ in range(size))
+    failed = False
+    print('{:<12} {:>12} {:>12} {:>10}  {}'.format('routine', 'instructions', 'per second', 'blocks', 'result'))
+    for name, routine, reference in Routines:
+        sim = Simulator(device=DEVICE)
+        sim.load(assemble(routine(size)), CODE)
+        sim.load(bytes(data), TABLE)
+
+        best = None
+        for _ in range(repeat):
+            sim.reset()
+            start = timeit.default_timer()
+            executed = sim.call(CODE)
+            elapsed = timeit.default_timer() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        result = sim.pair(24)
+        expected = reference(data)
+        ok = result == expected
+        failed = failed or not ok
+        print('{:<12} {:>12d} {:>12.0f} {:>10d}  0x{:04x}{}'.format(
+            name, executed, executed / best, len(sim._blocks), result,
+            '' if ok else ' MISMATCH, expected 0x{:04x}'.format(expected)))
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the AVR instruction set simulator')
+    parser.add_argument('--size', type=lambda value: int(value, 0), default=0x1000, help='input bytes per routine (at most 0x1000)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per routine; the fastest is reported')
+    args = parser.parse_args(argv)
+    return run(args.size, args.repeat)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+''' Concurrent stress benchmark for the architecture callbacks.
+
+Binary Ninja calls perform_get_instruction_info and perform_get_instruction_text
+from several analysis threads at once. This runs them from 1, 2, 4, ... N
+threads over the same image, with binaryninja replaced by
+bench/binja_stub.py, and reports throughput and its scaling against one
+thread. Every result is checked against a single-threaded reference, so a
+cache or table corrupted by concurrent use fails the run.
+
+    python bench/bench_threads.py --threads 8
+    python bench/bench_threads.py --cache-size 256     # force evictions
+
+Under CPython's GIL pure-Python callbacks cannot run in parallel, so the
+interesting numbers are how little throughput drops as threads are added.
+'''
+from __future__ import print_function
+
+import argparse
+import sys
+import threading
+import timeit
+
+from bench_callbacks import load_plugin, synthetic_image, image_inputs
+
+CALLBACKS = ('perform_get_instruction_info', 'perform_get_instruction_text')
+
+
+def describe(result):
+    ''' Comparable form of a callback result '''
+    if result is None:
+        return None
+    if isinstance(result, tuple):
+        tokens, length = result
+        return tuple((token.type, token.text, token.value) for token in tokens), length
+    return result.length, tuple(result.branches)
+
+
+def reference(arch, inputs):
+    return dict((name, [describe(getattr(arch, name)(data, addr)) for data, addr in inputs]) for name in CALLBACKS)
+
+
+def hammer(arch, inputs, expected, rounds, offset, errors):
+    ''' One worker: every callback over every input, starting at a different offset per thread '''
+    count = len(inputs)
+    callbacks = [(getattr(arch, name), expected[name]) for name in CALLBACKS]
+    for _ in range(rounds):
+        for i in range(count):
+            j = (i + offset) % count
+            data, addr = inputs[j]
+            for callback, results in callbacks:
+                if describe(callback(data, addr)) != results[j]:
+                    errors.append((callback.__name__, addr))
+                    return
+
+
+def run(threads, rounds, cache_size, size):
+    arch_module, core, disasm = load_plugin()
+    arch = arch_module.AVR()
+    arch.decode_cache.resize(cache_size)
+    inputs = image_inputs(disasm, synthetic_image(core, size))
+    expected = reference(arch, inputs)
+
+    counts = []
+    count = 1
+    while count <= threads:
+        counts.append(count)
+        count *= 2
+    if counts[-1] != threads:
+        counts.append(threads)
+
+    results = []
+    for count in counts:
+        arch.decode_cache.clear()
+        errors = []
+        workers = [threading.Thread(target=hammer, args=(arch, inputs, expected, rounds, i * len(inputs) // count, errors))
+                   for i in range(count)]
+        start = timeit.default_timer()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = timeit.default_timer() - start
+
+        calls = count * rounds * len(inputs) * len(CALLBACKS)
+        results.append((count, calls / elapsed, arch.decode_cache.stats(), errors))
+
+    single = results[0][1]
+    print('{:>8} {:>14} {:>8}  {}'.format('threads', 'calls/s', 'scaling', 'cache'))
+    for count, throughput, stats, errors in results:
+        print('{:>8d} {:>14.0f} {:>7.2f}x  {}{}'.format(
+            count, throughput, throughput / single, stats,
+            '  MISMATCH at {} 0x{:x}'.format(*errors[0]) if errors else ''))
+
+    return 1 if any(errors for _, _, _, errors in results) else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stress the AVR architecture callbacks from many threads')
+    parser.add_argument('--threads', type=int, default=8, help='largest number of threads (default: 8)')
+    parser.add_argument('--rounds', type=int, default=2, help='passes over the image per thread')
+    parser.add_argument('--cache-size', type=lambda value: int(value, 0), default=4096, help='decode cache entries per generation; up to twice as many are held (default: 4096)')
+    parser.add_argument('--size', type=lambda value: int(value, 0), default=0x4000, help='synthetic image size in bytes')
+    args = parser.parse_args(argv)
+    return run(args.threads, args.rounds, args.cache_size, args.size)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+''' Stand-in for the binaryninja module so the architecture callbacks can be
+benchmarked headless.
+
+The classes the callbacks touch on their hot paths (InstructionInfo,
+InstructionTextToken, the token and branch enums) are cheap plain-Python
+objects; any other name resolves to a generic placeholder.
+'''
+from __future__ import print_function
+
+import sys
+import types
+
+
+class _Enum(object):
+    ''' Attribute access returns the attribute name, like an enum member '''
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return name
+
+    def __getitem__(self, name):
+        return name
+
+
+class _Placeholder(object):
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return _Placeholder()
+
+    def __call__(self, *args, **kwargs):
+        return _Placeholder()
+
+    def __getitem__(self, name):
+        return _Placeholder()
+
+    def __or__(self, other):
+        return self
+
+    __ror__ = __or__
+
+
+class Architecture(object):
+    def __init__(self, *args, **kwargs):
+        pass
+
+    @classmethod
+    def register(cls):
+        pass
+
+
+class RegisterInfo(object):
+    def __init__(self, name, size, offset=0, extend=None):
+        self.name = name
+        self.size = size
+        self.offset = offset
+        self.extend = extend
+
+
+class InstructionInfo(object):
+    def __init__(self):
+        self.length = 0
+        self.branches = []
+
+    def add_branch(self, branch_type, target=0, arch=None):
+        self.branches.append((branch_type, target))
+
+
+class InstructionTextToken(object):
+    def __init__(self, token_type, text, value=0, size=0, operand=0xffffffff):
+        self.type = token_type
+        self.text = text
+        self.value = value
+
+
+def log(*args, **kwargs):
+    pass
+
+
+def install():
+    ''' Register the stub as the binaryninja module and return it '''
+    module = types.ModuleType('binaryninja')
+    module.Architecture = Architecture
+    module.RegisterInfo = RegisterInfo
+    module.InstructionInfo = InstructionInfo
+    module.InstructionTextToken = InstructionTextToken
+    for name in ('log_error', 'log_warn', 'log_info', 'log_debug', 'log_alert'):
+        setattr(module, name, log)
+    for name in ('InstructionTextTokenType', 'BranchType', 'FlagRole', 'LowLevelILFlagCondition',
+                 'LowLevelILOperation', 'SegmentFlag', 'SectionSemantics', 'Endianness',
+                 'SymbolType', 'ImplicitRegisterExtend'):
+        setattr(module, name, _Enum(name))
+
+    def __getattr__(name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return _Placeholder
+
+    module.__getattr__ = __getattr__
+    sys.modules['binaryninja'] = module
+    return module
@@ -0,0 +1,123 @@
+from __future__ import print_function
+
+from binaryninja import get_choice_input, get_save_filename_input, get_text_line_input, log_info
+
+from .analysis import (
+    add_signature_functions, add_vector_functions, resolve_indirect_branches, apply_indirect_branches,
+
+    annotate_cycles, forget_data_xrefs, register_references, code_references,
+    misaligned_targets, define_progmem_objects)
+from .arch import AVR
+from .avr import available_devices, current_device, select_device
+from .avr.profiling import Profiler
+
+# Callback counters of the AVR architecture, also usable from the Python console
+profiler = Profiler(AVR)
+
+
+def select_device_command(bv):
+    ''' Ask for the MCU whose register names and I/O layout are used '''
+    devices = available_devices()
+    current = current_device().name
+    choice = get_choice_input('Device (currently {})'.format(current), 'AVR device', devices)
+    if choice is None:
+        return
+    device = select_device(devices[choice])
+    log_info('AVR device: {}'.format(device.name))
+    # I/O addresses in the index depend on the device
+    forget_data_xrefs(bv)
+    # The vector table layout depends on the device
+    add_vector_functions(bv)
+    bv.reanalyze()
+
+
+def find_functions_command(bv):
+    ''' Add functions at every avr-gcc prologue signature in flash '''
+    added = add_signature_functions(bv)
+    log_info('AVR: {} function(s) found by signature'.format(added))
+    bv.update_analysis()
+
+
+def resolve_indirect_command(bv):
+    ''' Set the targets of switch tables and function pointer calls found from how Z is built '''
+    resolved = resolve_indirect_branches(bv)
+    applied = apply_indirect_branches(bv, resolved)
+    log_info('AVR: {} indirect branch(es) resolved, {} set on functions'.format(len(resolved), applied))
+    bv.update_analysis()
+
+
+def register_references_command(bv):
+    ''' Log every instruction accessing an I/O register or data address with a constant address '''
+    text = get_text_line_input('Register name or data address', 'AVR register references')
+    if not text:
+        return
+    if not isinstance(text, str):
+        text = text.decode('utf-8')
+    text = text.strip()
+    try:
+        register = int(text, 0)
+    except ValueError:
+        register = text
+    try:
+        references = register_references(bv, register)
+    except ValueError as e:
+        log_info('AVR: {}'.format(e))
+        return
+    lines = ['0x{:x} {}'.format(address, kind) for address, kind in references]
+    log_info('AVR: {} reference(s) to {}\n{}'.format(len(references), text, '\n'.join(lines)))
+
+
+def progmem_command(bv):
+    ''' Define the strings and tables read with lpm/elpm or progmem helpers '''
+    defined = define_progmem_objects(bv)
+    log_info('AVR: {} progmem string(s) and table(s) defined'.format(defined))
+    bv.update_analysis()
+
+
+def code_references_command(bv, address):
+    ''' Log every direct call, jump, branch and skip reaching the current address '''
+    references = code_references(bv, address)
+    lines = ['0x{:x} {}'.format(source, kind) for source, kind in references]
+    log_info('AVR: {} reference(s) to 0x{:x}\n{}'.format(len(references), address, '\n'.join(lines)))
+
+
+def misaligned_targets_command(bv):
+    ''' Log the direct branches and calls whose target is inside an instruction of the linear sweep '''
+    misaligned = misaligned_targets(bv)
+    lines = ['0x{:x} -> 0x{:x} {}'.format(source, target, kind) for source, target, kind in misaligned]
+    log_info('AVR: {} reference(s) into the middle of an instruction\n{}'.format(len(misaligned), '\n'.join(lines)))
+
+
+def annotate_cycles_command(bv):
+    ''' Comment basic blocks and interrupt handlers with their cycle counts '''
+    annotated = annotate_cycles(bv)
+    log_info('AVR: {} basic block(s) annotated with cycle counts for {}'.format(annotated, current_device().name))
+
+
+def start_profiling_command(bv):
+    ''' Start counting and timing the architecture callbacks '''
+    profiler.start()
+    log_info('AVR: profiling started')
+
+
+def stop_profiling_command(bv):
+    ''' Stop profiling and show the report '''
+    profiler.stop()
+    log_info('AVR profile:\n' + profiler.table())
+
+
+def show_profile_command(bv):
+    log_info('AVR profile:\n' + profiler.table())
+
+
+def save_profile_command(bv):
+    filename = get_save_filename_input('Save AVR profile', 'json', 'avr-profile.json')
+    if not filename:
+        return
+    with open(filename, 'w') as f:
+        f.write(profiler.json(indent=2))
+    log_info('AVR profile saved to {}'.format(filename))
+
+
+def reset_profile_command(bv):
+    profiler.reset()
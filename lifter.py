@@ -0,0 +1,705 @@
+''' Low level IL lifting for the AVR architecture.
+
+LifterTable maps every opcode ID to the function that lifts it, so lifting an
+instruction is one list lookup and one call. Lifters take the LLIL function,
+the DecodedInstruction and its byte address, and append their expressions.
+
+Registers r0-r31 are lifted as registers rather than as their data space
+aliases. Data space accesses (ld/st/lds/sts/in/out) address memory at
+DATA_SPACE_BASE + address, where the loaders map SRAM; program memory (lpm,
+elpm) is addressed from 0.
+
+Flags are only computed when Binary Ninja finds a use for them: flag_il
+returns the expression for one flag of one flag-setting operation, and S, V
+and H are derived from the operands only when that flag is read.
+'''
+from __future__ import print_function
+
+import numbers
+
+from binaryninja import LowLevelILLabel, LLIL_TEMP, LowLevelILOperation, LowLevelILFlagCondition
+
+from .avr import REGISTER, Opcodes, Registers
+from .avr.memory import DATA_SPACE_BASE
+from .avr.devices import current_device
+
+# Size of code and data space pointers, which include the DATA_SPACE_BASE
+# offset and 22-bit program counters
+POINTER_SIZE = 3
+
+# I/O addresses; I/O register A is data space address io_base + A of the
+# selected device
+SPL = 0x3d
+SPH = 0x3e
+RAMPZ = 0x3b
+EIND = 0x3c
+
+# Low register of the X, Y and Z pointer pairs and the post increment (1) or
+# pre decrement (-1) applied, indexed by INDIR_ADDR operand value
+Pointers = [
+    (26, 0), (26, 1), (26, -1),  # x, x+, -x
+    (28, 0), (28, 1), (28, -1),  # y, y+, -y
+    (30, 0), (30, 1), (30, -1)   # z, z+, -z
+]
+Y_LOW = 28
+Z_LOW = 30
+
+
+def _reg(il, n):
+    return il.reg(1, Registers[n])
+
+
+def _set_reg(il, n, value):
+    il.append(il.set_reg(1, Registers[n], value))
+
+
+def _pair(il, low):
+    return il.reg_split(2, Registers[low + 1], Registers[low])
+
+
+def _set_pair(il, low, value):
+    il.append(il.set_reg_split(2, Registers[low + 1], Registers[low], value))
+
+
+def _src(il, decoded):
+    ''' Rr or K operand '''
+    if decoded.src_operand_type == REGISTER:
+        return _reg(il, decoded.src)
+    return il.const(1, decoded.src)
+
+
+def _mask(decoded):
+    return 1 << decoded.src
+
+
+def _data_address(il, offset):
+    return il.add(POINTER_SIZE, il.const_pointer(POINTER_SIZE, DATA_SPACE_BASE), il.zero_extend(POINTER_SIZE, offset))
+
+
+def _data_pointer(address):
+    return DATA_SPACE_BASE + address
+
+
+def _io_read(il, a):
+    sp = il.reg(2, 'SP')
+    if a == SPL:
+        return il.low_part(1, sp)
+    elif a == SPH:
+        return il.low_part(1, il.logical_shift_right(2, sp, il.const(1, 8)))
+    return il.load(1, il.const_pointer(POINTER_SIZE, _data_pointer(current_device().io_base + a)))
+
+
+def _io_write(il, a, value):
+    sp = il.reg(2, 'SP')
+    if a == SPL:
+        return il.set_reg(2, 'SP', il.or_expr(2, il.and_expr(2, sp, il.const(2, 0xff00)), il.zero_extend(2, value)))
+    elif a == SPH:
+        return il.set_reg(2, 'SP', il.or_expr(2, il.and_expr(2, sp, il.const(2, 0x00ff)),
+                                              il.shift_left(2, il.zero_extend(2, value), il.const(1, 8))))
+    return il.store(1, il.const_pointer(POINTER_SIZE, _data_pointer(current_device().io_base + a)), value)
+
+
+def _program_address(il, high=None):
+    ''' Byte address in program memory held in Z, extended by an I/O register for elpm '''
+    address = il.zero_extend(POINTER_SIZE, _pair(il, Z_LOW))
+    if high is None:
+        return address
+    return il.or_expr(POINTER_SIZE, il.shift_left(POINTER_SIZE, il.zero_extend(POINTER_SIZE, _io_read(il, high)), il.const(1, 16)), address)
+
+
+def _code_address(il, high=None):
+    ''' Byte address of the word address held in Z, extended by an I/O register for eijmp/eicall '''
+    return il.shift_left(POINTER_SIZE, _program_address(il, high), il.const(1, 1))
+
+
+def _indirect(il, operand, access):
+    ''' Apply the pre decrement or post increment of a pointer operand around access(pointer) '''
+    low, step = Pointers[operand]
+    if step < 0:
+        _set_pair(il, low, il.sub(2, _pair(il, low), il.const(2, 1)))
+    access(_pair(il, low))
+    if step > 0:
+        _set_pair(il, low, il.add(2, _pair(il, low), il.const(2, 1)))
+
+
+def _displacement(il, value):
+    ''' Y+q or Z+q address of an ldd/std DISPLACEMENT operand '''
+    low = Y_LOW if value & 0x40 else Z_LOW
+    return _data_address(il, il.add(2, _pair(il, low), il.const(2, value & 0x3f)))
+
+
+def _jump(il, target):
+    label = il.get_label_for_address(il.arch, target)
+    if label is not None:
+        return il.goto(label)
+    return il.jump(il.const_pointer(POINTER_SIZE, target))
+
+
+def _branch(il, condition, target, fallthrough):
+    true_label = il.get_label_for_address(il.arch, target)
+    false_label = il.get_label_for_address(il.arch, fallthrough)
+    mark_true = true_label is None
+    mark_false = false_label is None
+    if mark_true:
+        true_label = LowLevelILLabel()
+    if mark_false:
+        false_label = LowLevelILLabel()
+
+    il.append(il.if_expr(condition, true_label, false_label))
+
+    if mark_true:
+        il.mark_label(true_label)
+        il.append(il.jump(il.const_pointer(POINTER_SIZE, target)))
+    if mark_false:
+        il.mark_label(false_label)
+
+
+def _skip(condition):
+    ''' cpse/sbrc/sbrs/sbic/sbis: skip the following instruction when condition holds '''
+    def lift(il, decoded, addr):
+        # decoded.target is only unknown when the following word was not
+        # available; assume a 16-bit instruction then
+        target = decoded.target if decoded.target is not None else addr + 2*2
+        _branch(il, condition(il, decoded), target, addr + 1*2)
+    return lift
+
+
+def _bit_clear(il, value, decoded):
+    return il.compare_equal(1, il.and_expr(1, value, il.const(1, _mask(decoded))), il.const(1, 0))
+
+
+def _bit_set(il, value, decoded):
+    return il.compare_not_equal(1, il.and_expr(1, value, il.const(1, _mask(decoded))), il.const(1, 0))
+
+
+def _alu(operation, flags, carry=False, store=True):
+    ''' Rd = Rd op Rr/K, or only the flags of it when store is False '''
+    def lift(il, decoded, addr):
+        args = [1, _reg(il, decoded.dst), _src(il, decoded)]
+        if carry:
+            args.append(il.flag('C'))
+        value = getattr(il, operation)(*args, flags=flags)
+        if store:
+            _set_reg(il, decoded.dst, value)
+        else:
+            il.append(value)
+    return lift
+
+
+def _unary(operation, flags, *args):
+    ''' Rd = op Rd, with any constant operands (shift counts) '''
+    def lift(il, decoded, addr):
+        operands = [il.const(1, value) for value in args]
+        _set_reg(il, decoded.dst, getattr(il, operation)(1, _reg(il, decoded.dst), *operands, flags=flags))
+    return lift
+
+
+def _rotate(operation, flags):
+    ''' Rd rotated by one bit through C '''
+    def lift(il, decoded, addr):
+        _set_reg(il, decoded.dst, getattr(il, operation)(1, _reg(il, decoded.dst), il.const(1, 1), il.flag('C'), flags=flags))
+    return lift
+
+
+def _word(operation):
+    ''' adiw/sbiw on a register pair '''
+    def lift(il, decoded, addr):
+        _set_pair(il, decoded.dst, getattr(il, operation)(2, _pair(il, decoded.dst), il.const(2, decoded.src), flags='svnzc'))
+    return lift
+
+
+def _multiply(dst_extend, src_extend, fractional=False):
+    ''' r1:r0 = Rd * Rr, shifted left once for the fractional forms '''
+    def lift(il, decoded, addr):
+        product = il.mult(2, getattr(il, dst_extend)(2, _reg(il, decoded.dst)),
+                          getattr(il, src_extend)(2, _reg(il, decoded.src)),
+                          flags=None if fractional else 'zc')
+        if fractional:
+            product = il.shift_left(2, product, il.const(1, 1), flags='zc')
+        il.append(il.set_reg_split(2, 'r1', 'r0', product))
+    return lift
+
+
+def _set_flag(flag, value):
+    def lift(il, decoded, addr):
+        il.append(il.set_flag(flag, il.const(0, value)))
+    return lift
+
+
+def _conditional(flag, value):
+    ''' brXX on one SREG flag being set (value 1) or clear (value 0) '''
+    def lift(il, decoded, addr):
+        condition = il.flag(flag)
+        if not value:
+            condition = il.not_expr(0, condition)
+        _branch(il, condition, decoded.target, addr + 1*2)
+    return lift
+
+
+def _flag_condition(condition):
+    ''' brXX on a flag condition Binary Ninja can lift to a comparison '''
+    def lift(il, decoded, addr):
+        _branch(il, il.flag_condition(condition), decoded.target, addr + 1*2)
+    return lift
+
+
+def _append(expression):
+    def lift(il, decoded, addr):
+        il.append(getattr(il, expression)())
+    return lift
+
+
+def lift_nop(il, decoded, addr):
+    il.append(il.nop())
+
+
+def lift_movw(il, decoded, addr):
+    _set_pair(il, decoded.dst, _pair(il, decoded.src))
+
+
+def lift_mov(il, decoded, addr):
+    _set_reg(il, decoded.dst, _reg(il, decoded.src))
+
+
+def lift_ldi(il, decoded, addr):
+    _set_reg(il, decoded.dst, il.const(1, decoded.src))
+
+
+def lift_com(il, decoded, addr):
+    _set_reg(il, decoded.dst, il.not_expr(1, _reg(il, decoded.dst), flags='svnz'))
+    il.append(il.set_flag('C', il.const(0, 1)))
+
+
+def lift_neg(il, decoded, addr):
+    _set_reg(il, decoded.dst, il.neg_expr(1, _reg(il, decoded.dst), flags='hsvnzc'))
+
+
+def lift_swap(il, decoded, addr):
+    _set_reg(il, decoded.dst, il.rotate_left(1, _reg(il, decoded.dst), il.const(1, 4)))
+
+
+def lift_ld(il, decoded, addr):
+    _indirect(il, decoded.src, lambda pointer: _set_reg(il, decoded.dst, il.load(1, _data_address(il, pointer))))
+
+
+def lift_st(il, decoded, addr):
+    _indirect(il, decoded.dst, lambda pointer: il.append(il.store(1, _data_address(il, pointer), _reg(il, decoded.src))))
+
+
+def lift_ldd(il, decoded, addr):
+    _set_reg(il, decoded.dst, il.load(1, _displacement(il, decoded.src)))
+
+
+def lift_std(il, decoded, addr):
+    il.append(il.store(1, _displacement(il, decoded.dst), _reg(il, decoded.src)))
+
+
+def lift_lds(il, decoded, addr):
+    _set_reg(il, decoded.dst, il.load(1, il.const_pointer(POINTER_SIZE, _data_pointer(decoded.src))))
+
+
+def lift_sts(il, decoded, addr):
+    il.append(il.store(1, il.const_pointer(POINTER_SIZE, _data_pointer(decoded.dst)), _reg(il, decoded.src)))
+
+
+def _program_load(high=None):
+    ''' lpm/elpm: the implied form loads r0 from (Z), the others Rd from Z or Z+ '''
+    def lift(il, decoded, addr):
+        if decoded.dst_operand_type is None:
+            _set_reg(il, 0, il.load(1, _program_address(il, high)))
+            return
+        _indirect(il, decoded.src, lambda pointer: _set_reg(il, decoded.dst, il.load(1, _program_address(il, high))))
+    return lift
+
+
+def _exchange(combine):
+    ''' xch/las/lac/lat: Rd is swapped with (Z) after combining it into memory '''
+    def lift(il, decoded, addr):
+        il.append(il.set_reg(1, LLIL_TEMP(0), il.load(1, _data_address(il, _pair(il, Z_LOW)))))
+        il.append(il.store(1, _data_address(il, _pair(il, Z_LOW)), combine(il, _reg(il, decoded.src), il.reg(1, LLIL_TEMP(0)))))
+        _set_reg(il, decoded.src, il.reg(1, LLIL_TEMP(0)))
+    return lift
+
+
+def lift_push(il, decoded, addr):
+    il.append(il.push(1, _reg(il, decoded.src)))
+
+
+def lift_pop(il, decoded, addr):
+    _set_reg(il, decoded.dst, il.pop(1))
+
+
+def lift_in(il, decoded, addr):
+    _set_reg(il, decoded.dst, _io_read(il, decoded.src))
+
+
+def lift_out(il, decoded, addr):
+    il.append(_io_write(il, decoded.dst, _reg(il, decoded.src)))
+
+
+def lift_cbi(il, decoded, addr):
+    il.append(_io_write(il, decoded.dst, il.and_expr(1, _io_read(il, decoded.dst), il.const(1, ~_mask(decoded) & 0xff))))
+
+
+def lift_sbi(il, decoded, addr):
+    il.append(_io_write(il, decoded.dst, il.or_expr(1, _io_read(il, decoded.dst), il.const(1, _mask(decoded)))))
+
+
+def lift_bst(il, decoded, addr):
+    il.append(il.set_flag('T', _bit_set(il, _reg(il, decoded.dst), decoded)))
+
+
+def lift_bld(il, decoded, addr):
+    cleared = il.and_expr(1, _reg(il, decoded.dst), il.const(1, ~_mask(decoded) & 0xff))
+    _set_reg(il, decoded.dst, il.or_expr(1, cleared, il.flag_bit(1, 'T', decoded.src)))
+
+
+def lift_jmp(il, decoded, addr):
+    il.append(_jump(il, decoded.target))
+
+
+def lift_call(il, decoded, addr):
+    il.append(il.call(il.const_pointer(POINTER_SIZE, decoded.target)))
+
+
+def lift_ijmp(il, decoded, addr):
+    il.append(il.jump(_code_address(il)))
+
+
+def lift_eijmp(il, decoded, addr):
+    il.append(il.jump(_code_address(il, EIND)))
+
+
+def lift_icall(il, decoded, addr):
+    il.append(il.call(_code_address(il)))
+
+
+def lift_eicall(il, decoded, addr):
+    il.append(il.call(_code_address(il, EIND)))
+
+
+def lift_ret(il, decoded, addr):
+    il.append(il.ret(il.pop(2)))
+
+
+def lift_reti(il, decoded, addr):
+    il.append(il.set_flag('I', il.const(0, 1)))
+    il.append(il.ret(il.pop(2)))
+
+
+def lift_unimplemented(il, decoded, addr):
+    il.append(il.unimplemented())
+
+
+InstructionIL = {
+    'nop': lift_nop,
+    'movw': lift_movw,
+    'muls': _multiply('sign_extend', 'sign_extend'),
+    'mulsu': _multiply('sign_extend', 'zero_extend'),
+    'fmul': _multiply('zero_extend', 'zero_extend', fractional=True),
+    'fmuls': _multiply('sign_extend', 'sign_extend', fractional=True),
+    'fmulsu': _multiply('sign_extend', 'zero_extend', fractional=True),
+    'mul': _multiply('zero_extend', 'zero_extend'),
+    'cpc': _alu('sub_borrow', 'hsvnzc', carry=True, store=False),
+    'sbc': _alu('sub_borrow', 'hsvnzc', carry=True),
+    'add': _alu('add', 'hsvnzc'),
+    'cpse': _skip(lambda il, decoded: il.compare_equal(1, _reg(il, decoded.dst), _reg(il, decoded.src))),
+    'cp': _alu('sub', 'hsvnzc', store=False),
+    'sub': _alu('sub', 'hsvnzc'),
+    'adc': _alu('add_carry', 'hsvnzc', carry=True),
+    'and': _alu('and_expr', 'svnz'),
+    'eor': _alu('xor_expr', 'svnz'),
+    'or': _alu('or_expr', 'svnz'),
+    'mov': lift_mov,
+    'cpi': _alu('sub', 'hsvnzc', store=False),
+    'sbci': _alu('sub_borrow', 'hsvnzc', carry=True),
+    'subi': _alu('sub', 'hsvnzc'),
+    'ori': _alu('or_expr', 'svnz'),
+    'andi': _alu('and_expr', 'svnz'),
+    'ld': lift_ld,
+    'ldd': lift_ldd,
+    'st': lift_st,
+    'std': lift_std,
+    'lds': lift_lds,
+    'sts': lift_sts,
+    'lpm': _program_load(),
+    'elpm': _program_load(RAMPZ),
+    'xch': _exchange(lambda il, register, memory: register),
+    'las': _exchange(lambda il, register, memory: il.or_expr(1, register, memory)),
+    'lac': _exchange(lambda il, register, memory: il.and_expr(1, il.not_expr(1, register), memory)),
+    'lat': _exchange(lambda il, register, memory: il.xor_expr(1, register, memory)),
+    'pop': lift_pop,
+    'push': lift_push,
+    'com': lift_com,
+    'neg': lift_neg,
+    'swap': lift_swap,
+    'inc': _unary('add', 'svnz', 1),
+    'dec': _unary('sub', 'svnz', 1),
+    'asr': _unary('arith_shift_right', 'svnzc', 1),
+    'lsr': _unary('logical_shift_right', 'svnzc', 1),
+    'lsl': _unary('shift_left', 'hsvnzc', 1),
+    'ror': _rotate('rotate_right_carry', 'svnzc'),
+    'rol': _rotate('rotate_left_carry', 'hsvnzc'),
+    'ret': lift_ret,
+    'reti': lift_reti,
+    'sleep': lift_nop,
+    'wdr': lift_nop,
+    'break': _append('breakpoint'),
+    'spm': lift_unimplemented,
+    'des': lift_unimplemented,
+    'ijmp': lift_ijmp,
+    'eijmp': lift_eijmp,
+    'icall': lift_icall,
+    'eicall': lift_eicall,
+    'jmp': lift_jmp,
+    'rjmp': lift_jmp,
+    'call': lift_call,
+    'rcall': lift_call,
+    'adiw': _word('add'),
+    'sbiw': _word('sub'),
+    'cbi': lift_cbi,
+    'sbi': lift_sbi,
+    'sbic': _skip(lambda il, decoded: _bit_clear(il, _io_read(il, decoded.dst), decoded)),
+    'sbis': _skip(lambda il, decoded: _bit_set(il, _io_read(il, decoded.dst), decoded)),
+    'in': lift_in,
+    'out': lift_out,
+    'ldi': lift_ldi,
+    'bld': lift_bld,
+    'bst': lift_bst,
+    'sbrc': _skip(lambda il, decoded: _bit_clear(il, _reg(il, decoded.dst), decoded)),
+    'sbrs': _skip(lambda il, decoded: _bit_set(il, _reg(il, decoded.dst), decoded)),
+}
+
+# sec/clc ... sei/cli, in SREG bit order
+for flag in 'CZNVSHTI':
+    InstructionIL['se' + flag.lower()] = _set_flag(flag, 1)
+    InstructionIL['cl' + flag.lower()] = _set_flag(flag, 0)
+
+# Branches on flags with a matching flag condition
+BranchConditions = {
+    'brcs': LowLevelILFlagCondition.LLFC_ULT,
+    'brcc': LowLevelILFlagCondition.LLFC_UGE,
+    'breq': LowLevelILFlagCondition.LLFC_E,
+    'brne': LowLevelILFlagCondition.LLFC_NE,
+    'brmi': LowLevelILFlagCondition.LLFC_NEG,
+    'brpl': LowLevelILFlagCondition.LLFC_POS,
+    'brvs': LowLevelILFlagCondition.LLFC_O,
+    'brvc': LowLevelILFlagCondition.LLFC_NO,
+    'brlt': LowLevelILFlagCondition.LLFC_SLT,
+    'brge': LowLevelILFlagCondition.LLFC_SGE
+}
+for name, condition in BranchConditions.items():
+    InstructionIL[name] = _flag_condition(condition)
+
+# brhs/brhc, brts/brtc, brie/brid
+for flag, set_name, clear_name in [('H', 'brhs', 'brhc'), ('T', 'brts', 'brtc'), ('I', 'brie', 'brid')]:
+    InstructionIL[set_name] = _conditional(flag, 1)
+    InstructionIL[clear_name] = _conditional(flag, 0)
+
+# Indexed by opcode ID
+LifterTable = [None] + [InstructionIL.get(opcode.name, lift_unimplemented) for opcode in Opcodes[1:]]
+
+
+def lift(il, decoded, addr):
+    ''' Append the LLIL for a DecodedInstruction at byte address addr '''
+    LifterTable[decoded.id](il, decoded, addr)
+
+
+def _operand(il, size, operand):
+    ''' Flag write operands are register names or constants '''
+    if isinstance(operand, numbers.Integral):
+        return il.const(size, operand)
+    return il.reg(size, operand)
+
+
+def _result(il, op, size, operands):
+    ''' Recompute the result of a flag-setting operation from its operands '''
+    a = _operand(il, size, operands[0])
+    if op in UnaryResults:
+        return getattr(il, UnaryResults[op])(size, a)
+    b = _operand(il, size, operands[1])
+    if op in CarryResults:
+        return getattr(il, CarryResults[op])(size, a, b, il.flag('C'))
+    return getattr(il, BinaryResults[op])(size, a, b)
+
+
+def _sign(il, size, value):
+    return il.compare_signed_less_than(size, value, il.const(size, 0))
+
+
+def _low_bit(il, size, value):
+    return il.compare_not_equal(size, il.and_expr(size, value, il.const(size, 1)), il.const(size, 0))
+
+
+def _nibble(il, operands, index):
+    return il.and_expr(1, _operand(il, 1, operands[index]), il.const(1, 0x0f))
+
+
+def _half_carry_add(arch, op, size, operands, il):
+    ''' Carry out of bit 3 '''
+    if op == LowLevelILOperation.LLIL_ADC:
+        total = il.add_carry(1, _nibble(il, operands, 0), _nibble(il, operands, 1), il.flag('C'))
+    else:
+        total = il.add(1, _nibble(il, operands, 0), _nibble(il, operands, 1))
+    return il.compare_not_equal(1, il.and_expr(1, total, il.const(1, 0x10)), il.const(1, 0))
+
+
+def _half_carry_sub(arch, op, size, operands, il):
+    ''' Borrow into bit 3 '''
+    if op == LowLevelILOperation.LLIL_SBB:
+        total = il.sub_borrow(1, _nibble(il, operands, 0), _nibble(il, operands, 1), il.flag('C'))
+    else:
+        total = il.sub(1, _nibble(il, operands, 0), _nibble(il, operands, 1))
+    return il.compare_not_equal(1, il.and_expr(1, total, il.const(1, 0x10)), il.const(1, 0))
+
+
+def _zero_chained(arch, op, size, operands, il):
+    ''' cpc/sbc/sbci only clear Z, so multi-byte compares test the whole value '''
+    return il.and_expr(0, il.flag('Z'), il.compare_equal(size, _result(il, op, size, operands), il.const(size, 0)))
+
+
+def _clear(arch, op, size, operands, il):
+    return il.const(0, 0)
+
+
+def _shifted_out_high(arch, op, size, operands, il):
+    return _sign(il, size, _operand(il, size, operands[0]))
+
+
+def _shifted_out_low(arch, op, size, operands, il):
+    return _low_bit(il, size, _operand(il, size, operands[0]))
+
+
+def _shift_overflow(arch, op, size, operands, il):
+    ''' V = N xor C after the shift '''
+    return il.xor_expr(0, flag_il(arch, op, size, 'N', operands, il), flag_il(arch, op, size, 'C', operands, il))
+
+
+def _bit3(arch, op, size, operands, il):
+    return il.compare_not_equal(1, il.and_expr(1, _operand(il, 1, operands[0]), il.const(1, 0x08)), il.const(1, 0))
+
+
+def _neg_carry(arch, op, size, operands, il):
+    return il.compare_not_equal(size, _operand(il, size, operands[0]), il.const(size, 0))
+
+
+def _neg_overflow(arch, op, size, operands, il):
+    return il.compare_equal(size, _operand(il, size, operands[0]), il.const(size, 1 << (size*8 - 1)))
+
+
+def _neg_half_carry(arch, op, size, operands, il):
+    return il.compare_not_equal(1, _nibble(il, operands, 0), il.const(1, 0))
+
+
+def _product_carry(arch, op, size, operands, il):
+    return _sign(il, size, _result(il, op, size, operands))
+
+
+UnaryResults = {
+    LowLevelILOperation.LLIL_NOT: 'not_expr',
+    LowLevelILOperation.LLIL_NEG: 'neg_expr'
+}
+CarryResults = {
+    LowLevelILOperation.LLIL_ADC: 'add_carry',
+    LowLevelILOperation.LLIL_SBB: 'sub_borrow',
+    LowLevelILOperation.LLIL_RLC: 'rotate_left_carry',
+    LowLevelILOperation.LLIL_RRC: 'rotate_right_carry'
+}
+BinaryResults = {
+    LowLevelILOperation.LLIL_ADD: 'add',
+    LowLevelILOperation.LLIL_SUB: 'sub',
+    LowLevelILOperation.LLIL_AND: 'and_expr',
+    LowLevelILOperation.LLIL_OR: 'or_expr',
+    LowLevelILOperation.LLIL_XOR: 'xor_expr',
+    LowLevelILOperation.LLIL_LSL: 'shift_left',
+    LowLevelILOperation.LLIL_LSR: 'logical_shift_right',
+    LowLevelILOperation.LLIL_ASR: 'arith_shift_right',
+    LowLevelILOperation.LLIL_MUL: 'mult'
+}
+
+# (operation, flag): flag expression where AVR differs from the default
+# semantics of the flag's role. S and H have no role and are always here.
+FlagIL = {
+    (LowLevelILOperation.LLIL_ADD, 'H'): _half_carry_add,
+    (LowLevelILOperation.LLIL_ADC, 'H'): _half_carry_add,
+    (LowLevelILOperation.LLIL_SUB, 'H'): _half_carry_sub,
+    (LowLevelILOperation.LLIL_SBB, 'H'): _half_carry_sub,
+    (LowLevelILOperation.LLIL_SBB, 'Z'): _zero_chained,
+    (LowLevelILOperation.LLIL_NEG, 'C'): _neg_carry,
+    (LowLevelILOperation.LLIL_NEG, 'V'): _neg_overflow,
+    (LowLevelILOperation.LLIL_NEG, 'H'): _neg_half_carry,
+    (LowLevelILOperation.LLIL_LSL, 'C'): _shifted_out_high,
+    (LowLevelILOperation.LLIL_LSL, 'H'): _bit3,
+    (LowLevelILOperation.LLIL_RLC, 'C'): _shifted_out_high,
+    (LowLevelILOperation.LLIL_RLC, 'H'): _bit3,
+    (LowLevelILOperation.LLIL_LSR, 'C'): _shifted_out_low,
+    (LowLevelILOperation.LLIL_ASR, 'C'): _shifted_out_low,
+    (LowLevelILOperation.LLIL_RRC, 'C'): _shifted_out_low,
+    (LowLevelILOperation.LLIL_MUL, 'C'): _product_carry,
+}
+for op in (LowLevelILOperation.LLIL_AND, LowLevelILOperation.LLIL_OR,
+           LowLevelILOperation.LLIL_XOR, LowLevelILOperation.LLIL_NOT):
+    FlagIL[(op, 'V')] = _clear
+for op in (LowLevelILOperation.LLIL_LSL, LowLevelILOperation.LLIL_RLC, LowLevelILOperation.LLIL_LSR,
+           LowLevelILOperation.LLIL_ASR, LowLevelILOperation.LLIL_RRC):
+    FlagIL[(op, 'V')] = _shift_overflow
+
+
+def flag_il(arch, op, size, flag, operands, il):
+    ''' Return the expression for one flag written by operation op on operands '''
+    if flag == 'S':
+        # Sign: N xor V, each derived only for this use
+        return il.xor_expr(0, flag_il(arch, op, size, 'N', operands, il), flag_il(arch, op, size, 'V', operands, il))
+    if flag == 'N':
+        return _sign(il, size, _result(il, op, size, operands))
+    if flag == 'Z' and (op, flag) not in FlagIL:
+        return il.compare_equal(size, _result(il, op, size, operands), il.const(size, 0))
+
+    special = FlagIL.get((op, flag))
+    if special is not None:
+        return special(arch, op, size, operands, il)
+    if flag == 'H':
+        return il.unimplemented()
+    return arch.get_default_flag_write_low_level_il(op, size, arch.flag_roles[flag], operands, il)
+
+
+# SREG flags tested by each flag condition
+FlagConditionFlags = {
+    LowLevelILFlagCondition.LLFC_E: ['Z'],
+    LowLevelILFlagCondition.LLFC_NE: ['Z'],
+    LowLevelILFlagCondition.LLFC_SLT: ['S'],
+    LowLevelILFlagCondition.LLFC_SGE: ['S'],
+    LowLevelILFlagCondition.LLFC_ULT: ['C'],
+    LowLevelILFlagCondition.LLFC_UGE: ['C'],
+    LowLevelILFlagCondition.LLFC_SLE: ['S', 'Z'],
+    LowLevelILFlagCondition.LLFC_SGT: ['S', 'Z'],
+    LowLevelILFlagCondition.LLFC_ULE: ['C', 'Z'],
+    LowLevelILFlagCondition.LLFC_UGT: ['C', 'Z'],
+    LowLevelILFlagCondition.LLFC_NEG: ['N'],
+    LowLevelILFlagCondition.LLFC_POS: ['N'],
+    LowLevelILFlagCondition.LLFC_O: ['V'],
+    LowLevelILFlagCondition.LLFC_NO: ['V']
+}
+
+
+def _any_flag(il, flags):
+    expression = il.flag(flags[0])
+    for flag in flags[1:]:
+        expression = il.or_expr(0, expression, il.flag(flag))
+    return expression
+
+
+# Conditions that hold when any of their flags is set; the rest are negations
+SetConditions = [
+    LowLevelILFlagCondition.LLFC_E, LowLevelILFlagCondition.LLFC_SLT, LowLevelILFlagCondition.LLFC_ULT,
+    LowLevelILFlagCondition.LLFC_SLE, LowLevelILFlagCondition.LLFC_ULE, LowLevelILFlagCondition.LLFC_NEG,
+    LowLevelILFlagCondition.LLFC_O
+]
+
+
+def condition_il(cond, il):
+    ''' Flag condition in terms of SREG flags, for when no comparison can be recovered '''
+    expression = _any_flag(il, FlagConditionFlags[cond])
+    if cond in SetConditions:
+        return expression
+    return il.not_expr(0, expression)
@@ -0,0 +1,175 @@
+from __future__ import print_function
+
+import mmap
+import os
+from contextlib import contextmanager
+
+from binaryninja import (
+    BinaryView, Architecture,
+
+    SegmentFlag, SectionSemantics,
+
+    log_error)
+
+from .analysis import (
+    add_signature_functions, add_vector_functions, resolve_indirect_branches, apply_indirect_branches,
+
+    watch_view, mark_data_regions, define_progmem_objects, add_call_target_functions,
+    log_bad_opcodes)
+from .avr.elf import is_avr_elf, read_elf, ElfError
+from .avr.ihex import is_ihex, read_ihex, pack, IntelHexError
+from .avr.memory import FLASH, SRAM, EEPROM, address_space
+
+SegmentFlags = {
+    FLASH: SegmentFlag.SegmentReadable | SegmentFlag.SegmentExecutable | SegmentFlag.SegmentContainsCode,
+    SRAM: SegmentFlag.SegmentReadable | SegmentFlag.SegmentWritable | SegmentFlag.SegmentContainsData,
+    EEPROM: SegmentFlag.SegmentReadable | SegmentFlag.SegmentWritable | SegmentFlag.SegmentContainsData
+}
+
+SectionSemanticsForSpace = {
+    FLASH: SectionSemantics.ReadOnlyCodeSectionSemantics,
+    SRAM: SectionSemantics.ReadWriteDataSectionSemantics,
+    EEPROM: SectionSemantics.ReadWriteDataSectionSemantics
+}
+
+
+@contextmanager
+def file_contents(data):
+    ''' The contents behind a raw view as an mmap of the original file when possible, closed on exit.
+
+    Falls back to the raw view itself, which supports len() and slicing, so
+    callers never copy the whole file. The parsers copy what they keep, so
+    nothing refers to the mapping once they return.
+    '''
+    filename = getattr(data.file, 'original_filename', None) or data.file.filename
+    if not (filename and os.path.isfile(filename) and os.path.getsize(filename) == len(data) > 0):
+        yield data
+        return
+    with open(filename, 'rb') as f:
+        contents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield contents
+    finally:
+        contents.close()
+
+
+class AVRView(BinaryView):
+    ''' Common setup for the AVR loaders: architecture, platform and one section per mapped range '''
+
+    def __init__(self, data, parent_view=None):
+        BinaryView.__init__(self, parent_view=parent_view or data, file_metadata=data.file)
+        self.raw = data
+        self.entry = 0
+        self.section_names = {}
+
+    def setup_arch(self):
+        self.arch = Architecture['AVR']
+        self.platform = self.arch.standalone_platform
+
+    def add_range(self, space, address, length, data_offset, data_length):
+        self.add_auto_segment(address, length, data_offset, data_length, SegmentFlags[space])
+
+        count = self.section_names.get(space, 0)
+        self.section_names[space] = count + 1
+        name = '.' + space if count == 0 else '.{}.{}'.format(space, count)
+        self.add_auto_section(name, address, length, SectionSemanticsForSpace[space])
+
+    def seed_functions(self):
+        ''' Add the entry point, the interrupt handlers and every function found by signature or direct call in one batch '''
+        # Per-view state such as the xref indexes is released with the view
+        watch_view(self)
+
+        self.add_entry_point(self.entry)
+        add_vector_functions(self)
+        # Strings, tables and erased flash become data before any decoding
+        data = mark_data_regions(self)
+        define_progmem_objects(self, data)
+        add_signature_functions(self, data)
+        add_call_target_functions(self, data)
+
+        # Indirect call targets are added with the other functions; jump
+        # targets need the functions containing the jumps, which only exist
+        # once the first analysis pass is done
+        resolved = resolve_indirect_branches(self)
+        self.completion_event = self.add_analysis_completion_event(lambda: self.analysis_completed(resolved))
+
+    def analysis_completed(self, resolved):
+        log_bad_opcodes()
+        if apply_indirect_branches(self, resolved):
+            self.update_analysis()
+
+    def perform_is_executable(self):
+        return True
+
+    def perform_get_entry_point(self):
+        return self.entry
+
+
+class AVRELFView(AVRView):
+    name = 'AVR ELF'
+    long_name = 'AVR ELF (flash, SRAM and EEPROM)'
+
+    @classmethod
+    def is_valid_for_data(cls, data):
+        return is_avr_elf(data.read(0, 20))
+
+    def init(self):
+        try:
+            # Only the headers are read; segments are backed by the file
+            with file_contents(self.raw) as contents:
+                image = read_elf(contents)
+        except ElfError as e:
+            log_error('AVR ELF: {}'.format(e))
+            return False
+
+        self.setup_arch()
+        self.entry = image.entry
+
+        for segment in image.segments:
+            if segment.space is None:
+                continue
+            self.add_range(segment.space, segment.vaddr, segment.memsz, segment.offset, segment.filesz)
+
+            # Initialized data is stored in flash at its load address and
+            # copied to SRAM by the startup code
+            if segment.space == SRAM and segment.filesz and address_space(segment.paddr) == FLASH:
+                self.add_range(FLASH, segment.paddr, segment.filesz, segment.offset, segment.filesz)
+
+        self.seed_functions()
+        return True
+
+
+class AVRHexView(AVRView):
+    name = 'AVR HEX'
+    long_name = 'AVR Intel HEX'
+
+    @classmethod
+    def is_valid_for_data(cls, data):
+        return is_ihex(data.read(0, 16))
+
+    def __init__(self, data):
+        # HEX records have to be decoded, so the view is backed by the packed
+        # segment contents rather than by the text file
+        try:
+            with file_contents(data) as contents:
+                segments = read_ihex(contents)
+        except IntelHexError as e:
+            log_error('AVR HEX: {}'.format(e))
+            segments = []
+        packed, self.layout = pack(segments)
+        del segments
+        AVRView.__init__(self, data, BinaryView.new(bytes(packed)))
+
+    def init(self):
+        if not self.layout:
+            return False
+
+        self.setup_arch()
+
+        for address, offset, length in self.layout:
+            space = address_space(address)
+            if space is not None:
+                self.add_range(space, address, length, offset, length)
+
+        self.seed_functions()
+        return True